@@ -1,17 +1,30 @@
 import streamlit as st
-import requests
-import json
 from modal_config import MODAL_CONFIG, is_mock_enabled, get_mock_response
+from client.llm_client import LLMClientError
+from retrieval.chunking import pack_passages
+from web.chat_support import (
+    CONTEXT_TOKEN_BUDGET,
+    format_passages,
+    get_prober,
+    get_router,
+    load_documents_simple,
+    show_backend_status,
+    simple_context_search,
+    warm_up_once,
+)
+import hashlib
 import os
 
-# Try to import LlamaIndex components, but handle gracefully if they fail
+# Try to import the vector store, but handle gracefully if it fails
 try:
-    from llama_index.core import SimpleDirectoryReader, VectorStoreIndex, Settings
-    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-    LLAMAINDEX_AVAILABLE = True
+    from retrieval.vector_store import PersistentVectorIndex
+    VECTOR_STORE_AVAILABLE = True
 except ImportError as e:
-    st.warning(f"LlamaIndex components not fully available: {e}")
-    LLAMAINDEX_AVAILABLE = False
+    st.warning(f"Vector store not available: {e}")
+    VECTOR_STORE_AVAILABLE = False
+
+# Where embeddings are kept between restarts
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", ".vector_index")
 
 def call_modal_llm(prompt, max_tokens=512, temperature=0.7):
     """Call the LLM deployed on Modal"""
@@ -21,20 +34,10 @@ def call_modal_llm(prompt, max_tokens=512, temperature=0.7):
         return get_mock_response(prompt)
     
     try:
-        response = requests.post(
-            MODAL_CONFIG['app_url'],  # Remove /generate path - Modal endpoint is at root
-            json={
-                "prompt": prompt,
-                "max_tokens": max_tokens,
-                "temperature": temperature
-            },
-            timeout=30
-        )
-        response.raise_for_status()
-        return response.json()["response"]
-    except requests.exceptions.RequestException as e:
+        return get_router().generate(prompt, max_tokens=max_tokens, temperature=temperature)
+    except LLMClientError as e:
         # If Modal request fails, provide helpful error message
-        if "405" in str(e) or "Method Not Allowed" in str(e):
+        if e.status == 405:
             return f"""❌ **Modal Deployment Error**: The URL `{MODAL_CONFIG['app_url']}` is not valid.
 
 **To fix this:**
@@ -48,31 +51,26 @@ def call_modal_llm(prompt, max_tokens=512, temperature=0.7):
             st.error(f"Error calling Modal LLM: {e}")
             return None
 
-def load_documents(directory_path):
-    """Load documents from a directory using LlamaIndex"""
-    if not LLAMAINDEX_AVAILABLE:
-        st.error("LlamaIndex not available for document processing")
+@st.cache_resource
+def get_vector_index(directory_path):
+    """One persisted collection per documents directory, opened once per app process"""
+    key = hashlib.sha256(os.path.abspath(directory_path).encode()).hexdigest()[:16]
+    return PersistentVectorIndex(VECTOR_INDEX_DIR, collection_name=f"kb_{key}")
+
+def create_index(directory_path):
+    """Open the persisted vector index, embedding only new or changed documents"""
+    if not VECTOR_STORE_AVAILABLE:
+        st.error("Vector store not available for indexing")
         return None
         
     if not os.path.exists(directory_path):
         return None
     
     try:
-        documents = SimpleDirectoryReader(directory_path).load_data()
-        return documents
-    except Exception as e:
-        st.error(f"Error loading documents: {e}")
-        return None
-
-def create_index(documents):
-    """Create a vector index from documents"""
-    if not LLAMAINDEX_AVAILABLE:
-        st.error("LlamaIndex not available for indexing")
-        return None
-        
-    try:
-        # Try with default embedding first
-        index = VectorStoreIndex.from_documents(documents)
+        index = get_vector_index(directory_path)
+        report = index.sync(directory_path)
+        if report.embedded or report.removed:
+            st.info(f"Embedded {len(report.embedded)} new or changed documents, removed {len(report.removed)}")
         return index
     except Exception as e:
         st.error(f"Error creating index: {e}")
@@ -80,18 +78,12 @@ def create_index(documents):
 
 def query_with_context(index, query, llm_response_func):
     """Query the index and get context for the LLM"""
-    if not LLAMAINDEX_AVAILABLE or index is None:
+    if not VECTOR_STORE_AVAILABLE or index is None:
         return llm_response_func(query)
         
     try:
-        query_engine = index.as_query_engine(
-            response_mode="compact",
-            similarity_top_k=3
-        )
-        
         # Get relevant context
-        context_response = query_engine.query(query)
-        context = str(context_response)
+        context = format_passages(pack_passages(index.search(query, k=10), CONTEXT_TOKEN_BUDGET))
         
         # Create enhanced prompt with context for mental health support
         enhanced_prompt = f"""You are a knowledgeable mental health customer service assistant. Use the following context to provide helpful, empathetic, and professional responses.
@@ -108,51 +100,6 @@ Please provide a compassionate and informative response based on the context. If
         st.error(f"Error querying with context: {e}")
         return llm_response_func(query)
 
-def load_documents_simple(directory_path):
-    """Simple document loading without LlamaIndex"""
-    if not os.path.exists(directory_path):
-        return None
-    
-    documents = []
-    try:
-        for filename in os.listdir(directory_path):
-            if filename.endswith(('.txt', '.md')):
-                filepath = os.path.join(directory_path, filename)
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    documents.append({
-                        'filename': filename,
-                        'content': content
-                    })
-        return documents
-    except Exception as e:
-        st.error(f"Error loading documents: {e}")
-        return None
-
-def simple_context_search(documents, query):
-    """Simple keyword-based context search"""
-    if not documents:
-        return ""
-    
-    query_words = query.lower().split()
-    relevant_docs = []
-    
-    for doc in documents:
-        content_lower = doc['content'].lower()
-        score = sum(1 for word in query_words if word in content_lower)
-        if score > 0:
-            relevant_docs.append((doc, score))
-    
-    # Sort by relevance score
-    relevant_docs.sort(key=lambda x: x[1], reverse=True)
-    
-    # Take top 2 most relevant documents
-    context_parts = []
-    for doc, score in relevant_docs[:2]:
-        context_parts.append(f"From {doc['filename']}:\n{doc['content'][:500]}...")
-    
-    return "\n\n".join(context_parts)
-
 def get_sample_questions():
     """Get sample mental health customer service questions"""
     return [
@@ -169,6 +116,8 @@ def get_sample_questions():
     ]
 
 def main():
+    warm_up_once()
+
     st.title("🧠💙 HarborSoul Chat Companion")
     st.markdown("AI-powered support for mental health customer service representatives")
     
@@ -206,27 +155,24 @@ def main():
             
             if st.button("Load Knowledge Base"):
                 with st.spinner("Loading mental health documentation..."):
-                    if LLAMAINDEX_AVAILABLE:
-                        documents = load_documents(doc_directory)
-                        if documents:
-                            st.session_state.documents = documents
-                            st.session_state.index = create_index(documents)
-                            if st.session_state.index:
-                                st.success(f"✅ Loaded {len(documents)} documents with AI indexing!")
-                                st.session_state.use_simple_search = False
-                            else:
-                                st.warning("AI indexing failed, using keyword search")
-                                st.session_state.simple_documents = load_documents_simple(doc_directory)
-                                st.session_state.use_simple_search = True
-                                if st.session_state.simple_documents:
-                                    st.success(f"✅ Loaded {len(st.session_state.simple_documents)} documents with keyword search!")
+                    if VECTOR_STORE_AVAILABLE:
+                        st.session_state.index = create_index(doc_directory)
+                        if st.session_state.index:
+                            st.success(f"✅ Loaded {len(st.session_state.index)} documents with AI indexing!")
+                            st.session_state.use_simple_search = False
                         else:
-                            st.error("❌ Failed to load documents")
+                            st.warning("AI indexing failed, using keyword search")
+                            st.session_state.simple_documents = load_documents_simple(doc_directory)
+                            st.session_state.use_simple_search = True
+                            if st.session_state.simple_documents:
+                                st.success(f"✅ Loaded {len(st.session_state.simple_documents.manifest)} documents ({len(st.session_state.simple_documents)} passages) with keyword search!")
+                            else:
+                                st.error("❌ Failed to load documents")
                     else:
                         st.session_state.simple_documents = load_documents_simple(doc_directory)
                         st.session_state.use_simple_search = True
                         if st.session_state.simple_documents:
-                            st.success(f"✅ Loaded {len(st.session_state.simple_documents)} documents with keyword search!")
+                            st.success(f"✅ Loaded {len(st.session_state.simple_documents.manifest)} documents ({len(st.session_state.simple_documents)} passages) with keyword search!")
                         else:
                             st.error("❌ Failed to load documents")
         
@@ -239,11 +185,14 @@ def main():
         st.subheader("🔗 AI Connection")
         if st.button("Test AI Connection"):
             with st.spinner("Testing connection..."):
-                test_response = call_modal_llm("Hello", max_tokens=10, temperature=0.1)
-                if test_response:
+                statuses = [b["status"] for b in get_prober().probe_all()]
+                if "ready" in statuses:
                     st.success("✅ AI is connected and ready")
+                elif "loading" in statuses:
+                    st.warning("⏳ AI is starting up")
                 else:
                     st.error("❌ AI connection failed")
+        show_backend_status()
         
         # Quick actions
         st.subheader("🚀 Quick Actions")
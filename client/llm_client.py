@@ -0,0 +1,173 @@
+"""
+Pooled, retrying HTTP client for the deployed LLM endpoints
+"""
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Status codes worth retrying: throttling, and gateways that gave up on a cold
+# or overloaded container
+RETRYABLE_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class LLMClientError(Exception):
+    """A request failed for good: retries are used up or the error is not retryable."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class ClientConfig:
+    """Timeouts, retries and hedging for :class:`LLMClient`"""
+    # Seconds to establish a connection, and to wait for the response after it
+    connect_timeout: float = 5.0
+    read_timeout: float = 30.0
+    # Retries after the first attempt, with full-jitter exponential backoff:
+    # a random wait up to min(backoff_max, backoff_base * 2 ** attempt)
+    max_retries: int = 3
+    backoff_base: float = 0.5
+    backoff_max: float = 8.0
+    # Hedging: when the first attempt has not answered after the
+    # hedge_percentile latency of recent requests (or hedge_after seconds until
+    # hedge_min_samples are seen), send a second one and take whichever answers
+    # first
+    hedge: bool = False
+    hedge_percentile: float = 95.0
+    hedge_after: float = 10.0
+    hedge_min_samples: int = 20
+    # Connections kept alive per host
+    pool_size: int = 10
+
+    @classmethod
+    def from_dict(cls, settings: Dict[str, Any]) -> "ClientConfig":
+        """Build from a settings dict such as ``MODAL_CONFIG``; unknown keys are ignored."""
+        values = {k: settings[k] for k in cls.__dataclass_fields__ if k in settings}
+        # MODAL_CONFIG has always called the read timeout just "timeout"
+        if "read_timeout" not in values and "timeout" in settings:
+            values["read_timeout"] = settings["timeout"]
+        return cls(**values)
+
+
+class LLMClient:
+    """
+    Posts JSON to an LLM endpoint over a keep-alive connection pool.
+
+    Connection errors, timeouts and the statuses in ``RETRYABLE_STATUSES`` are
+    retried with jittered exponential backoff, honouring ``Retry-After``. With
+    hedging on, a request slower than the recent latency percentile gets a
+    duplicate sent alongside it; the first answer wins. The client is
+    thread-safe and meant to be shared.
+    """
+
+    def __init__(self, config: Optional[ClientConfig] = None, session: Optional[requests.Session] = None):
+        self.config = config or ClientConfig()
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.config.pool_size, pool_maxsize=self.config.pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.retries = 0
+        self.hedges = 0
+        self._latencies: Deque[float] = deque(maxlen=200)
+        self._lock = threading.Lock()
+        self._hedge_pool = ThreadPoolExecutor(max_workers=2 * self.config.pool_size, thread_name_prefix="llm-hedge")
+
+    def post_json(self, url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POST ``payload`` and return the decoded JSON response."""
+        if not self.config.hedge:
+            return self._post_with_retries(url, payload)
+        first = self._hedge_pool.submit(self._post_with_retries, url, payload)
+        done, _ = wait([first], timeout=self.hedge_delay())
+        if done:
+            return first.result()
+        with self._lock:
+            self.hedges += 1
+        second = self._hedge_pool.submit(self._post_with_retries, url, payload)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def get_json(self, url: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """GET ``url`` once, without retries, e.g. for health checks."""
+        try:
+            response = self.session.get(
+                url, timeout=(self.config.connect_timeout, timeout or self.config.read_timeout)
+            )
+        except requests.RequestException as e:
+            raise LLMClientError(f"GET {url} failed: {e}") from e
+        if response.status_code >= 400:
+            raise LLMClientError(f"GET {url} returned HTTP {response.status_code}", response.status_code)
+        return _json(response)
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait for the first attempt before sending a hedge."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.config.hedge_min_samples:
+            return self.config.hedge_after
+        rank = min(len(latencies) - 1, int(len(latencies) * self.config.hedge_percentile / 100))
+        return latencies[rank]
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to sleep before retry number ``attempt`` (0-based)."""
+        delay = random.uniform(0, min(self.config.backoff_max, self.config.backoff_base * 2 ** attempt))
+        return max(delay, retry_after or 0.0)
+
+    def _post_with_retries(self, url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            retry_after = None
+            try:
+                response = self.session.post(
+                    url, json=payload, timeout=(self.config.connect_timeout, self.config.read_timeout)
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = LLMClientError(f"POST {url} failed: {e}")
+            else:
+                if response.status_code < 400:
+                    with self._lock:
+                        self._latencies.append(time.perf_counter() - started)
+                    return _json(response)
+                error = LLMClientError(f"POST {url} returned HTTP {response.status_code}", response.status_code)
+                if response.status_code not in RETRYABLE_STATUSES:
+                    raise error
+                retry_after = _retry_after(response)
+            if attempt >= self.config.max_retries:
+                raise error
+            with self._lock:
+                self.retries += 1
+            time.sleep(self.backoff(attempt, retry_after))
+            attempt += 1
+
+    def close(self) -> None:
+        self._hedge_pool.shutdown(wait=False)
+        self.session.close()
+
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    try:
+        return float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        return None
+
+
+def _json(response: requests.Response) -> Dict[str, Any]:
+    try:
+        return response.json()
+    except ValueError as e:
+        raise LLMClientError(f"{response.url} returned invalid JSON: {e}", response.status_code) from e
@@ -0,0 +1,143 @@
+"""
+Background health probing and cold-start warm-up of the LLM backends
+"""
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from client.llm_client import LLMClient, LLMClientError
+from config.endpoints import Endpoint
+
+# Health statuses: "ready" (model loaded), "loading" (container up, model not
+# yet), "failed" (the model failed to load), "down" (no usable answer) and
+# "unknown" (not probed yet)
+STATUSES = ("ready", "loading", "failed", "down", "unknown")
+
+
+@dataclass
+class BackendHealth:
+    endpoint: Endpoint
+    status: str = "unknown"
+    # Seconds the last probe took; for a cold container this includes its start
+    latency: Optional[float] = None
+    checked_at: Optional[float] = None
+    error: Optional[str] = None
+    checking: bool = False
+
+
+class HealthProber:
+    """
+    Probes every backend's health URL, in the background.
+
+    Health checks never run generation, but a GET to a Modal app starts a
+    scaled-to-zero container and resets the idle timer of a running one, so
+    every probe keeps the GPU up. :meth:`warm` probes right away without
+    blocking the caller, so a cold start overlaps with the user typing their
+    first question. The :meth:`start` loop polls only while a session has
+    been seen (:meth:`touch`) within the last ``idle_after`` seconds; once
+    the last one goes quiet the backends are left alone to scale to zero.
+    At most one probe per backend is in flight at a time.
+    """
+
+    def __init__(self, endpoints: List[Endpoint], client: LLMClient, interval: float = 60.0,
+                 timeout: float = 300.0, idle_after: float = 300.0, clock: Callable[[], float] = time.time):
+        self.backends = {e.name: BackendHealth(e) for e in endpoints}
+        self.client = client
+        self.interval = interval
+        # Long enough to wait out a cold start
+        self.timeout = timeout
+        self.idle_after = idle_after
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, len(endpoints)), thread_name_prefix="llm-probe")
+        self._futures: Dict[str, Future] = {}
+        # Session key -> clock time it was last seen
+        self._sessions: Dict[str, float] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def touch(self, session: str) -> None:
+        """Note that ``session`` is in use, keeping background polling on for ``idle_after`` seconds."""
+        with self._lock:
+            self._sessions[session] = self.clock()
+
+    def active_sessions(self) -> int:
+        """Sessions seen within ``idle_after`` seconds; quieter ones are forgotten."""
+        now = self.clock()
+        with self._lock:
+            # Streamlit does not report closed sessions, so a quiet one counts as closed
+            self._sessions = {k: seen for k, seen in self._sessions.items() if now - seen < self.idle_after}
+            return len(self._sessions)
+
+    def start(self) -> None:
+        """Probe every ``interval`` seconds while a session is active, until :meth:`stop`."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="llm-prober", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            if self.active_sessions():
+                self.warm()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._pool.shutdown(wait=False)
+
+    def warm(self) -> List[Future]:
+        """Probe every backend in the background; returns immediately."""
+        with self._lock:
+            for name, backend in self.backends.items():
+                if not backend.checking:
+                    backend.checking = True
+                    self._futures[name] = self._pool.submit(self._probe, name)
+            return list(self._futures.values())
+
+    def probe_all(self) -> List[Dict[str, Any]]:
+        """Probe every backend, joining probes already in flight, and return :meth:`status`."""
+        for future in self.warm():
+            future.result()
+        return self.status()
+
+    def _probe(self, name: str) -> None:
+        endpoint = self.backends[name].endpoint
+        started = time.perf_counter()
+        error = None
+        try:
+            status = self.client.get_json(endpoint.health_url, timeout=self.timeout).get("status", "ready")
+        except LLMClientError as e:
+            # server/serve.py answers /readyz with 503 until its model is loaded
+            status = "loading" if e.status == 503 else "down"
+            error = str(e)
+        except Exception as e:
+            status, error = "down", str(e)
+        if status not in STATUSES:
+            # Older deployments answer {"status": "healthy"}
+            status = "ready"
+        with self._lock:
+            backend = self.backends[name]
+            backend.status = status
+            backend.latency = time.perf_counter() - started
+            backend.checked_at = self.clock()
+            backend.error = error
+            backend.checking = False
+
+    def status(self) -> List[Dict[str, Any]]:
+        """Per-backend health as JSON-friendly dicts."""
+        with self._lock:
+            return [
+                {
+                    "name": b.endpoint.name,
+                    "url": b.endpoint.url,
+                    "status": b.status,
+                    "latency_ms": 1000 * b.latency if b.latency is not None else None,
+                    "checked_at": b.checked_at,
+                    "error": b.error,
+                    "checking": b.checking,
+                }
+                for b in self.backends.values()
+            ]
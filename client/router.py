@@ -0,0 +1,162 @@
+"""
+Latency-aware routing with failover across several LLM backends
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from client.llm_client import LLMClient, LLMClientError
+from config.endpoints import Endpoint
+
+
+@dataclass
+class _Backend:
+    endpoint: Endpoint
+    # Exponentially weighted moving average of successful request latency
+    ewma: Optional[float] = None
+    consecutive_failures: int = 0
+    # When the circuit opened; None while it is closed
+    opened_at: Optional[float] = None
+    # A half-open circuit lets one trial request through
+    trial_in_flight: bool = False
+    requests: int = 0
+    failures: int = 0
+
+
+class EndpointRouter:
+    """
+    Sends each request to the backend with the lowest recent latency and fails
+    over to the next one when it errors.
+
+    Latency is tracked per backend as an EWMA (weight ``alpha`` on the newest
+    sample) and divided by the backend's weight; backends with no samples yet
+    are tried first. After ``failure_threshold`` consecutive failures a
+    backend's circuit opens and it gets no traffic for ``cooldown`` seconds,
+    then a single trial request decides whether it closes again. If every
+    circuit is open, the backend that opened longest ago is tried anyway.
+
+    A request makes at most ``max_attempts`` attempts, each on a backend not yet
+    tried for it when there is one. Retrying happens here, across backends, so
+    the ``client`` should be configured without retries of its own.
+    """
+
+    def __init__(self, endpoints: List[Endpoint], client: LLMClient, max_attempts: int = 3,
+                 alpha: float = 0.3, failure_threshold: int = 3, cooldown: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        if not endpoints:
+            raise ValueError("EndpointRouter needs at least one endpoint")
+        self.backends = {e.name: _Backend(e) for e in endpoints}
+        self.client = client
+        self.max_attempts = max(1, max_attempts)
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self._lock = threading.Lock()
+
+    def choose(self, exclude=()) -> Endpoint:
+        """Pick the backend for the next attempt, skipping ``exclude`` if possible."""
+        with self._lock:
+            now = self.clock()
+            candidates = [b for b in self.backends.values() if b.endpoint.name not in exclude] or list(
+                self.backends.values()
+            )
+            available = [b for b in candidates if self._available(b, now)]
+            if not available:
+                backend = min(candidates, key=lambda b: b.opened_at)
+            else:
+                backend = min(available, key=lambda b: (
+                    b.ewma is not None, (b.ewma or 0.0) / b.endpoint.weight, -b.endpoint.weight
+                ))
+            if backend.opened_at is not None:
+                backend.trial_in_flight = True
+            return backend.endpoint
+
+    def _available(self, backend: _Backend, now: float) -> bool:
+        if backend.opened_at is None:
+            return True
+        return now - backend.opened_at >= self.cooldown and not backend.trial_in_flight
+
+    def record_success(self, name: str, latency: float) -> None:
+        with self._lock:
+            backend = self.backends[name]
+            backend.requests += 1
+            backend.ewma = latency if backend.ewma is None else self.alpha * latency + (1 - self.alpha) * backend.ewma
+            backend.consecutive_failures = 0
+            backend.opened_at = None
+            backend.trial_in_flight = False
+
+    def record_failure(self, name: str) -> None:
+        with self._lock:
+            backend = self.backends[name]
+            backend.requests += 1
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            if backend.trial_in_flight or backend.consecutive_failures >= self.failure_threshold:
+                backend.opened_at = self.clock()
+            backend.trial_in_flight = False
+
+    def generate(self, prompt: str, max_tokens: int = 512, temperature: float = 0.7) -> str:
+        """Generate a reply to ``prompt`` on the best available backend."""
+        tried = set()
+        error: Optional[Exception] = None
+        for attempt in range(self.max_attempts):
+            endpoint = self.choose(exclude=tried)
+            if endpoint.name in tried:
+                # Every backend has been tried; back off before trying one again
+                time.sleep(self.client.backoff(attempt - 1))
+            tried.add(endpoint.name)
+            started = time.perf_counter()
+            try:
+                text = _parse(endpoint, self.client.post_json(
+                    endpoint.generate_url, _payload(endpoint, prompt, max_tokens, temperature)
+                ))
+            except LLMClientError as e:
+                print(f"LLM backend {endpoint.name} failed: {e}")
+                self.record_failure(endpoint.name)
+                error = e
+                continue
+            self.record_success(endpoint.name, time.perf_counter() - started)
+            return text
+        raise error
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per-backend latency and circuit state, as JSON-friendly dicts."""
+        with self._lock:
+            now = self.clock()
+            return [
+                {
+                    "name": b.endpoint.name,
+                    "url": b.endpoint.url,
+                    "ewma_ms": 1000 * b.ewma if b.ewma is not None else None,
+                    "circuit": "closed" if b.opened_at is None else (
+                        "half-open" if now - b.opened_at >= self.cooldown else "open"
+                    ),
+                    "requests": b.requests,
+                    "failures": b.failures,
+                }
+                for b in self.backends.values()
+            ]
+
+
+def _payload(endpoint: Endpoint, prompt: str, max_tokens: int, temperature: float) -> Dict[str, Any]:
+    if endpoint.kind == "server":
+        return {
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+        }
+    return {"prompt": prompt, "max_tokens": max_tokens, "temperature": temperature}
+
+
+def _parse(endpoint: Endpoint, result: Dict[str, Any]) -> str:
+    try:
+        if endpoint.kind == "server":
+            return result["choices"][0]["message"]["content"]
+        if "error" in result:
+            # The Modal app reports generation failures in a 200 response
+            raise LLMClientError(f"{endpoint.name}: {result['error']}")
+        return result["response"]
+    except (KeyError, IndexError, TypeError) as e:
+        raise LLMClientError(f"Unexpected response format from {endpoint.name}: {e}") from e
@@ -0,0 +1,57 @@
+"""
+LLM backends the chat apps can send requests to
+"""
+import json
+import os
+from dataclasses import dataclass
+from typing import List, Optional
+
+# The Modal app (serve/serve_llm.py) serves generation at the root of its URL
+DEFAULT_MODAL_APP_URL = "https://ey10923--qwen-chat.modal.run"
+
+# Request formats: "modal" posts {"prompt", "max_tokens", "temperature"} to the
+# URL itself; "server" uses the OpenAI-compatible /v1/chat/completions of
+# server/serve.py
+KINDS = ("modal", "server")
+
+
+@dataclass
+class Endpoint:
+    """One backend, with its share of traffic relative to the others"""
+    name: str
+    url: str
+    kind: str = "modal"
+    weight: float = 1.0
+
+    def __post_init__(self):
+        if self.kind not in KINDS:
+            raise ValueError(f"Unknown endpoint kind {self.kind!r}; expected one of {', '.join(KINDS)}")
+        if self.weight <= 0:
+            raise ValueError(f"Endpoint {self.name} needs a positive weight")
+        self.url = self.url.rstrip("/")
+
+    @property
+    def generate_url(self) -> str:
+        if self.kind == "server":
+            return f"{self.url}/v1/chat/completions"
+        return self.url
+
+    @property
+    def health_url(self) -> str:
+        return f"{self.url}/readyz" if self.kind == "server" else f"{self.url}/health"
+
+
+def load_endpoints(spec: Optional[str] = None) -> List[Endpoint]:
+    """
+    Backends from ``LLM_ENDPOINTS``, a JSON list of {"name", "url", "kind",
+    "weight"} objects. Without it: the Modal app at ``MODAL_APP_URL``, plus a
+    local server/serve.py at ``LOCAL_LLM_URL`` if that is set.
+    """
+    spec = spec if spec is not None else os.getenv("LLM_ENDPOINTS", "")
+    if spec:
+        return [Endpoint(**entry) for entry in json.loads(spec)]
+    endpoints = [Endpoint("modal", os.getenv("MODAL_APP_URL", DEFAULT_MODAL_APP_URL))]
+    local_url = os.getenv("LOCAL_LLM_URL", "")
+    if local_url:
+        endpoints.append(Endpoint("local", local_url, kind="server"))
+    return endpoints
@@ -4,15 +4,17 @@ Modal Configuration Settings
 import os
 from typing import Optional
 
+from config.endpoints import DEFAULT_MODAL_APP_URL
+
 class ModalConfig:
     """Configuration class for Modal app settings"""
     
-    # Default Modal app URL - replace with your actual deployment URL
-    DEFAULT_MODAL_APP_URL = "https://modal.com/apps/ey10923/main/ap-MpAQH9mDyzSiBsYhOuL19T"
+    # Default Modal app URL, shared with modal_config.py (see config/endpoints.py)
+    DEFAULT_MODAL_APP_URL = DEFAULT_MODAL_APP_URL
     
-    # API endpoints
-    GENERATE_ENDPOINT = "/generate"
-    HEALTH_ENDPOINT = "/"
+    # API endpoints: serve/serve_llm.py generates at the root of the app URL
+    GENERATE_ENDPOINT = ""
+    HEALTH_ENDPOINT = "/health"
     
     # Request settings
     DEFAULT_TIMEOUT = 30
@@ -3,14 +3,33 @@
 
 import os
 
+from config.endpoints import DEFAULT_MODAL_APP_URL, load_endpoints
+
 MODAL_CONFIG = {
     # Your Modal app ID: ap-MpAQH9mDyzSiBsYhOuL19T
     # Dashboard URL: https://modal.com/apps/ey10923/main/ap-MpAQH9mDyzSiBsYhOuL19T
     # 
     # ACTUAL DEPLOYED ENDPOINT URL:
-    "app_url": os.getenv("MODAL_APP_URL", "https://ey10923--qwen-chat.modal.run"),
+    "app_url": os.getenv("MODAL_APP_URL", DEFAULT_MODAL_APP_URL),
+    # Every backend requests are routed between (see config/endpoints.py):
+    # this Modal app, a local server/serve.py at LOCAL_LLM_URL, or the
+    # weighted list in LLM_ENDPOINTS
+    "endpoints": load_endpoints(),
+    # Seconds to wait for a response, and to open a connection
     "timeout": 30,
-    "max_retries": 3
+    "connect_timeout": 5,
+    # Retries on connection errors, timeouts and 429/5xx, with jittered
+    # backoff; each retry goes to another backend when there is one
+    "max_retries": 3,
+    # Send a second request when the first is slower than the recent p95
+    "hedge": os.getenv("MODAL_HEDGE", "").lower() in ("1", "true", "yes"),
+    # Seconds between background health checks, and how long one may take
+    # (a check that finds the app scaled to zero waits for its cold start)
+    "health_interval": 60,
+    "health_timeout": 300,
+    # Checks stop once no session has been used for this long, so the app can
+    # scale to zero; each check resets its container_idle_timeout
+    "health_idle_after": 300,
 }
 
 # Mock server configuration for testing (when Modal is not available)
@@ -0,0 +1,165 @@
+"""
+Inverted index with BM25 ranking for keyword search over the knowledge base
+"""
+import heapq
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from retrieval.chunking import chunk_documents
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Bumped whenever the on-disk layout changes; older files are rebuilt
+FORMAT_VERSION = 2
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens; "start" never matches a query for "art"."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Documents (dicts with a ``content`` key) and a term -> postings map.
+
+    A query only touches the postings of its own terms, so its cost grows with
+    how many documents contain those terms rather than with the size of the
+    corpus. Iterating the index, or taking its ``len``, goes over the
+    documents as they were added.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.documents: List[Dict[str, Any]] = []
+        # term -> [(document number, term frequency), ...]
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.lengths: List[int] = []
+        self.total_length = 0
+        # Source files the documents were read from, with (size, mtime_ns),
+        # and the chunking settings that split them into passages
+        self.manifest: Dict[str, List[int]] = {}
+        self.chunking: Dict[str, int] = {}
+
+    @classmethod
+    def from_documents(cls, documents: Sequence[Dict[str, Any]], **kwargs) -> "BM25Index":
+        index = cls(**kwargs)
+        for document in documents:
+            index.add(document)
+        return index
+
+    def add(self, document: Dict[str, Any]) -> None:
+        doc_id = len(self.documents)
+        terms = Counter(tokenize(document["content"]))
+        for term, count in terms.items():
+            self.postings.setdefault(term, []).append((doc_id, count))
+        length = sum(terms.values())
+        self.documents.append(document)
+        self.lengths.append(length)
+        self.total_length += length
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.documents)
+
+    def idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.documents) - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[float, Dict[str, Any]]]:
+        """The ``k`` best (score, document) pairs for ``query``, best first."""
+        if not self.documents:
+            return []
+        average = self.total_length / len(self.documents) or 1.0
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for doc_id, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / average)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [(score, self.documents[doc_id]) for doc_id, score in best]
+
+    def save(self, path: str) -> None:
+        """Write the index as JSON, atomically."""
+        state = {
+            "version": FORMAT_VERSION,
+            "k1": self.k1,
+            "b": self.b,
+            "documents": self.documents,
+            "postings": self.postings,
+            "lengths": self.lengths,
+            "manifest": self.manifest,
+            "chunking": self.chunking,
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path} holds index format {state.get('version')}, expected {FORMAT_VERSION}")
+        index = cls(k1=state["k1"], b=state["b"])
+        index.documents = state["documents"]
+        index.postings = {term: [tuple(p) for p in postings] for term, postings in state["postings"].items()}
+        index.lengths = state["lengths"]
+        index.total_length = sum(index.lengths)
+        index.manifest = state["manifest"]
+        index.chunking = state["chunking"]
+        return index
+
+
+def scan_directory(directory: str, extensions: Tuple[str, ...] = (".txt", ".md")) -> Dict[str, List[int]]:
+    """(size, mtime_ns) of each indexable file in ``directory``, by filename."""
+    manifest = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(extensions):
+            stat = os.stat(os.path.join(directory, filename))
+            manifest[filename] = [stat.st_size, stat.st_mtime_ns]
+    return manifest
+
+
+def index_directory(directory: str, index_path: Optional[str] = None,
+                    extensions: Tuple[str, ...] = (".txt", ".md"), target_tokens: int = 200,
+                    overlap_tokens: int = 40) -> BM25Index:
+    """
+    Index the text files in ``directory`` as passages of about
+    ``target_tokens`` (see :func:`retrieval.chunking.chunk_text`), each a
+    ``{"filename", "chunk", "heading", "content", "tokens"}`` dict.
+
+    With ``index_path``, a saved index is reused as long as no file was added,
+    removed or changed and the chunking settings are the same; otherwise the
+    index is rebuilt and saved there.
+    """
+    manifest = scan_directory(directory, extensions)
+    chunking = {"target_tokens": target_tokens, "overlap_tokens": overlap_tokens}
+    if index_path and os.path.exists(index_path):
+        try:
+            index = BM25Index.load(index_path)
+            if index.manifest == manifest and index.chunking == chunking:
+                return index
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Rebuilding keyword index, could not reuse {index_path}: {e}")
+    documents = []
+    for filename in manifest:
+        with open(os.path.join(directory, filename), "r", encoding="utf-8") as f:
+            documents.append({"filename": filename, "content": f.read()})
+    index = BM25Index.from_documents(chunk_documents(documents, target_tokens, overlap_tokens))
+    index.manifest = manifest
+    index.chunking = chunking
+    if index_path:
+        index.save(index_path)
+    return index
@@ -0,0 +1,132 @@
+"""
+Split documents into overlapping, heading-aware passages for retrieval
+"""
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Sentence ends: terminal punctuation followed by whitespace and something that
+# can start a sentence
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[A-Z0-9])")
+MARKDOWN_HEADING = re.compile(r"^#{1,6}\s+(.+?)\s*#*$")
+# "OVERVIEW", "1. ACTIVE LISTENING", "CORE PRINCIPLES OF MENTAL HEALTH SUPPORT"
+CAPS_HEADING = re.compile(r"^(?:\d+[.)]\s+)?[A-Z][A-Z0-9 &/,'()-]{2,80}:?$")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for English text (about four characters per token)."""
+    return max(1, (len(text) + 3) // 4)
+
+
+def heading_of(line: str) -> Optional[str]:
+    """The heading text if ``line`` is a Markdown or all-caps heading."""
+    match = MARKDOWN_HEADING.match(line)
+    if match:
+        return match.group(1)
+    if CAPS_HEADING.match(line) and any(c.isalpha() for c in line):
+        return line.rstrip(":")
+    return None
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s for s in SENTENCE_END.split(text) if s]
+
+
+def _sections(text: str) -> Iterable[Tuple[Optional[str], List[str]]]:
+    """(heading, units) per section; a unit is a sentence or a list item."""
+    heading, units = None, []
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        title = heading_of(line)
+        if title is not None:
+            if units:
+                yield heading, units
+            heading, units = title, []
+        else:
+            units.extend(split_sentences(line))
+    if units:
+        yield heading, units
+
+
+def _split_long(unit: str, max_tokens: int) -> List[str]:
+    """Break a unit longer than ``max_tokens`` at word boundaries."""
+    pieces, words = [], []
+    for word in unit.split():
+        if words and estimate_tokens(" ".join(words + [word])) > max_tokens:
+            pieces.append(" ".join(words))
+            words = []
+        words.append(word)
+    if words:
+        pieces.append(" ".join(words))
+    return pieces
+
+
+def chunk_text(text: str, target_tokens: int = 200, overlap_tokens: int = 40) -> List[Dict[str, Any]]:
+    """
+    Passages of about ``target_tokens`` that never cross a heading and only
+    break between sentences or list items. Consecutive passages in a section
+    share up to ``overlap_tokens`` of trailing sentences, so a span that
+    straddles a break is still whole in one of them. Each passage's content
+    starts with its section heading.
+    """
+    if overlap_tokens >= target_tokens:
+        raise ValueError("overlap_tokens must be smaller than target_tokens")
+    passages = []
+    for heading, units in _sections(text):
+        prefix = f"{heading}\n" if heading else ""
+        budget = max(1, target_tokens - estimate_tokens(prefix)) if prefix else target_tokens
+        units = [piece for unit in units for piece in _split_long(unit, max(1, budget - 1))]
+        current: List[str] = []
+        size = 0
+        for unit in units:
+            # Count the joining space so passages stay within the target
+            tokens = estimate_tokens(" " + unit)
+            if current and size + tokens > budget:
+                passages.append(_passage(prefix, heading, current))
+                # Carry trailing units into the next passage as overlap
+                carried: List[str] = []
+                carried_size = 0
+                for previous in reversed(current[1:]):
+                    previous_tokens = estimate_tokens(" " + previous)
+                    if carried_size + previous_tokens > min(overlap_tokens, budget - tokens):
+                        break
+                    carried.insert(0, previous)
+                    carried_size += previous_tokens
+                current, size = carried, carried_size
+            current.append(unit)
+            size += tokens
+        if current:
+            passages.append(_passage(prefix, heading, current))
+    return passages
+
+
+def _passage(prefix: str, heading: Optional[str], units: List[str]) -> Dict[str, Any]:
+    content = prefix + " ".join(units)
+    return {"content": content, "heading": heading, "tokens": estimate_tokens(content)}
+
+
+def chunk_documents(documents: Sequence[Dict[str, Any]], target_tokens: int = 200,
+                    overlap_tokens: int = 40) -> List[Dict[str, Any]]:
+    """Chunk ``{"filename", "content"}`` documents; passages keep the filename and their position."""
+    passages = []
+    for document in documents:
+        for number, passage in enumerate(chunk_text(document["content"], target_tokens, overlap_tokens)):
+            passages.append({"filename": document.get("filename"), "chunk": number, **passage})
+    return passages
+
+
+def pack_passages(results: Sequence[Tuple[float, Dict[str, Any]]], budget_tokens: int) -> List[Dict[str, Any]]:
+    """
+    The best-scoring passages that fit in ``budget_tokens`` together, in
+    score order. A passage that does not fit is skipped in favour of shorter
+    ones further down.
+    """
+    packed, used = [], 0
+    for _, passage in results:
+        tokens = passage.get("tokens") or estimate_tokens(passage["content"])
+        if used + tokens > budget_tokens:
+            continue
+        packed.append(passage)
+        used += tokens
+    return packed
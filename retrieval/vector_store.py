@@ -0,0 +1,184 @@
+"""
+Persistent chromadb vector index that re-embeds only files whose content changed
+"""
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import chromadb
+from chromadb.utils import embedding_functions
+
+from retrieval.chunking import chunk_text
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@dataclass
+class SyncReport:
+    """What :meth:`PersistentVectorIndex.sync` did, by filename"""
+    added: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+
+    @property
+    def embedded(self) -> List[str]:
+        """Added and changed files, sorted by name: the order sync embeds them in."""
+        return sorted(self.added + self.changed)
+
+
+class PersistentVectorIndex:
+    """
+    Passages of a documents directory, embedded into a chromadb collection
+    under ``persist_dir``.
+
+    A manifest next to the collection records each file's SHA-256, so
+    :meth:`sync` embeds only new or changed files and deletes the passages of
+    removed ones. Files whose size and mtime match the manifest are not even
+    re-read. Changing the embedding model or chunking settings rebuilds the
+    collection from scratch.
+    """
+
+    def __init__(self, persist_dir: str, collection_name: str = "knowledge_base",
+                 embedding_model: Optional[str] = None, target_tokens: int = 200,
+                 overlap_tokens: int = 40, batch_size: int = 64, embedding_function: Any = None):
+        self.persist_dir = persist_dir
+        self.collection_name = collection_name
+        self.target_tokens = target_tokens
+        self.overlap_tokens = overlap_tokens
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        # embedding_model is a sentence-transformers model name; None keeps
+        # chromadb's bundled all-MiniLM-L6-v2. A custom embedding_function is
+        # recorded in the manifest under embedding_model.
+        self.settings = {
+            "embedding_model": embedding_model or "chromadb-default",
+            "target_tokens": target_tokens,
+            "overlap_tokens": overlap_tokens,
+        }
+        if embedding_function is not None:
+            self.embedding_function = embedding_function
+        elif embedding_model:
+            self.embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=embedding_model)
+        else:
+            self.embedding_function = embedding_functions.DefaultEmbeddingFunction()
+        os.makedirs(persist_dir, exist_ok=True)
+        self.client = chromadb.PersistentClient(path=persist_dir)
+        self.manifest = self._read_manifest()
+        if self.manifest.get("settings") != self.settings:
+            # Embeddings from another model or chunking cannot be mixed in
+            if self.manifest:
+                print(f"Vector index settings changed, rebuilding {collection_name}")
+            try:
+                self.client.delete_collection(collection_name)
+            except Exception:
+                pass
+            self.manifest = {"settings": self.settings, "files": {}}
+        self.collection = self.client.get_or_create_collection(
+            collection_name,
+            embedding_function=self.embedding_function,
+            metadata={"hnsw:space": "cosine"},
+        )
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.persist_dir, f"{self.collection_name}.manifest.json")
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_manifest(self) -> None:
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def __len__(self) -> int:
+        """Number of files indexed."""
+        return len(self.manifest["files"])
+
+    def sync(self, directory: str, extensions: Tuple[str, ...] = (".txt", ".md")) -> SyncReport:
+        """
+        Bring the collection in line with the files in ``directory``. New and
+        changed files are embedded in filename order.
+        """
+        with self._lock:
+            return self._sync(directory, extensions)
+
+    def _sync(self, directory: str, extensions: Tuple[str, ...]) -> SyncReport:
+        report = SyncReport()
+        known = self.manifest["files"]
+        current = {}
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith(extensions):
+                continue
+            path = os.path.join(directory, filename)
+            stat = os.stat(path)
+            entry = known.get(filename)
+            if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                current[filename] = entry
+                report.unchanged.append(filename)
+                continue
+            digest = hash_file(path)
+            current[filename] = {"sha256": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            if entry is None:
+                report.added.append(filename)
+            elif entry["sha256"] != digest:
+                report.changed.append(filename)
+            else:
+                # Touched but not edited
+                report.unchanged.append(filename)
+        report.removed = [f for f in known if f not in current]
+
+        # Added files too: a sync that stopped before saving the manifest may
+        # have left some of their passages behind
+        for filename in report.removed + report.embedded:
+            self.collection.delete(where={"filename": filename})
+        for filename in report.embedded:
+            with open(os.path.join(directory, filename), "r", encoding="utf-8") as f:
+                self._embed(filename, f.read())
+
+        self.manifest["files"] = current
+        self._write_manifest()
+        return report
+
+    def _embed(self, filename: str, text: str) -> None:
+        passages = chunk_text(text, self.target_tokens, self.overlap_tokens)
+        for start in range(0, len(passages), self.batch_size):
+            batch = passages[start:start + self.batch_size]
+            self.collection.add(
+                ids=[f"{filename}#{start + i}" for i in range(len(batch))],
+                documents=[p["content"] for p in batch],
+                metadatas=[
+                    {"filename": filename, "chunk": start + i, "heading": p["heading"] or "", "tokens": p["tokens"]}
+                    for i, p in enumerate(batch)
+                ],
+            )
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[float, Dict[str, Any]]]:
+        """The ``k`` most similar (cosine similarity, passage) pairs, best first."""
+        count = self.collection.count()
+        if not count:
+            return []
+        result = self.collection.query(
+            query_texts=[query], n_results=min(k, count), include=["documents", "metadatas", "distances"]
+        )
+        return [
+            (1.0 - distance, {**metadata, "heading": metadata["heading"] or None, "content": document})
+            for document, metadata, distance in zip(
+                result["documents"][0], result["metadatas"][0], result["distances"][0]
+            )
+        ]
@@ -0,0 +1,86 @@
+"""
+Run the Modal Qwen service class locally, without Modal
+
+Loads a model through the same QwenService the Modal container uses, reports
+how long each cold start phase took and then times a few generations. By
+default the model is a tiny random GPT-2, so cold start can be tested and
+benchmarked offline:
+
+    python -m serve.local_runner
+    python -m serve.local_runner --model Qwen/Qwen2.5-0.5B-Instruct --requests 5
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# Add the project root to the path so we can import from server
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serve.qwen_service import QwenService
+from server.testing import build_tiny_model, make_prompt, percentile, vocabulary
+
+
+def run(model_id: str, requests: int = 3, concurrent_loads: int = 1, max_tokens: int = 16,
+        prompt_words: int = 16) -> Dict[str, Any]:
+    """Cold-start ``model_id`` in a QwenService and time ``requests`` generations."""
+    service = QwenService(model_id=model_id, fallback_model_id=None, precision="fp32")
+    # Several threads asking at once must still load the model only once
+    started = time.perf_counter()
+    threads = [threading.Thread(target=service.load) for _ in range(concurrent_loads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    cold_start = time.perf_counter() - started
+    if not service.ready:
+        raise RuntimeError(f"Loading {model_id} failed: {service.load_error}")
+
+    rng = random.Random(0)
+    words = vocabulary(100)
+    latencies: List[float] = []
+    for _ in range(requests):
+        request_started = time.perf_counter()
+        result = service.generate({"prompt": make_prompt(rng, words, prompt_words), "max_tokens": max_tokens})
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        latencies.append(time.perf_counter() - request_started)
+
+    return {
+        "model": model_id,
+        "cold_start_ms": 1000 * cold_start,
+        "load_timings_ms": {k: 1000 * v for k, v in service.load_timings.items()},
+        "requests": requests,
+        "latency_ms": {
+            "first": 1000 * latencies[0] if latencies else None,
+            "p50": 1000 * percentile(latencies, 50) if latencies else None,
+            "max": 1000 * max(latencies) if latencies else None,
+        },
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Cold-start the Qwen service locally and time a few requests")
+    parser.add_argument("--model", help="Model id or path (default: a tiny random GPT-2)")
+    parser.add_argument("--requests", type=int, default=3, help="Generations to time after loading")
+    parser.add_argument("--concurrent-loads", type=int, default=4, help="Threads calling load() at once")
+    parser.add_argument("--max-tokens", type=int, default=16)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as model_path:
+        model_id = args.model
+        if model_id is None:
+            build_tiny_model(model_path)
+            model_id = model_path
+        summary = run(model_id, args.requests, args.concurrent_loads, args.max_tokens)
+    print(json.dumps(summary, indent=2))
+    return summary
+
+
+if __name__ == "__main__":
+    main()
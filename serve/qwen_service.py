@@ -0,0 +1,231 @@
+"""
+Qwen chat model service: loading, warmup and generation, independent of Modal
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Annotated, Any, Dict, List, Optional, Union
+
+from pydantic import BaseModel, Field
+
+from server.engine import InferenceEngine
+from server.generation import GenerationRequest, GenerationResult
+from server.metrics import ServingMetrics
+from server.prefix_cache import PrefixCache
+
+# Use Qwen2.5-1.5B-Instruct - a proper Qwen chat model
+MODEL_ID = "Qwen/Qwen2.5-1.5B-Instruct"
+FALLBACK_MODEL_ID = "microsoft/DialoGPT-medium"
+
+
+class GenerationSettings(BaseModel):
+    """Settings a generation request may give; out-of-range values are rejected while parsing."""
+    max_tokens: int = Field(default=100, ge=1)
+    temperature: float = Field(default=0.7, ge=0)
+    # Strings that end the response (left out of it) and a wall-clock cap
+    stop: Optional[Union[str, List[str]]] = None
+    max_time_ms: Optional[float] = Field(default=None, gt=0)
+    seed: Optional[int] = None
+
+
+class PromptRequest(GenerationSettings):
+    """One prompt, as POST / takes it."""
+    prompt: str = Field(min_length=1)
+
+
+class BatchRequest(GenerationSettings):
+    """Prompt strings or requests for POST /batch; settings given here apply to every prompt that leaves them out."""
+    prompts: List[Union[Annotated[str, Field(min_length=1)], PromptRequest]] = Field(min_length=1)
+
+
+class QwenService:
+    """
+    One container's chat model, served through an :class:`InferenceEngine`.
+
+    :meth:`load` is idempotent and thread-safe: the first caller loads and warms
+    the model while concurrent callers wait for it, and a failed load is retried
+    by the next caller. How long each phase of the cold start took is kept in
+    ``load_timings``. Nothing here depends on Modal, so the same class runs
+    locally (see ``serve/local_runner.py``).
+    """
+
+    def __init__(self, model_id: str = MODEL_ID, fallback_model_id: Optional[str] = FALLBACK_MODEL_ID,
+                 draft_model_id: str = "", metrics: Optional[ServingMetrics] = None,
+                 precision: str = "fp16", warmup_prompt: str = "Hello", warmup_tokens: int = 8,
+                 prefix_cache_bytes: int = 1024 * 1024 * 1024, max_batch_size: int = 16,
+                 repetition_penalty: float = 1.1):
+        self.model_id = model_id
+        self.fallback_model_id = fallback_model_id
+        self.draft_model_id = draft_model_id
+        self.metrics = metrics or ServingMetrics()
+        self.precision = precision
+        self.warmup_prompt = warmup_prompt
+        self.warmup_tokens = warmup_tokens
+        self.prefix_cache_bytes = prefix_cache_bytes
+        self.max_batch_size = max(1, max_batch_size)
+        self.repetition_penalty = repetition_penalty
+        self.engine: Optional[InferenceEngine] = None
+        self.load_timings: Dict[str, float] = {}
+        self.load_error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.engine is not None
+
+    def load(self) -> Dict[str, float]:
+        """Load and warm the model once; returns the seconds each phase took."""
+        if self.ready:
+            return self.load_timings
+        with self._lock:
+            if self.ready:
+                return self.load_timings
+            try:
+                self._load()
+            except Exception as e:
+                self.load_error = str(e)
+                raise
+            self.load_error = None
+            return self.load_timings
+
+    def _load(self) -> None:
+        started = time.perf_counter()
+        print(f"Loading {self.model_id}...")
+        timings: Dict[str, float] = {}
+        try:
+            engine = self._load_engine(self.model_id, self.draft_model_id)
+        except Exception as e:
+            if not self.fallback_model_id:
+                raise
+            print(f"Error loading {self.model_id}: {e}")
+            timings["failed"] = time.perf_counter() - started
+            # Fallback to a simpler model if Qwen fails
+            print(f"Falling back to {self.fallback_model_id}...")
+            engine = self._load_engine(self.fallback_model_id, "")
+        timings.update(engine.load_timings)
+        timings["total"] = time.perf_counter() - started
+        self.engine = engine
+        self.load_timings = timings
+        self.metrics.record_load(engine.name, timings)
+        print(f"Model {engine.name} ready; cold start phases (ms): "
+              + ", ".join(f"{phase}={1000 * seconds:.0f}" for phase, seconds in timings.items()))
+
+    def _load_engine(self, model_id: str, draft_model_id: str) -> InferenceEngine:
+        return InferenceEngine.load(
+            model_id,
+            precision=self.precision,
+            draft_model_path=draft_model_id,
+            trust_remote_code=True,
+            warmup_prompt=self.warmup_prompt,
+            warmup_tokens=self.warmup_tokens,
+            # Key/values for the chat template and instruction text that every prompt starts with
+            prefix_cache=PrefixCache(max_bytes=self.prefix_cache_bytes),
+            repetition_penalty=self.repetition_penalty,
+        )
+
+    def generate(self, request: dict) -> dict:
+        """Answer one ``{"prompt", "max_tokens", "temperature", "stop", "max_time_ms", "seed"}`` request."""
+        try:
+            generation_request = self._request(request)
+        except (TypeError, ValueError) as e:
+            return {"error": str(e)}
+        print(f"Generating response for prompt: {request['prompt'][:50]}...")
+        started = time.perf_counter()
+        with self._queued(1):
+            result = self.engine.generate([generation_request], on_first_token=lambda: (
+                self.metrics.time_to_first_token.observe(time.perf_counter() - started, endpoint="/")
+            ))[0]
+        self._record([result])
+        if result.draft_tokens:
+            print(f"Assisted decoding: {result.accepted_draft_tokens}/{result.draft_tokens} draft tokens accepted")
+        print("Response generated successfully!")
+        return {"response": result.text.strip(), "finish_reason": result.finish_reason}
+
+    def generate_many(self, items: List[Any], defaults: Optional[dict] = None) -> List[dict]:
+        """
+        Answer many prompts, batching them through the model.
+
+        Each item is a prompt string or a request dict like :meth:`generate`
+        takes; settings it leaves out come from ``defaults``. Prompts are sorted
+        by length and generated ``max_batch_size`` at a time, so each padded
+        batch wastes little work on padding. Results come back in input order;
+        an item that fails gets an ``{"error": ...}`` result without failing
+        the others.
+        """
+        defaults = defaults or {}
+        results: List[Optional[dict]] = [None] * len(items)
+        indices, requests = [], []
+        for i, item in enumerate(items):
+            try:
+                requests.append(self._request({**defaults, **(item if isinstance(item, dict) else {"prompt": item})}))
+                indices.append(i)
+            except (TypeError, ValueError) as e:
+                results[i] = {"error": str(e)}
+
+        with self._queued(len(requests)):
+            generated = self.engine.batch(requests, self.max_batch_size)
+        self._record([r for r in generated if isinstance(r, GenerationResult)])
+        for i, result in zip(indices, generated):
+            results[i] = self._response(result)
+        return results
+
+    @contextmanager
+    def _queued(self, prompts: int):
+        """Count prompts as waiting for the model until they are answered."""
+        self.metrics.queue_depth.inc(prompts)
+        try:
+            yield
+        finally:
+            self.metrics.queue_depth.dec(prompts)
+
+    def _request(self, request: dict) -> GenerationRequest:
+        prompt = request.get("prompt")
+        if not isinstance(prompt, str) or not prompt:
+            raise ValueError("No prompt provided")
+        # A ValidationError is a ValueError, so one bad batch item fails alone
+        parsed = PromptRequest.model_validate(request)
+        stop = [parsed.stop] if isinstance(parsed.stop, str) else parsed.stop or None
+        return GenerationRequest(
+            prompt=self.engine.chat_prompt([{"role": "user", "content": prompt}]),
+            max_new_tokens=parsed.max_tokens,
+            temperature=parsed.temperature,
+            seed=parsed.seed,
+            stop=stop,
+            max_time_ms=parsed.max_time_ms,
+            echo_prompt=False,
+        )
+
+    @staticmethod
+    def _response(result: Union[GenerationResult, Exception]) -> dict:
+        if isinstance(result, Exception):
+            return {"error": str(result)}
+        return {
+            "response": result.text.strip(),
+            "finish_reason": result.finish_reason,
+            "prompt_tokens": result.prompt_tokens,
+            "completion_tokens": result.generated_tokens,
+        }
+
+    def _record(self, results: List[GenerationResult]) -> None:
+        if not results:
+            return
+        name = self.engine.name
+        self.metrics.record_generation(
+            name,
+            sum(r.prompt_tokens for r in results),
+            sum(r.generated_tokens for r in results),
+            results[0].generation_seconds,
+        )
+        self.metrics.record_draft(
+            name, sum(r.draft_tokens for r in results), sum(r.accepted_draft_tokens for r in results)
+        )
+
+    def health(self) -> Dict[str, Any]:
+        """Whether the model is loaded, and how long its cold start took."""
+        if self.ready:
+            return {
+                "status": "ready",
+                "model": self.engine.name,
+                "load_timings_ms": {k: 1000 * v for k, v in self.load_timings.items()},
+            }
+        return {"status": "failed" if self.load_error else "loading", "error": self.load_error}
@@ -1,123 +1,93 @@
+import os
+import sys
+
 import modal
-from fastapi import FastAPI
-from transformers import pipeline, AutoTokenizer, AutoModelForCausalLM
-import torch
+from fastapi import FastAPI, Response
+
+# Add the project root to the path so we can import from server
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serve.qwen_service import BatchRequest, PromptRequest, QwenService
+from server.metrics import CONTENT_TYPE, ServingMetrics
 
 app = modal.App("qwen-chat-llm")
 
+# Optional draft model for assisted decoding; it must share Qwen's tokenizer,
+# e.g. DRAFT_MODEL_ID=Qwen/Qwen2.5-0.5B-Instruct. Read at deploy time.
+DRAFT_MODEL_ID = os.environ.get("DRAFT_MODEL_ID", "")
+
 image = modal.Image.debian_slim().pip_install(
     "transformers", "torch", "accelerate", "fastapi", "bitsandbytes"
-)
+).env({"DRAFT_MODEL_ID": DRAFT_MODEL_ID}).add_local_python_source("server", "serve")
 
 # Create FastAPI app
 web_app = FastAPI()
 
-# Global variables to store the model and tokenizer
-model_pipeline = None
-tokenizer = None
-model = None
+# Metrics are per container; Prometheus should scrape each one (or aggregate by instance)
+metrics = ServingMetrics()
+
+# The container's model; loaded when the container starts, before it takes requests
+service = QwenService(draft_model_id=DRAFT_MODEL_ID, metrics=metrics)
+
+@web_app.post("/")
+def generate_text(request: PromptRequest):
+    """Generate text using the Qwen LLM; a malformed request is rejected with 422 before it is queued"""
+    with metrics.track_request("/"):
+        try:
+            # Already loaded by the startup hook; this only waits if that load failed
+            service.load()
+            return service.generate(request.model_dump(exclude_unset=True))
+        except Exception as e:
+            print(f"Error during generation: {e}")
+            metrics.record_error("/", e)
+            return {"error": str(e)}
 
-@app.function(
-    image=image, 
-    gpu="A10G", 
+@web_app.post("/batch")
+def generate_batch_text(request: BatchRequest):
+    """
+    Generate for many prompts in one call. "prompts" lists prompt strings or
+    {"prompt", "max_tokens", "temperature", "stop", "max_time_ms", "seed"} objects;
+    the same settings at the top level apply to every prompt that leaves them out.
+    A malformed item rejects the whole request with 422 before any prompt is padded.
+    """
+    with metrics.track_request("/batch"):
+        prompts = [p if isinstance(p, str) else p.model_dump(exclude_unset=True) for p in request.prompts]
+        defaults = request.model_dump(exclude={"prompts"}, exclude_unset=True)
+        try:
+            service.load()
+            return {"results": service.generate_many(prompts, defaults)}
+        except Exception as e:
+            print(f"Error during batch generation: {e}")
+            metrics.record_error("/batch", e)
+            return {"error": str(e)}
+
+@web_app.get("/health")
+def health():
+    """Readiness of this container's model, with its cold start phase timings"""
+    return service.health()
+
+@web_app.get("/metrics")
+def prometheus_metrics():
+    """Latency, token throughput and load time in Prometheus text format"""
+    return Response(content=metrics.render(), media_type=CONTENT_TYPE)
+
+@app.cls(
+    image=image,
+    gpu="A10G",
     timeout=600,
     container_idle_timeout=300,
     allow_concurrent_inputs=10
 )
-@modal.web_endpoint(method="POST", label="qwen-chat")
-def generate_text(request: dict):
-    """Generate text using the Qwen LLM"""
-    global model_pipeline, tokenizer, model
-    
-    # Load model if not already loaded
-    if model_pipeline is None:
-        print("Loading Qwen model...")
-        # Use Qwen2.5-1.5B-Instruct - a proper Qwen chat model
-        model_id = "Qwen/Qwen2.5-1.5B-Instruct"
-        
-        try:
-            # Load tokenizer and model separately for better control
-            tokenizer = AutoTokenizer.from_pretrained(model_id, trust_remote_code=True)
-            model = AutoModelForCausalLM.from_pretrained(
-                model_id, 
-                torch_dtype=torch.float16,
-                device_map="auto",
-                trust_remote_code=True
-            )
-            
-            # Create pipeline
-            model_pipeline = pipeline(
-                "text-generation", 
-                model=model, 
-                tokenizer=tokenizer,
-                torch_dtype=torch.float16,
-                device_map="auto"
-            )
-            print(f"Qwen model {model_id} loaded successfully!")
-        except Exception as e:
-            print(f"Error loading Qwen model: {e}")
-            # Fallback to a simpler model if Qwen fails
-            print("Falling back to microsoft/DialoGPT-medium...")
-            model_id = "microsoft/DialoGPT-medium"
-            model_pipeline = pipeline("text-generation", model=model_id, device=0)
-            print(f"Fallback model {model_id} loaded successfully!")
-    
-    try:
-        prompt = request.get("prompt", "")
-        max_tokens = request.get("max_tokens", 100)
-        temperature = request.get("temperature", 0.7)
-        
-        if not prompt:
-            return {"error": "No prompt provided"}
-        
-        print(f"Generating response for prompt: {prompt[:50]}...")
-        
-        # Format prompt for Qwen chat model using the proper chat template
-        if "Qwen" in str(model_pipeline.model.config._name_or_path):
-            # Use Qwen's proper chat format
-            messages = [{"role": "user", "content": prompt}]
-            chat_prompt = tokenizer.apply_chat_template(
-                messages, 
-                tokenize=False, 
-                add_generation_prompt=True
-            )
-        else:
-            # Use regular format for fallback models
-            chat_prompt = prompt
-        
-        # Generate response
-        result = model_pipeline(
-            chat_prompt, 
-            max_new_tokens=max_tokens, 
-            do_sample=True, 
-            temperature=temperature,
-            pad_token_id=tokenizer.eos_token_id,
-            eos_token_id=tokenizer.eos_token_id,
-            repetition_penalty=1.1
-        )
-        
-        response = result[0]["generated_text"]
-        
-        # Clean up the response
-        if "Qwen" in str(model_pipeline.model.config._name_or_path):
-            # Remove the chat template and get only the assistant's response
-            if chat_prompt in response:
-                response = response[len(chat_prompt):].strip()
-            # Remove any remaining special tokens
-            response = response.replace("<|im_end|>", "").strip()
-        else:
-            # Remove the original prompt from the response for other models
-            if response.startswith(chat_prompt):
-                response = response[len(chat_prompt):].strip()
-        
-        response = response.strip()
-        
-        print("Response generated successfully!")
-        return {"response": response}
-        
-    except Exception as e:
-        print(f"Error during generation: {e}")
-        return {"error": str(e)}
+class QwenChat:
+    @modal.enter()
+    def load(self):
+        """Load and warm the model when the container starts, not inside its first request"""
+        service.load()
+
+    @modal.asgi_app(label="qwen-chat")
+    def web(self):
+        """Serve generation at POST / (same URL as before), /health and Prometheus metrics at GET /metrics"""
+        return web_app
 
 @app.function(image=image)
 @modal.web_endpoint(method="GET", label="health-check")
@@ -129,4 +99,4 @@ if __name__ == "__main__":
     # Deploy the app
     print("Deploying Qwen Chat LLM to Modal...")
     print("After deployment, you'll get a URL like: https://your-username--qwen-chat-llm-generate-text.modal.run")
-    print("Use that URL in your modal_config.py file")
\ No newline at end of file
+    print("Use that URL in your modal_config.py file")
@@ -0,0 +1,184 @@
+"""
+Dynamic request batching for the chat server
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from server.executor import InferenceExecutor, OverloadedError
+
+
+@dataclass
+class _PendingRequest:
+    item: Any
+    future: asyncio.Future
+    enqueued_at: float
+
+
+@dataclass
+class BatchStats:
+    """Running counters describing how requests were grouped into batches."""
+    batches: int = 0
+    requests: int = 0
+    total_queue_wait: float = 0.0
+    max_queue_wait: float = 0.0
+    total_batch_time: float = 0.0
+    batch_sizes: Dict[int, int] = field(default_factory=dict)
+
+    def record_batch(self, size: int, queue_waits: List[float], batch_time: float) -> None:
+        self.batches += 1
+        self.requests += size
+        self.batch_sizes[size] = self.batch_sizes.get(size, 0) + 1
+        self.total_queue_wait += sum(queue_waits)
+        self.max_queue_wait = max([self.max_queue_wait] + queue_waits)
+        self.total_batch_time += batch_time
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert the counters to a JSON-friendly summary."""
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+            "avg_queue_wait_ms": 1000 * self.total_queue_wait / self.requests if self.requests else 0.0,
+            "max_queue_wait_ms": 1000 * self.max_queue_wait,
+            "avg_batch_time_ms": 1000 * self.total_batch_time / self.batches if self.batches else 0.0,
+        }
+
+
+class BatchScheduler:
+    """
+    Collects requests submitted from concurrent coroutines and hands them to a
+    blocking batch function as a single list.
+
+    A batch is closed when it reaches ``max_batch_size`` items or when the oldest
+    item in it has waited ``max_wait_ms``, whichever comes first. ``run_batch``
+    must return one result per item, in order; returning an exception instance
+    for an item fails only that caller.
+
+    Batches run on ``executor``. A new batch is only formed once the executor has
+    a free slot, so requests keep accumulating while the model is busy; once
+    ``max_queue_size`` requests are waiting, :meth:`submit` raises
+    :class:`OverloadedError`.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        max_queue_size: int = 64,
+        executor: Optional[InferenceExecutor] = None,
+    ):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.max_queue_size = max(1, max_queue_size)
+        self.executor = executor or InferenceExecutor()
+        self.stats = BatchStats()
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of requests waiting to be placed in a batch."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self) -> None:
+        """Start the background task that forms and runs batches."""
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task and fail any requests still queued."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+        while self._queue is not None and not self._queue.empty():
+            pending = self._queue.get_nowait()
+            if not pending.future.done():
+                pending.future.set_exception(RuntimeError("Batch scheduler stopped"))
+
+    async def submit(self, item: Any) -> Any:
+        """Queue an item for the next batch and wait for its result."""
+        if self._worker is None:
+            raise RuntimeError("Batch scheduler is not running")
+        if self.queue_depth >= self.max_queue_size:
+            queued_batches = self.queue_depth // self.max_batch_size
+            raise OverloadedError("Request queue is full", self.executor.retry_after(queued_batches))
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_PendingRequest(item, future, time.perf_counter()))
+        return await future
+
+    async def _run(self) -> None:
+        while True:
+            first = await self._queue.get()
+            try:
+                started_at = await self.executor.acquire()
+            except BaseException:
+                if not first.future.done():
+                    first.future.set_exception(RuntimeError("Batch scheduler stopped"))
+                raise
+            try:
+                batch = await self._collect(first)
+            except BaseException:
+                self.executor.release(started_at)
+                raise
+            task = asyncio.create_task(self._dispatch(batch, started_at))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _collect(self, first: _PendingRequest) -> List[_PendingRequest]:
+        batch = [first]
+        deadline = batch[0].enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                if self._queue.empty():
+                    break
+                batch.append(self._queue.get_nowait())
+                continue
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _dispatch(self, batch: List[_PendingRequest], slot_started_at: float) -> None:
+        try:
+            await self._run_and_resolve(batch)
+        finally:
+            self.executor.release(slot_started_at)
+
+    async def _run_and_resolve(self, batch: List[_PendingRequest]) -> None:
+        # Callers that disconnected while queued do not need a generation slot
+        batch = [pending for pending in batch if not pending.future.done()]
+        if not batch:
+            return
+
+        started = time.perf_counter()
+        queue_waits = [started - pending.enqueued_at for pending in batch]
+        try:
+            results = await self.executor.call(self.run_batch, [p.item for p in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"Batch function returned {len(results)} results for {len(batch)} requests")
+        except Exception as e:
+            results = [e] * len(batch)
+        self.stats.record_batch(len(batch), queue_waits, time.perf_counter() - started)
+
+        for pending, result in zip(batch, results):
+            if pending.future.done():
+                continue
+            if isinstance(result, BaseException):
+                pending.future.set_exception(result)
+            else:
+                pending.future.set_result(result)
@@ -0,0 +1,235 @@
+"""
+Load test for the chat server against a tiny randomly initialised model.
+
+Starts ``server/serve.py`` on a free port (or targets a running server with
+``--url``), drives ``/chat`` at a fixed concurrency and writes latency
+percentiles, requests/sec and generated tokens/sec as JSON. Nothing is
+downloaded: the model and its word-level tokenizer are built locally.
+
+To benchmark the default configuration:
+python -m server.benchmark --concurrency 8 --requests 200
+
+To compare a scheduler setting, run again with e.g. ``--env SERVE_MAX_BATCH_SIZE=1``
+and diff the JSON files written under ``benchmarks/``.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from server.testing import build_tiny_model, make_prompt, percentile, vocabulary
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def counter_total(metrics_text: str, name: str) -> float:
+    """Sum a Prometheus counter over all of its label sets."""
+    pattern = re.compile(rf"^{re.escape(name)}(?:{{[^}}]*}})? (\S+)$", re.MULTILINE)
+    return sum(float(value) for value in pattern.findall(metrics_text))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def http(method: str, url: str, payload: Optional[Dict[str, Any]] = None, timeout: float = 300.0):
+    """Send a request and return (status, body); HTTP errors are returned, not raised."""
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    request = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, response.read().decode("utf-8")
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode("utf-8")
+
+
+def start_server(model_path: str, port: int, env_overrides: Dict[str, str]) -> subprocess.Popen:
+    env = dict(os.environ, MODEL_PATH=model_path, **env_overrides)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server.serve:app", "--port", str(port), "--log-level", "warning"],
+        cwd=PROJECT_ROOT,
+        env=env,
+    )
+
+
+def wait_until_ready(url: str, server: Optional[subprocess.Popen], timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode} before becoming ready")
+        try:
+            status, body = http("GET", f"{url}/readyz", timeout=5)
+            if status == 200:
+                return
+            if json.loads(body).get("status") == "failed":
+                raise RuntimeError(f"Server failed to load the model: {body}")
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"Server at {url} was not ready after {timeout:.0f}s")
+
+
+def run_load(url: str, concurrency: int, total_requests: int, prompt_tokens: int, output_tokens: int,
+             temperature: float, seed: int) -> Dict[str, Any]:
+    """Send ``total_requests`` chat requests from ``concurrency`` workers; time each one."""
+    rng = random.Random(seed)
+    words = vocabulary(200)
+    payloads = [
+        {
+            "messages": [make_prompt(rng, words, prompt_tokens)],
+            "max_length": prompt_tokens + output_tokens,
+            "temperature": temperature,
+        }
+        for _ in range(total_requests)
+    ]
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    lock = threading.Lock()
+
+    def send(payload: Dict[str, Any]) -> None:
+        started = time.perf_counter()
+        try:
+            status, _ = http("POST", f"{url}/chat", payload)
+            error = None if status == 200 else f"http_{status}"
+        except Exception as e:
+            error = type(e).__name__
+        elapsed = time.perf_counter() - started
+        with lock:
+            if error is None:
+                latencies.append(elapsed)
+            else:
+                errors[error] = errors.get(error, 0) + 1
+
+    tokens_before = counter_total(http("GET", f"{url}/metrics")[1], "llm_generated_tokens_total")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, payloads))
+    elapsed = time.perf_counter() - started
+    tokens_after = counter_total(http("GET", f"{url}/metrics")[1], "llm_generated_tokens_total")
+
+    generated = tokens_after - tokens_before
+    return {
+        "requests": total_requests,
+        "succeeded": len(latencies),
+        "errors": errors,
+        "duration_s": elapsed,
+        "requests_per_second": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "generated_tokens": generated,
+        "generated_tokens_per_second": generated / elapsed if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "mean": 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+            "p50": 1000 * percentile(latencies, 50),
+            "p95": 1000 * percentile(latencies, 95),
+            "p99": 1000 * percentile(latencies, 99),
+            "max": 1000 * max(latencies) if latencies else 0.0,
+        },
+    }
+
+
+def git_commit() -> Dict[str, Any]:
+    def git(*args: str) -> str:
+        return subprocess.run(
+            ["git", *args], cwd=PROJECT_ROOT, capture_output=True, text=True, check=False
+        ).stdout.strip()
+
+    return {"sha": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def parse_env(pairs: List[str]) -> Dict[str, str]:
+    env = {}
+    for pair in pairs:
+        name, sep, value = pair.partition("=")
+        if not sep:
+            raise ValueError(f"Expected NAME=VALUE, got {pair!r}")
+        env[name] = value
+    return env
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Load-test the chat server with a tiny random model")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight at once")
+    parser.add_argument("--requests", type=int, default=100, help="Measured requests to send")
+    parser.add_argument("--warmup-requests", type=int, default=4, help="Unmeasured requests sent first")
+    parser.add_argument("--prompt-tokens", type=int, default=32)
+    parser.add_argument("--output-tokens", type=int, default=32)
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--layers", type=int, default=2, help="Layers of the random model")
+    parser.add_argument("--hidden", type=int, default=64, help="Hidden size of the random model")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="Server environment override, e.g. SERVE_MAX_BATCH_SIZE=1 (repeatable)")
+    parser.add_argument("--url", help="Benchmark an already running server instead of starting one")
+    parser.add_argument("--ready-timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="Result file (default: benchmarks/<time>-<commit>.json)")
+    args = parser.parse_args(argv)
+    try:
+        env_overrides = parse_env(args.env)
+    except ValueError as e:
+        parser.error(str(e))
+
+    server = None
+    with tempfile.TemporaryDirectory() as model_path:
+        url = args.url
+        if url is None:
+            build_tiny_model(model_path, layers=args.layers, hidden=args.hidden)
+            port = free_port()
+            url = f"http://127.0.0.1:{port}"
+            server = start_server(model_path, port, env_overrides)
+        url = url.rstrip("/")
+        try:
+            wait_until_ready(url, server, args.ready_timeout)
+            if args.warmup_requests:
+                run_load(url, args.concurrency, args.warmup_requests, args.prompt_tokens, args.output_tokens,
+                         args.temperature, args.seed + 1)
+            results = run_load(url, args.concurrency, args.requests, args.prompt_tokens, args.output_tokens,
+                               args.temperature, args.seed)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+
+    commit = git_commit()
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "config": {
+            "url": args.url,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "prompt_tokens": args.prompt_tokens,
+            "output_tokens": args.output_tokens,
+            "temperature": args.temperature,
+            "model": None if args.url else {"layers": args.layers, "hidden": args.hidden},
+            "server_env": env_overrides,
+        },
+        "results": results,
+    }
+
+    output = args.output
+    if output is None:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        output = os.path.join(PROJECT_ROOT, "benchmarks", f"{stamp}-{(commit['sha'] or 'nogit')[:8]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    print(f"Saved results to {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
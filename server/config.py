@@ -0,0 +1,109 @@
+"""
+Server configuration settings
+"""
+import os
+from dataclasses import dataclass
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+@dataclass
+class ServerConfig:
+    """Configuration for the FastAPI chat server"""
+    model_path: str = "./output"
+    # Weight precision: fp32, bf16, fp16 (GPU), or int8 (dynamic quantization, CPU only)
+    precision: str = "fp32"
+    # Extra checkpoints: each directory under models_dir can be requested by
+    # name. Least recently used models are unloaded to stay within the budget
+    # (0 means unlimited).
+    models_dir: str = ""
+    memory_budget_mb: int = 0
+    # Warmup generation run after loading, before a model takes traffic
+    # (0 tokens disables it).
+    warmup_tokens: int = 8
+    warmup_prompt: str = "Hello, how are you?"
+    # Small checkpoint with the same tokenizer used as a draft model for
+    # assisted decoding of single requests (empty disables it).
+    draft_model_path: str = ""
+    # Dynamic batching: requests arriving within max_wait_ms of each other are
+    # generated together, up to max_batch_size rows per model.generate call.
+    max_batch_size: int = 8
+    max_wait_ms: float = 10.0
+    # Backpressure: generate calls running at once on the inference thread pool,
+    # and requests allowed to wait for one before new ones are rejected with 429.
+    max_in_flight: int = 1
+    max_queue: int = 64
+    # Inference worker processes sharing the model weights for /chat batches
+    # (0 runs them in the server process; requests with a session_id always
+    # run there), and intra-op threads for each (0 splits the cores evenly).
+    # Each worker gets an equal share of the prefix cache budget.
+    workers: int = 0
+    worker_threads: int = 0
+    # Shared-prefix KV cache: memory cap in MB (0 disables) and the token block
+    # size prefixes are matched at.
+    prefix_cache_mb: int = 512
+    prefix_block_size: int = 32
+    # Session KV cache for requests with a session_id: total memory in MB
+    # (0 disables), the most one session may hold, and how long an idle
+    # session is kept.
+    session_cache_mb: int = 1024
+    session_max_mb: int = 128
+    session_idle_seconds: float = 600.0
+    # Conversation window: prompt tokens kept from the newest turns (0 means the
+    # model's context length less the generation budget), and how many
+    # tokenized turns are cached per model.
+    max_prompt_tokens: int = 0
+    token_cache_size: int = 4096
+    # Wall-clock cap on a single generation in milliseconds (0 for none);
+    # requests may ask for less with max_time_ms.
+    max_time_ms: float = 0.0
+    # Response cache for deterministic requests (temperature 0 or an explicit
+    # seed): maximum entries (0 disables) and time-to-live in seconds.
+    response_cache_size: int = 0
+    response_cache_ttl: float = 3600.0
+
+    @classmethod
+    def from_env(cls) -> "ServerConfig":
+        """
+        Build the configuration from environment variables, falling back to defaults
+
+        Returns:
+            ServerConfig: Server configuration
+        """
+        return cls(
+            model_path=os.getenv("MODEL_PATH", cls.model_path),
+            precision=os.getenv("SERVE_PRECISION", cls.precision).lower(),
+            models_dir=os.getenv("SERVE_MODELS_DIR", cls.models_dir),
+            memory_budget_mb=max(0, _env_int("SERVE_MEMORY_BUDGET_MB", cls.memory_budget_mb)),
+            warmup_tokens=max(0, _env_int("SERVE_WARMUP_TOKENS", cls.warmup_tokens)),
+            warmup_prompt=os.getenv("SERVE_WARMUP_PROMPT", cls.warmup_prompt),
+            draft_model_path=os.getenv("SERVE_DRAFT_MODEL_PATH", cls.draft_model_path),
+            max_batch_size=max(1, _env_int("SERVE_MAX_BATCH_SIZE", cls.max_batch_size)),
+            max_wait_ms=max(0.0, _env_float("SERVE_MAX_WAIT_MS", cls.max_wait_ms)),
+            max_in_flight=max(1, _env_int("SERVE_MAX_IN_FLIGHT", cls.max_in_flight)),
+            max_queue=max(1, _env_int("SERVE_MAX_QUEUE", cls.max_queue)),
+            workers=max(0, _env_int("SERVE_WORKERS", cls.workers)),
+            worker_threads=max(0, _env_int("SERVE_WORKER_THREADS", cls.worker_threads)),
+            prefix_cache_mb=max(0, _env_int("SERVE_PREFIX_CACHE_MB", cls.prefix_cache_mb)),
+            prefix_block_size=max(1, _env_int("SERVE_PREFIX_BLOCK_SIZE", cls.prefix_block_size)),
+            session_cache_mb=max(0, _env_int("SERVE_SESSION_CACHE_MB", cls.session_cache_mb)),
+            session_max_mb=max(0, _env_int("SERVE_SESSION_MAX_MB", cls.session_max_mb)),
+            session_idle_seconds=max(0.0, _env_float("SERVE_SESSION_IDLE_SECONDS", cls.session_idle_seconds)),
+            max_prompt_tokens=max(0, _env_int("SERVE_MAX_PROMPT_TOKENS", cls.max_prompt_tokens)),
+            token_cache_size=max(1, _env_int("SERVE_TOKEN_CACHE_SIZE", cls.token_cache_size)),
+            max_time_ms=max(0.0, _env_float("SERVE_MAX_TIME_MS", cls.max_time_ms)),
+            response_cache_size=max(0, _env_int("SERVE_RESPONSE_CACHE_SIZE", cls.response_cache_size)),
+            response_cache_ttl=_env_float("SERVE_RESPONSE_CACHE_TTL", cls.response_cache_ttl),
+        )
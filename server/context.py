@@ -0,0 +1,121 @@
+"""
+Token-budgeted context windows for multi-turn chat requests
+"""
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+# Turns are joined with a single space, as /chat always has
+SEPARATOR = " "
+
+
+def context_length(model) -> Optional[int]:
+    """Maximum sequence length the model was trained with, if its config says."""
+    config = model.config
+    for name in ("max_position_embeddings", "n_positions", "n_ctx"):
+        value = getattr(config, name, None)
+        if isinstance(value, int) and value > 0:
+            return value
+    return None
+
+
+@dataclass
+class ContextWindow:
+    """The prompt tokens for a conversation after fitting it into the budget."""
+    input_ids: List[int]
+    # Oldest messages left out of the prompt to fit the budget
+    dropped_messages: int = 0
+    # Tokens cut from the front of the oldest kept message when even the
+    # newest message alone was over budget
+    truncated_tokens: int = 0
+
+
+class TokenCache:
+    """
+    LRU cache of per-message token ids, so that each request of a growing
+    conversation only tokenizes the turns it has not seen before.
+
+    Messages after the first are tokenized with their leading separator, which
+    for byte-level BPE tokenizers gives the same ids as tokenizing the joined
+    conversation. Turns are tokenized without special tokens; the ones the
+    tokenizer adds around a text (such as BOS) are added once per window.
+    """
+
+    def __init__(self, tokenizer, max_entries: int = 4096):
+        self.tokenizer = tokenizer
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[bool, str], List[int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._special: Optional[Tuple[List[int], List[int]]] = None
+
+    def special_tokens(self) -> Tuple[List[int], List[int]]:
+        """Ids the tokenizer adds before and after a text, found by encoding a sample both ways."""
+        if self._special is None:
+            sample = "a"
+            plain = self.tokenizer(sample, add_special_tokens=False)["input_ids"]
+            full = self.tokenizer(sample)["input_ids"]
+            prefix, suffix = [], []
+            for start in range(len(full) - len(plain) + 1):
+                if full[start:start + len(plain)] == plain:
+                    prefix, suffix = full[:start], full[start + len(plain):]
+                    break
+            self._special = (list(prefix), list(suffix))
+        return self._special
+
+    def encode(self, text: str, leading_separator: bool) -> List[int]:
+        key = (leading_separator, text)
+        with self._lock:
+            ids = self._entries.get(key)
+            if ids is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return ids
+            self.misses += 1
+        ids = self.tokenizer((SEPARATOR if leading_separator else "") + text, add_special_tokens=False)["input_ids"]
+        with self._lock:
+            self._entries[key] = ids
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return ids
+
+    def window(self, messages: List[str], max_prompt_tokens: Optional[int]) -> ContextWindow:
+        """
+        Tokenize a conversation and keep its newest turns that fit in
+        ``max_prompt_tokens``, dropping the oldest ones first. The newest
+        message is always kept; if it alone is too long, its beginning is cut.
+        """
+        prefix, suffix = self.special_tokens()
+        encoded = [self.encode(text, i > 0) for i, text in enumerate(messages)]
+        if max_prompt_tokens is None:
+            return ContextWindow(prefix + [token for ids in encoded for token in ids] + suffix)
+
+        budget = max(1, max_prompt_tokens - len(prefix) - len(suffix))
+        kept: List[List[int]] = []
+        used = 0
+        for ids in reversed(encoded):
+            if kept and used + len(ids) > budget:
+                break
+            kept.append(ids)
+            used += len(ids)
+        kept.reverse()
+
+        input_ids = [token for ids in kept for token in ids]
+        truncated = max(0, len(input_ids) - budget)
+        return ContextWindow(
+            input_ids=prefix + input_ids[truncated:] + suffix,
+            dropped_messages=len(encoded) - len(kept),
+            truncated_tokens=truncated,
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit rate and size, as a JSON-friendly dict."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
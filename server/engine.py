@@ -0,0 +1,186 @@
+"""
+Inference engine shared by the FastAPI server and the Modal app
+"""
+import time
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from server.generation import (
+    AsyncTextStreamer,
+    GenerationRequest,
+    GenerationResult,
+    format_chat,
+    generate_batch,
+    generate_completions,
+    generate_stream,
+    prepare_tokenizer,
+)
+from server.quantize import apply_precision
+from server.registry import model_nbytes
+from server.speculative import draft_compatible
+
+TORCH_DTYPES = {"bf16": torch.bfloat16, "fp16": torch.float16}
+
+
+def read_weights(model_path: str, precision: str = "fp32", trust_remote_code: bool = False):
+    # low_cpu_mem_usage memory-maps safetensors weights and loads them straight
+    # into the model instead of building a randomly initialised copy first
+    model = AutoModelForCausalLM.from_pretrained(
+        model_path,
+        low_cpu_mem_usage=True,
+        torch_dtype=TORCH_DTYPES.get(precision),
+        trust_remote_code=trust_remote_code,
+    )
+    return model.eval()
+
+
+def to_device(model, precision: str = "fp32"):
+    # Dynamically quantized kernels only run on CPU
+    if torch.cuda.is_available() and precision != "int8":
+        model = model.cuda()
+    return model
+
+
+class InferenceEngine:
+    """
+    A loaded model with its caches, and every way the servers generate from it.
+
+    :meth:`generate` runs one padded batch, :meth:`stream` streams a single
+    request, :meth:`complete` samples several completions of one prompt and
+    :meth:`batch` runs many prompts in length-sorted batches. Output is sliced
+    at the token level: completions are decoded from the generated tokens
+    alone, never by stripping the prompt from decoded text.
+
+    ``prefix_cache``, ``draft_model`` and ``session_cache`` are optional and
+    used wherever :func:`generate_batch` can use them.
+    """
+
+    def __init__(self, model, tokenizer, name: str = "default", prefix_cache=None, draft_model=None,
+                 session_cache=None, repetition_penalty: float = 1.0,
+                 load_timings: Optional[Dict[str, float]] = None):
+        self.model = model
+        self.tokenizer = prepare_tokenizer(tokenizer)
+        self.name = name
+        self.prefix_cache = prefix_cache
+        self.draft_model = draft_model
+        self.session_cache = session_cache
+        self.repetition_penalty = repetition_penalty
+        self.load_timings: Dict[str, float] = load_timings or {}
+
+    @classmethod
+    def load(cls, model_path: str, name: Optional[str] = None, precision: str = "fp32",
+             draft_model_path: str = "", trust_remote_code: bool = False,
+             warmup_prompt: str = "Hello", warmup_tokens: int = 8, **kwargs) -> "InferenceEngine":
+        """
+        Load a checkpoint for serving, timing each phase: tokenizer, weights,
+        precision, device, draft (if any) and warmup. A draft model whose
+        vocabulary differs from the model's is left out. Other keyword arguments
+        are passed to the constructor.
+        """
+        timings: Dict[str, float] = {}
+        phase_started = time.perf_counter()
+
+        def end_phase(phase: str):
+            nonlocal phase_started
+            now = time.perf_counter()
+            timings[phase] = now - phase_started
+            phase_started = now
+
+        tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=trust_remote_code)
+        end_phase("tokenizer")
+        model = read_weights(model_path, precision, trust_remote_code)
+        end_phase("weights")
+        model = apply_precision(model, precision)
+        end_phase("precision")
+        model = to_device(model, precision)
+        end_phase("device")
+
+        draft_model = None
+        if draft_model_path:
+            draft_model = to_device(
+                apply_precision(read_weights(draft_model_path, precision, trust_remote_code), precision), precision
+            )
+            if not draft_compatible(model, draft_model):
+                print(f"Warning: draft model {draft_model_path} does not share the vocabulary of {model_path}; "
+                      "serving it without assisted decoding")
+                draft_model = None
+            end_phase("draft")
+
+        engine = cls(model, tokenizer, name=name or model_path, draft_model=draft_model,
+                     load_timings=timings, **kwargs)
+        if warmup_tokens > 0:
+            engine.warmup(warmup_prompt, warmup_tokens)
+            end_phase("warmup")
+        return engine
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the weights of the model and its draft."""
+        return model_nbytes(self.model) + (model_nbytes(self.draft_model) if self.draft_model is not None else 0)
+
+    def warmup(self, prompt: str, tokens: int) -> None:
+        """Pay for kernel selection and allocator growth before the first real request."""
+        self.generate([GenerationRequest(prompt=prompt, max_new_tokens=tokens, temperature=0.0)])
+
+    def chat_prompt(self, messages: List[Dict[str, str]]) -> str:
+        """Render role/content messages as a prompt (see :func:`format_chat`)."""
+        return format_chat(self.tokenizer, messages)
+
+    def generate(self, requests: List[GenerationRequest],
+                 on_first_token: Optional[Callable[[], None]] = None) -> List[GenerationResult]:
+        """Generate for the requests as one padded batch (see :func:`generate_batch`)."""
+        return generate_batch(
+            self.model, self.tokenizer, requests,
+            prefix_cache=self.prefix_cache, on_first_token=on_first_token,
+            draft_model=self.draft_model, session_cache=self.session_cache,
+            repetition_penalty=self.repetition_penalty,
+        )
+
+    def stream(self, request: GenerationRequest, streamer: AsyncTextStreamer) -> Dict[str, Any]:
+        """Generate one request into ``streamer``; returns usage (see :func:`generate_stream`)."""
+        return generate_stream(
+            self.model, self.tokenizer, request, streamer,
+            self.prefix_cache, self.draft_model, self.session_cache, self.repetition_penalty,
+        )
+
+    def complete(self, prompt: str, n: int = 1, **kwargs) -> List[GenerationResult]:
+        """Sample ``n`` completions of one prompt (see :func:`generate_completions`)."""
+        return generate_completions(
+            self.model, self.tokenizer, prompt, n=n,
+            prefix_cache=self.prefix_cache, draft_model=self.draft_model,
+            repetition_penalty=self.repetition_penalty, **kwargs,
+        )
+
+    def batch(self, requests: List[GenerationRequest],
+              max_batch_size: int = 16) -> List[Union[GenerationResult, Exception]]:
+        """
+        Generate for many requests, ``max_batch_size`` at a time.
+
+        Requests are sorted by prompt length so each padded batch wastes little
+        work on padding, and results come back in input order. If a batch
+        fails, its requests are retried one by one; a request that still fails
+        gets its exception in place of a result.
+        """
+        lengths = [
+            len(r.prompt_ids) if r.prompt_ids is not None else len(self.tokenizer(r.prompt)["input_ids"])
+            for r in requests
+        ]
+        order = sorted(range(len(requests)), key=lambda i: lengths[i])
+        results: List[Union[GenerationResult, Exception, None]] = [None] * len(requests)
+        for start in range(0, len(order), max(1, max_batch_size)):
+            indices = order[start:start + max(1, max_batch_size)]
+            for i, result in zip(indices, self._isolated([requests[i] for i in indices])):
+                results[i] = result
+        return results
+
+    def _isolated(self, requests: List[GenerationRequest]) -> List[Union[GenerationResult, Exception]]:
+        try:
+            return self.generate(requests)
+        except Exception as e:
+            if len(requests) == 1:
+                return [e]
+            # Retry one at a time so only the failing request reports the error
+            print(f"Batch of {len(requests)} failed ({e}); retrying its requests one by one")
+            return [result for r in requests for result in self._isolated([r])]
@@ -0,0 +1,110 @@
+"""
+Bounded executor that keeps blocking inference off the asyncio event loop
+"""
+import asyncio
+import functools
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Optional
+
+
+class OverloadedError(Exception):
+    """Raised when a request is rejected because the inference queue is full."""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    """
+    Runs blocking model calls on a dedicated thread pool.
+
+    At most ``max_in_flight`` calls execute at once. Callers beyond that wait for
+    a slot, and once ``max_queue`` callers are already waiting new ones are
+    rejected with :class:`OverloadedError` instead of piling up.
+    """
+
+    def __init__(self, max_in_flight: int = 1, max_queue: int = 64):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max(0, max_queue)
+        self.in_flight = 0
+        self.waiting = 0
+        # Exponentially weighted average of how long one slot stays busy
+        self.avg_service_time = 1.0
+        self._pool = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="inference")
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        return self._slots
+
+    def retry_after(self, queued: Optional[int] = None) -> int:
+        """Estimate in whole seconds how long until a newly queued call would start."""
+        queued = self.waiting if queued is None else queued
+        rounds = queued / self.max_in_flight + 1
+        return max(1, math.ceil(self.avg_service_time * rounds))
+
+    async def acquire(self) -> float:
+        """Wait for a free slot without admission checks. Returns the start time."""
+        await self._semaphore().acquire()
+        self.in_flight += 1
+        return time.perf_counter()
+
+    def release(self, started_at: float) -> None:
+        """Free a slot taken with :meth:`acquire`."""
+        self.in_flight -= 1
+        self._semaphore().release()
+        elapsed = time.perf_counter() - started_at
+        self.avg_service_time = 0.8 * self.avg_service_time + 0.2 * elapsed
+
+    def admit(self) -> None:
+        """Raise :class:`OverloadedError` if a new caller would have to be rejected."""
+        if self.waiting >= self.max_queue and self._semaphore().locked():
+            raise OverloadedError("Inference queue is full", self.retry_after())
+
+    def enqueue(self) -> None:
+        """
+        Admit a caller and count it as waiting, before it asks for a slot; for
+        callers that must be rejected before they start responding. Follow with
+        ``slot(enqueued=True)``, or :meth:`dequeue` if the slot is never needed.
+        """
+        self.admit()
+        self.waiting += 1
+
+    def dequeue(self) -> None:
+        """Stop counting a caller admitted with :meth:`enqueue` as waiting."""
+        self.waiting -= 1
+
+    @asynccontextmanager
+    async def slot(self, enqueued: bool = False):
+        """
+        Hold an execution slot, rejecting the caller if the wait queue is full.
+        With ``enqueued``, the caller was already admitted by :meth:`enqueue`.
+        """
+        if not enqueued:
+            self.enqueue()
+        try:
+            started_at = await self.acquire()
+        finally:
+            self.dequeue()
+        try:
+            yield
+        finally:
+            self.release(started_at)
+
+    async def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run ``fn`` on the inference thread pool. The caller should hold a slot."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, functools.partial(fn, *args, **kwargs))
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Wait for a slot, then run ``fn`` on the inference thread pool."""
+        async with self.slot():
+            return await self.call(fn, *args, **kwargs)
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,569 @@
+"""
+Text generation helpers for the chat server
+"""
+import asyncio
+import contextlib
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import torch
+from transformers import (
+    LogitsProcessor,
+    LogitsProcessorList,
+    StoppingCriteria,
+    StoppingCriteriaList,
+    TextStreamer,
+)
+
+from server.speculative import AcceptanceTracker
+from server.stopping import deadline, row_stop_criteria, stop_index
+
+
+@dataclass
+class GenerationRequest:
+    """
+    A single prompt with its own generation settings.
+
+    ``prompt_ids``, when given, are used instead of tokenizing ``prompt``.
+    ``max_new_tokens`` caps generated tokens; without it ``max_length`` caps
+    prompt plus generated tokens. Generation also ends at any of the ``stop``
+    strings (which are left out of the text) or after ``max_time_ms``. The
+    result text starts with the prompt unless ``echo_prompt`` is False.
+    """
+    prompt: str
+    max_length: int = 100
+    temperature: float = 0.7
+    seed: Optional[int] = None
+    submitted_at: float = field(default_factory=time.perf_counter)
+    prompt_ids: Optional[List[int]] = None
+    max_new_tokens: Optional[int] = None
+    # Conversation this turn belongs to, for reusing the previous turn's key/values
+    session_id: Optional[str] = None
+    stop: Optional[List[str]] = None
+    max_time_ms: Optional[float] = None
+    echo_prompt: bool = True
+
+    def budget(self, prompt_length: int) -> int:
+        """Tokens to generate after a prompt of ``prompt_length`` tokens."""
+        if self.max_new_tokens is not None:
+            return max(self.max_new_tokens, 0)
+        return max(self.max_length - prompt_length, 0)
+
+
+@dataclass
+class GenerationResult:
+    """Decoded output for one request, with token counts for usage reporting."""
+    text: str
+    prompt_tokens: int
+    generated_tokens: int
+    generation_seconds: float = 0.0
+    # "stop" at end-of-sequence or a stop string, "length" when the token budget
+    # ran out, "time" when max_time_ms did
+    finish_reason: str = "length"
+    # Assisted decoding only: tokens the draft model proposed, and how many were kept
+    draft_tokens: int = 0
+    accepted_draft_tokens: int = 0
+
+
+class RowTemperatureLogitsProcessor(LogitsProcessor):
+    """
+    Applies a separate sampling temperature to every row of a batch.
+
+    ``model.generate`` only accepts one temperature per call, so batched requests
+    are generated with ``temperature=1.0`` and this processor rescales each row.
+    A temperature of 0 (or below) makes that row greedy.
+    """
+
+    def __init__(self, temperatures: List[float]):
+        self.temperatures = temperatures
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        temperatures = torch.tensor(self.temperatures, dtype=scores.dtype, device=scores.device)
+        scores = scores / temperatures.clamp(min=1e-5).unsqueeze(1)
+
+        greedy = temperatures <= 0
+        if greedy.any():
+            # Keep only the argmax so sampling always picks it
+            rows = scores[greedy]
+            masked = torch.full_like(rows, float("-inf"))
+            masked.scatter_(1, rows.argmax(dim=-1, keepdim=True), 0.0)
+            scores[greedy] = masked
+        return scores
+
+
+class SeededSampler(LogitsProcessor):
+    """
+    Draws the next token of seeded rows from each row's own ``torch.Generator``.
+
+    ``model.generate`` samples from torch's global random state, which batches
+    running at the same time share. For each row with a generator this picks
+    the token itself and leaves only it possible, so the sample ``generate``
+    takes is the same and depends on nothing but the row's seed. Rows may
+    share a generator; they then draw from it in row order.
+    """
+
+    def __init__(self, generators: List[Optional[torch.Generator]]):
+        self.generators = generators
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        for row, generator in enumerate(self.generators):
+            if generator is None:
+                continue
+            probs = torch.softmax(scores[row].float(), dim=-1)
+            token = torch.multinomial(probs, 1, generator=generator)
+            masked = torch.full_like(scores[row], float("-inf"))
+            masked[token] = 0.0
+            scores[row] = masked
+        return scores
+
+
+def seeded_generator(seed: Optional[int], device) -> Optional[torch.Generator]:
+    """A generator on ``device`` seeded with ``seed``, or None without a seed."""
+    if seed is None:
+        return None
+    return torch.Generator(device=device).manual_seed(seed)
+
+
+def _sampling_processors(temperatures: List[float], generators: List[Optional[torch.Generator]],
+                         on_first_token: Optional[Callable[[], None]] = None) -> LogitsProcessorList:
+    processors = [RowTemperatureLogitsProcessor(temperatures)]
+    if any(g is not None for g in generators):
+        processors.append(SeededSampler(generators))
+    if on_first_token is not None:
+        processors.append(FirstTokenCallback(on_first_token))
+    return LogitsProcessorList(processors)
+
+
+class FirstTokenCallback(LogitsProcessor):
+    """Calls ``callback`` once, when the first token's logits are ready."""
+
+    def __init__(self, callback: Callable[[], None]):
+        self.callback = callback
+        self.called = False
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        if not self.called:
+            self.called = True
+            self.callback()
+        return scores
+
+
+def _count_generated(token_ids: torch.Tensor, eos_token_id: Optional[int]) -> int:
+    """Tokens actually generated in a row, ignoring the padding after end-of-sequence."""
+    if eos_token_id is not None:
+        eos = (token_ids == eos_token_id).nonzero()
+        if len(eos):
+            return int(eos[0, 0]) + 1
+    return len(token_ids)
+
+
+def _finish_reason(token_ids: torch.Tensor, eos_token_id: Optional[int]) -> str:
+    if eos_token_id is not None and bool((token_ids == eos_token_id).any()):
+        return "stop"
+    return "length"
+
+
+def _decode_row(tokenizer, row_ids: torch.Tensor, start: int, width: int, budget: int,
+                stops: Optional[List[str]] = None, criteria=None, row: int = 0) -> Tuple[str, int, str]:
+    """
+    Decode ``row_ids[start:width + budget]``, where generation began at ``width``.
+
+    Returns the text, the number of tokens generated and the finish reason. A
+    row ended by a stop string is cut just before it.
+    """
+    completion_ids = row_ids[width:width + budget]
+    generated = _count_generated(completion_ids, tokenizer.eos_token_id)
+    reason = _finish_reason(completion_ids, tokenizer.eos_token_id)
+    stopped = criteria.reasons[row] if criteria is not None else None
+    if stopped is not None:
+        reason = stopped
+        generated = min(generated, criteria.stopped_at[row])
+    if stopped != "stop":
+        return tokenizer.decode(row_ids[start:width + budget], skip_special_tokens=True), generated, reason
+
+    # Decode prompt and completion together so the tokenizer spaces the words
+    # where they meet, and only look for the stop string after the prompt
+    text = tokenizer.decode(row_ids[start:width + generated], skip_special_tokens=True)
+    prompt_chars = len(tokenizer.decode(row_ids[start:width], skip_special_tokens=True)) if start < width else 0
+    cut = stop_index(text[prompt_chars:], stops)
+    if cut is not None:
+        text = text[:prompt_chars + cut]
+    return text, generated, reason
+
+
+def prepare_tokenizer(tokenizer):
+    """Configure a tokenizer for left-padded batch generation."""
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"
+    return tokenizer
+
+
+def _encode(model, tokenizer, requests: List[GenerationRequest]) -> Dict[str, torch.Tensor]:
+    """Left-padded input ids and attention mask for a batch, on the model's device."""
+    ids = [r.prompt_ids if r.prompt_ids is not None else tokenizer(r.prompt)["input_ids"] for r in requests]
+    encoded = tokenizer.pad({"input_ids": ids}, padding=True, return_tensors="pt")
+    return {k: v.to(model.device) for k, v in encoded.items()}
+
+
+def _prefix_kwargs(model, prefix_cache, input_ids: torch.Tensor) -> Dict[str, Any]:
+    """Reuse cached key/values for a single prompt's shared prefix, if any."""
+    if prefix_cache is None or input_ids.shape[0] != 1:
+        return {}
+    _, past_key_values = prefix_cache.past_for(model, input_ids[0].tolist())
+    return {"past_key_values": past_key_values} if past_key_values is not None else {}
+
+
+def _single_row_kwargs(model, input_ids: torch.Tensor, prefix_cache=None, draft_model=None,
+                       session_cache=None, session_id: Optional[str] = None
+                       ) -> Tuple[Dict[str, Any], Optional[AcceptanceTracker]]:
+    """
+    Extra ``generate`` arguments that speed up a lone prompt, best first: the
+    session's own key/values from its previous turn, assisted decoding with the
+    draft model, then a cached shared prefix. Multi-row batches get none.
+
+    Returns the arguments and, for assisted decoding, the acceptance tracker to
+    wrap the ``generate`` call in.
+    """
+    if input_ids.shape[0] != 1:
+        return {}, None
+    if session_cache is not None and session_id is not None:
+        # Hand back the key/values afterwards so the next turn can reuse them
+        extra: Dict[str, Any] = {"return_dict_in_generate": True}
+        _, past_key_values = session_cache.take(session_id, input_ids[0].tolist())
+        if past_key_values is not None:
+            extra["past_key_values"] = past_key_values
+        else:
+            extra.update(_prefix_kwargs(model, prefix_cache, input_ids))
+        return extra, None
+    if draft_model is not None:
+        return {"assistant_model": draft_model}, AcceptanceTracker(model, draft_model)
+    return _prefix_kwargs(model, prefix_cache, input_ids), None
+
+
+def _keep_session(outputs, session_cache, session_id: Optional[str]):
+    """Store a session's key/values from a ``return_dict_in_generate`` output; return the token ids."""
+    if not hasattr(outputs, "sequences"):
+        return outputs
+    session_cache.store(session_id, outputs.sequences[0].tolist(), outputs.past_key_values)
+    return outputs.sequences
+
+
+def generate_batch(model, tokenizer, requests: List[GenerationRequest], prefix_cache=None,
+                   on_first_token: Optional[Callable[[], None]] = None,
+                   draft_model=None, session_cache=None,
+                   repetition_penalty: float = 1.0) -> List[GenerationResult]:
+    """
+    Generate completions for several prompts with one ``model.generate`` call.
+
+    Prompts are left-padded to a common length. Each request keeps its own
+    token budget (see :meth:`GenerationRequest.budget`): the batch runs for the
+    largest budget and each row is cut back to its own.
+    Returns the decoded prompt and completion (or, without ``echo_prompt``,
+    just the completion) for each request, in order.
+    ``on_first_token`` is called once the first token of the batch is sampled.
+
+    A lone request may reuse key/values from ``prefix_cache``; left padding
+    shifts positions within a multi-row batch, so those are prefilled in full.
+    With a ``draft_model``, a lone request is generated with assisted decoding
+    instead: the draft proposes tokens and the model verifies them in one pass.
+    ``transformers`` only supports this for a single row, so multi-row batches
+    decode normally.
+
+    Requests with a ``seed`` sample from their own generator (see
+    :class:`SeededSampler`) and are generated on their own, so neither other
+    rows nor their padding change the output. Requests with a ``session_id``
+    continue from their session's key/values in ``session_cache``, also on
+    their own.
+    """
+    def solo(r: GenerationRequest) -> bool:
+        return r.seed is not None or (session_cache is not None and r.session_id is not None)
+
+    alone = [i for i, r in enumerate(requests) if solo(r)]
+    if alone and len(requests) > 1:
+        results = [None] * len(requests)
+        for i in alone:
+            results[i] = generate_batch(
+                model, tokenizer, [requests[i]], prefix_cache, on_first_token, draft_model, session_cache,
+                repetition_penalty,
+            )[0]
+        rest = [i for i, r in enumerate(requests) if not solo(r)]
+        if rest:
+            batch = generate_batch(
+                model, tokenizer, [requests[i] for i in rest], prefix_cache, on_first_token, draft_model,
+                repetition_penalty=repetition_penalty,
+            )
+            for i, result in zip(rest, batch):
+                results[i] = result
+        return results
+
+    encoded = _encode(model, tokenizer, requests)
+    prompt_lengths = encoded["attention_mask"].sum(dim=1).tolist()
+    budgets = [r.budget(n) for r, n in zip(requests, prompt_lengths)]
+
+    width = encoded["input_ids"].shape[1]
+    outputs = encoded["input_ids"]
+    tracker = None
+    started = time.perf_counter()
+    criteria = row_stop_criteria(
+        tokenizer, width, [r.stop for r in requests], [deadline(started, r.max_time_ms) for r in requests]
+    )
+    if max(budgets) > 0:
+        processors = _sampling_processors(
+            [r.temperature for r in requests],
+            [seeded_generator(r.seed, model.device) for r in requests],
+            on_first_token,
+        )
+        extra, tracker = _single_row_kwargs(
+            model, encoded["input_ids"], prefix_cache, draft_model, session_cache, requests[0].session_id
+        )
+        with tracker or contextlib.nullcontext():
+            outputs = model.generate(
+                **encoded,
+                max_new_tokens=max(budgets),
+                do_sample=True,
+                temperature=1.0,
+                logits_processor=processors,
+                stopping_criteria=StoppingCriteriaList([criteria] if criteria is not None else []),
+                repetition_penalty=repetition_penalty,
+                pad_token_id=tokenizer.pad_token_id,
+                **extra,
+            )
+        outputs = _keep_session(outputs, session_cache, requests[0].session_id)
+    elapsed = time.perf_counter() - started
+
+    results = []
+    for row, (request, prompt_length, budget) in enumerate(zip(requests, prompt_lengths, budgets)):
+        start = width - prompt_length if request.echo_prompt else width
+        text, generated, reason = _decode_row(
+            tokenizer, outputs[row], start, width, budget, request.stop, criteria, row
+        )
+        result = GenerationResult(
+            text=text,
+            prompt_tokens=prompt_length,
+            generated_tokens=generated,
+            generation_seconds=elapsed,
+            finish_reason=reason,
+        )
+        if tracker is not None:
+            tracker.generated_tokens = result.generated_tokens
+            result.draft_tokens = tracker.draft_tokens
+            result.accepted_draft_tokens = tracker.accepted_tokens
+        results.append(result)
+    return results
+
+
+def format_chat(tokenizer, messages: List[Dict[str, str]]) -> str:
+    """
+    Render role/content messages as a prompt with the tokenizer's chat template.
+
+    Checkpoints fine-tuned from base models often have no template; those get a
+    plain "role: content" transcript ending with an open assistant turn.
+    """
+    if getattr(tokenizer, "chat_template", None):
+        return tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+    lines = [f"{m['role']}: {m['content']}" for m in messages]
+    return "\n".join(lines + ["assistant:"])
+
+
+def generate_completions(model, tokenizer, prompt: str, n: int = 1, max_new_tokens: int = 100,
+                         temperature: float = 1.0, seed: Optional[int] = None, prefix_cache=None,
+                         on_first_token: Optional[Callable[[], None]] = None,
+                         draft_model=None, stop: Optional[List[str]] = None,
+                         max_time_ms: Optional[float] = None,
+                         repetition_penalty: float = 1.0) -> List[GenerationResult]:
+    """
+    Sample ``n`` completions of one prompt in a single batch.
+
+    The prompt is encoded and prefilled once; ``generate`` expands it to ``n``
+    rows only for decoding. Returns only the completion text for each row.
+    Each row ends on its own at a ``stop`` string; ``max_time_ms`` ends all.
+    """
+    encoded = tokenizer(prompt, return_tensors="pt")
+    encoded = {k: v.to(model.device) for k, v in encoded.items()}
+    prompt_tokens = encoded["input_ids"].shape[1]
+    width = prompt_tokens
+
+    outputs = encoded["input_ids"].expand(n, -1)
+    tracker = None
+    started = time.perf_counter()
+    criteria = row_stop_criteria(tokenizer, width, [stop] * n, [deadline(started, max_time_ms)] * n)
+    if max_new_tokens > 0:
+        # One generator for all n rows, so the seed fixes the whole set
+        processors = _sampling_processors(
+            [temperature] * n, [seeded_generator(seed, model.device)] * n, on_first_token
+        )
+        extra = {}
+        if n == 1:
+            # Cached key/values cover one row; with n > 1 generate expands the prompt itself
+            extra, tracker = _single_row_kwargs(model, encoded["input_ids"], prefix_cache, draft_model)
+        with tracker or contextlib.nullcontext():
+            outputs = model.generate(
+                **encoded,
+                max_new_tokens=max_new_tokens,
+                num_return_sequences=n,
+                do_sample=True,
+                temperature=1.0,
+                logits_processor=processors,
+                stopping_criteria=StoppingCriteriaList([criteria] if criteria is not None else []),
+                repetition_penalty=repetition_penalty,
+                pad_token_id=tokenizer.pad_token_id,
+                **extra,
+            )
+    elapsed = time.perf_counter() - started
+
+    results = []
+    for row in range(n):
+        text, generated, reason = _decode_row(tokenizer, outputs[row], width, width, max_new_tokens, stop, criteria, row)
+        result = GenerationResult(
+            text=text,
+            prompt_tokens=prompt_tokens,
+            generated_tokens=generated,
+            generation_seconds=elapsed,
+            finish_reason=reason,
+        )
+        if tracker is not None:
+            tracker.generated_tokens = result.generated_tokens
+            result.draft_tokens = tracker.draft_tokens
+            result.accepted_draft_tokens = tracker.accepted_tokens
+        results.append(result)
+    return results
+
+
+class AsyncTextStreamer(TextStreamer):
+    """
+    Hands text decoded on the generation thread to a coroutine on the event loop.
+
+    Iterate with ``async for``; iteration ends once :meth:`close` is called.
+    The streamer also counts generated tokens and notes when the first arrived.
+    With ``stop`` strings, text that could be the start of one is held back
+    until it is known not to be, and nothing from a stop string on is sent.
+    """
+
+    def __init__(self, tokenizer, loop: asyncio.AbstractEventLoop, stop: Optional[List[str]] = None):
+        super().__init__(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.generated_tokens = 0
+        self.first_token_at: Optional[float] = None
+        self.cancelled = False
+        self.stop = [s for s in stop or () if s]
+        self.stopped = False
+        self._held = ""
+
+    def put(self, value):
+        if not (self.skip_prompt and self.next_tokens_are_prompt):
+            if self.first_token_at is None:
+                self.first_token_at = time.perf_counter()
+            self.generated_tokens += value.numel()
+        super().put(value)
+
+    def on_finalized_text(self, text: str, stream_end: bool = False):
+        if self.stop:
+            text = self._hold_back(text, stream_end)
+        if text:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, text)
+
+    def _hold_back(self, text: str, stream_end: bool) -> str:
+        if self.stopped:
+            return ""
+        self._held += text
+        cut = stop_index(self._held, self.stop)
+        if cut is not None:
+            self.stopped = True
+            text, self._held = self._held[:cut], ""
+            return text
+        keep = 0 if stream_end else max(len(s) for s in self.stop) - 1
+        split = max(0, len(self._held) - keep)
+        text, self._held = self._held[:split], self._held[split:]
+        return text
+
+    def close(self) -> None:
+        """Signal the consumer that no more text will arrive."""
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, None)
+
+    def cancel(self) -> None:
+        """Ask the generation loop to stop at the next token."""
+        self.cancelled = True
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        text = await self.queue.get()
+        if text is None:
+            raise StopAsyncIteration
+        return text
+
+
+class _StreamerCancelled(StoppingCriteria):
+    def __init__(self, streamer: AsyncTextStreamer):
+        self.streamer = streamer
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        return self.streamer.cancelled
+
+
+def generate_stream(model, tokenizer, request: GenerationRequest, streamer: AsyncTextStreamer,
+                    prefix_cache=None, draft_model=None, session_cache=None,
+                    repetition_penalty: float = 1.0) -> Dict[str, Any]:
+    """
+    Generate a completion for one request, pushing text to ``streamer`` as it is
+    decoded. Only the completion is streamed, not the prompt. Returns usage
+    counts and the finish reason once generation has finished, including draft
+    acceptance when a ``draft_model`` is used for assisted decoding.
+    """
+    started = time.perf_counter()
+    tracker = None
+    finish_reason = "length"
+    stopping = [_StreamerCancelled(streamer)]
+    try:
+        encoded = _encode(model, tokenizer, [request])
+        prompt_tokens = encoded["input_ids"].shape[1]
+        budget = request.budget(prompt_tokens)
+        if budget > 0:
+            criteria = row_stop_criteria(
+                tokenizer, prompt_tokens, [request.stop], [deadline(started, request.max_time_ms)]
+            )
+            if criteria is not None:
+                stopping.append(criteria)
+            extra, tracker = _single_row_kwargs(
+                model, encoded["input_ids"], prefix_cache, draft_model, session_cache, request.session_id
+            )
+            with tracker or contextlib.nullcontext():
+                outputs = model.generate(
+                    **encoded,
+                    max_new_tokens=budget,
+                    do_sample=True,
+                    temperature=1.0,
+                    logits_processor=_sampling_processors(
+                        [request.temperature], [seeded_generator(request.seed, model.device)]
+                    ),
+                    stopping_criteria=StoppingCriteriaList(stopping),
+                    repetition_penalty=repetition_penalty,
+                    pad_token_id=tokenizer.pad_token_id,
+                    streamer=streamer,
+                    **extra,
+                )
+            sequences = _keep_session(outputs, session_cache, request.session_id)
+            finish_reason = _finish_reason(sequences[0, prompt_tokens:], tokenizer.eos_token_id)
+            if criteria is not None and criteria.reasons[0] is not None:
+                finish_reason = criteria.reasons[0]
+    finally:
+        streamer.close()
+
+    elapsed = time.perf_counter() - started
+    first_token_at = streamer.first_token_at
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "generated_tokens": streamer.generated_tokens,
+        "time_to_first_token_ms": 1000 * (first_token_at - started) if first_token_at else None,
+        "total_time_ms": 1000 * elapsed,
+        "tokens_per_second": streamer.generated_tokens / elapsed if elapsed > 0 else 0.0,
+        "finish_reason": finish_reason,
+    }
+    if tracker is not None:
+        tracker.generated_tokens = streamer.generated_tokens
+        usage.update(tracker.stats())
+    return usage
@@ -0,0 +1,245 @@
+"""
+Prometheus metrics for the inference servers, rendered in the text exposition
+format without any extra dependency.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKENS_PER_SECOND_BUCKETS = (1, 5, 10, 20, 50, 100, 200, 500, 1000)
+RATIO_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """A value that only goes up, such as tokens generated."""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [("", _format_labels(self.labelnames, key), value) for key, value in items]
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, or is read from a callback at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Read the (unlabelled) value from ``function`` whenever metrics are rendered."""
+        self._function = function
+
+    def value(self, **labels) -> float:
+        if self._function is not None:
+            return self._function()
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        if self._function is not None:
+            return [("", "", float(self._function()))]
+        with self._lock:
+            items = sorted(self._values.items())
+        return [("", _format_labels(self.labelnames, key), value) for key, value in items]
+
+
+class Histogram(_Metric):
+    """Counts observations into cumulative buckets, plus their sum and count."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(self._key(labels), []))
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(counts), self._sums[key]) for key, counts in self._counts.items())
+        samples = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames + ("le",), key + (_format_value(bound),))
+                samples.append(("_bucket", labels, cumulative))
+            labels = _format_labels(self.labelnames, key)
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, cumulative))
+        return samples
+
+
+class ServingMetrics:
+    """The metrics both inference servers export, under the same names."""
+
+    def __init__(self):
+        self.request_latency = Histogram(
+            "llm_request_duration_seconds", "End-to-end request latency.", ["endpoint"])
+        self.time_to_first_token = Histogram(
+            "llm_time_to_first_token_seconds", "Time from request arrival to the first generated token.",
+            ["endpoint"])
+        self.prompt_tokens = Counter("llm_prompt_tokens_total", "Prompt tokens processed.", ["model"])
+        self.generated_tokens = Counter("llm_generated_tokens_total", "Tokens generated.", ["model"])
+        self.tokens_per_second = Histogram(
+            "llm_generation_tokens_per_second", "Generated tokens per second of generation time, per request.",
+            ["model"], buckets=TOKENS_PER_SECOND_BUCKETS)
+        self.in_flight = Gauge("llm_requests_in_flight", "Requests currently being handled.", ["endpoint"])
+        self.queue_depth = Gauge("llm_queue_depth", "Requests waiting for the model.")
+        self.errors = Counter("llm_request_errors_total", "Failed requests by error type.", ["endpoint", "type"])
+        self.model_load_seconds = Gauge(
+            "llm_model_load_seconds", "Seconds spent in each phase of loading a model.", ["model", "phase"])
+        self.draft_tokens = Counter(
+            "llm_draft_tokens_total", "Tokens proposed by the draft model in assisted decoding.", ["model"])
+        self.accepted_draft_tokens = Counter(
+            "llm_accepted_draft_tokens_total", "Draft tokens accepted by the served model.", ["model"])
+        self.draft_acceptance_rate = Histogram(
+            "llm_draft_acceptance_rate", "Fraction of draft tokens accepted, per request.",
+            ["model"], buckets=RATIO_BUCKETS)
+        self.worker_utilisation = Gauge(
+            "llm_worker_utilisation", "Fraction of time each inference worker process spent generating.",
+            ["model", "worker"])
+        self.worker_rss_bytes = Gauge(
+            "llm_worker_rss_bytes", "Resident memory of each inference worker process.", ["model", "worker"])
+        self.metrics: List[_Metric] = [
+            self.request_latency, self.time_to_first_token, self.prompt_tokens, self.generated_tokens,
+            self.tokens_per_second, self.in_flight, self.queue_depth, self.errors, self.model_load_seconds,
+            self.draft_tokens, self.accepted_draft_tokens, self.draft_acceptance_rate,
+            self.worker_utilisation, self.worker_rss_bytes,
+        ]
+
+    @contextmanager
+    def track_request(self, endpoint: str):
+        """Count a request as in flight, and record its latency and any error type."""
+        self.in_flight.inc(endpoint=endpoint)
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.record_error(endpoint, e)
+            raise
+        finally:
+            self.in_flight.dec(endpoint=endpoint)
+            self.request_latency.observe(time.perf_counter() - started, endpoint=endpoint)
+
+    def record_error(self, endpoint: str, error: Exception) -> None:
+        """Count a failure, by HTTP status for HTTP errors and by class name otherwise."""
+        status_code = getattr(error, "status_code", None)
+        self.errors.inc(endpoint=endpoint, type=f"http_{status_code}" if status_code else type(error).__name__)
+
+    def record_generation(self, model: str, prompt_tokens: int, generated_tokens: int, seconds: float) -> None:
+        self.prompt_tokens.inc(prompt_tokens, model=model)
+        self.generated_tokens.inc(generated_tokens, model=model)
+        if seconds > 0 and generated_tokens > 0:
+            self.tokens_per_second.observe(generated_tokens / seconds, model=model)
+
+    def record_draft(self, model: str, draft_tokens: int, accepted_tokens: int) -> None:
+        if draft_tokens <= 0:
+            return
+        self.draft_tokens.inc(draft_tokens, model=model)
+        self.accepted_draft_tokens.inc(accepted_tokens, model=model)
+        self.draft_acceptance_rate.observe(accepted_tokens / draft_tokens, model=model)
+
+    def record_load(self, model: str, timings: Dict[str, float]) -> None:
+        for phase, seconds in timings.items():
+            self.model_load_seconds.set(seconds, model=model, phase=phase)
+
+    def record_workers(self, model: str, stats: Dict) -> None:
+        """Set the worker gauges from :meth:`WorkerPool.stats`."""
+        for index, worker in enumerate(stats["workers"]):
+            self.worker_utilisation.set(worker["utilisation"], model=model, worker=str(index))
+            if worker["rss_bytes"] is not None:
+                self.worker_rss_bytes.set(worker["rss_bytes"], model=model, worker=str(index))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
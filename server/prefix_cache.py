@@ -0,0 +1,153 @@
+"""
+Shared-prefix key/value cache for prompts that start with the same text
+"""
+import copy
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import torch
+
+
+def kv_nbytes(past_key_values) -> int:
+    """Memory held by a model's past key/values, in bytes."""
+    if hasattr(past_key_values, "to_legacy_cache"):
+        past_key_values = past_key_values.to_legacy_cache()
+    return sum(
+        tensor.numel() * tensor.element_size()
+        for layer in past_key_values
+        for tensor in layer
+        if torch.is_tensor(tensor)
+    )
+
+
+def prefill(model, token_ids: List[int]):
+    """Run the model over ``token_ids`` and return the resulting key/values."""
+    input_ids = torch.tensor([token_ids], device=model.device)
+    with torch.no_grad():
+        return model(input_ids=input_ids, use_cache=True).past_key_values
+
+
+@dataclass
+class _Entry:
+    token_ids: Tuple[int, ...]
+    past_key_values: Any
+    nbytes: int
+
+
+class PrefixCache:
+    """
+    LRU cache of past key/values for token prefixes that many prompts share,
+    such as a fixed instruction block in front of every question.
+
+    Prefixes are tracked at ``block_size`` token boundaries. Once the same
+    block-aligned prefix has been seen ``min_hits`` times its key/values are
+    computed and kept, and later prompts starting with it only need their
+    remaining tokens prefilled. Entries are evicted least recently used first
+    to stay under ``max_bytes``.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024, block_size: int = 32,
+                 min_hits: int = 2, max_tracked_prefixes: int = 4096):
+        self.max_bytes = max_bytes
+        self.block_size = max(1, block_size)
+        self.min_hits = max(1, min_hits)
+        self.max_tracked_prefixes = max_tracked_prefixes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._seen: "OrderedDict[int, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _block_keys(self, token_ids: List[int]) -> List[Tuple[int, int]]:
+        """(prefix length, chained hash) for each block boundary, longest first."""
+        keys = []
+        key = 0
+        # Leave at least one token uncached: generate needs something to prefill
+        for end in range(self.block_size, len(token_ids), self.block_size):
+            key = hash((key, tuple(token_ids[end - self.block_size:end])))
+            keys.append((end, key))
+        keys.reverse()
+        return keys
+
+    def past_for(self, model, token_ids: List[int]) -> Tuple[int, Optional[Any]]:
+        """
+        Find (or build) cached key/values for the longest known prefix of
+        ``token_ids``.
+
+        Returns:
+            Tuple of the number of prompt tokens covered and a private copy of the
+            key/values to pass to ``model.generate``, or ``(0, None)`` on a miss.
+        """
+        keys = self._block_keys(token_ids)
+        hit = None
+        candidate = None
+        with self._lock:
+            for length, key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry.token_ids == tuple(token_ids[:length]):
+                    self._entries.move_to_end(key)
+                    hit = (length, entry)
+                    break
+            for length, key in keys:
+                if hit is not None and length <= hit[0]:
+                    break
+                count = self._seen.pop(key, 0) + 1
+                self._seen[key] = count
+                if candidate is None and count >= self.min_hits:
+                    candidate = (length, key)
+            while len(self._seen) > self.max_tracked_prefixes:
+                self._seen.popitem(last=False)
+
+        if candidate is not None:
+            length, key = candidate
+            past_key_values = prefill(model, token_ids[:length])
+            entry = _Entry(tuple(token_ids[:length]), past_key_values, kv_nbytes(past_key_values))
+            self._store(key, entry)
+            hit = (length, entry)
+
+        with self._lock:
+            if hit is None:
+                self.misses += 1
+                return 0, None
+            self.hits += 1
+            self.reused_tokens += hit[0]
+        return hit[0], copy.deepcopy(hit[1].past_key_values)
+
+    def _store(self, key: int, entry: _Entry) -> None:
+        if entry.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous.nbytes
+            self._entries[key] = entry
+            self.nbytes += entry.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._seen.clear()
+            self.nbytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit rate and memory use, as a JSON-friendly dict."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "reused_tokens": self.reused_tokens,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,144 @@
+"""
+Reduced-precision serving modes for CPU inference, with an accuracy/latency
+comparison against fp32.
+
+To compare precisions for a checkpoint:
+python -m server.quantize --model ./output
+"""
+import argparse
+import copy
+import json
+import time
+from typing import Any, Dict, List
+
+import torch
+from torch import nn
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from server.registry import model_nbytes
+
+PRECISIONS = ("fp32", "bf16", "int8")
+# fp16 only pays off on GPUs, so it is servable but not part of the CPU comparison
+SERVABLE_PRECISIONS = PRECISIONS + ("fp16",)
+
+DEFAULT_PROMPTS = [
+    "How should I handle a customer experiencing anxiety?",
+    "What are effective active listening techniques?",
+    "How can I show empathy to distressed customers?",
+    "What is trauma-informed care?",
+]
+
+
+def _conv1d_to_linear(model: nn.Module) -> nn.Module:
+    """
+    GPT-2 style checkpoints implement their projections with ``Conv1D``, which
+    dynamic quantization does not recognise. Swap each one for the equivalent
+    ``nn.Linear`` (``Conv1D`` stores its weight transposed).
+    """
+    from transformers.pytorch_utils import Conv1D
+
+    for module in list(model.modules()):
+        for child_name, child in list(module.named_children()):
+            if isinstance(child, Conv1D):
+                in_features, out_features = child.weight.shape
+                linear = nn.Linear(in_features, out_features)
+                linear.weight.data = child.weight.data.t().contiguous()
+                linear.bias.data = child.bias.data
+                setattr(module, child_name, linear)
+    return model
+
+
+def apply_precision(model: nn.Module, precision: str) -> nn.Module:
+    """
+    Convert a freshly loaded fp32 model for serving.
+
+    ``int8`` dynamically quantizes linear layers (weights stored as int8,
+    activations quantized on the fly); it only runs on CPU. ``bf16`` and
+    ``fp16`` cast all weights to bfloat16 or float16.
+    """
+    if precision == "fp32":
+        return model
+    if precision == "bf16":
+        return model.to(torch.bfloat16)
+    if precision == "fp16":
+        return model.to(torch.float16)
+    if precision == "int8":
+        model = _conv1d_to_linear(model)
+        return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    raise ValueError(f"Unknown precision {precision!r}; expected one of {', '.join(SERVABLE_PRECISIONS)}")
+
+
+def _greedy_tokens(model, tokenizer, prompt: str, max_new_tokens: int) -> Dict[str, Any]:
+    inputs = tokenizer(prompt, return_tensors="pt")
+    started = time.perf_counter()
+    outputs = model.generate(
+        **inputs,
+        max_new_tokens=max_new_tokens,
+        do_sample=False,
+        pad_token_id=tokenizer.eos_token_id if tokenizer.pad_token_id is None else tokenizer.pad_token_id,
+    )
+    elapsed = time.perf_counter() - started
+    return {"tokens": outputs[0, inputs["input_ids"].shape[1]:].tolist(), "seconds": elapsed}
+
+
+def _next_token_logprobs(model, tokenizer, prompt: str) -> torch.Tensor:
+    inputs = tokenizer(prompt, return_tensors="pt")
+    with torch.no_grad():
+        logits = model(**inputs).logits[0, -1].float()
+    return torch.log_softmax(logits, dim=-1)
+
+
+def compare_precisions(model_path: str, prompts: List[str] = None, precisions: List[str] = None,
+                       max_new_tokens: int = 32) -> Dict[str, Any]:
+    """
+    Run the same greedy generations at each precision and compare them to fp32.
+
+    For every precision reports mean latency, generated tokens/sec, model size,
+    the fraction of greedy tokens that match fp32, and the mean KL divergence of
+    the next-token distribution from fp32 on each prompt.
+    """
+    prompts = prompts or DEFAULT_PROMPTS
+    precisions = precisions or list(PRECISIONS)
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    base = AutoModelForCausalLM.from_pretrained(model_path).eval()
+
+    reference = {
+        "generations": [_greedy_tokens(base, tokenizer, p, max_new_tokens) for p in prompts],
+        "logprobs": [_next_token_logprobs(base, tokenizer, p) for p in prompts],
+    }
+
+    results = {}
+    for precision in precisions:
+        model = base if precision == "fp32" else apply_precision(copy.deepcopy(base), precision).eval()
+        generations = [_greedy_tokens(model, tokenizer, p, max_new_tokens) for p in prompts]
+
+        matched = total = 0
+        for ours, ref in zip(generations, reference["generations"]):
+            total += len(ref["tokens"])
+            matched += sum(1 for a, b in zip(ours["tokens"], ref["tokens"]) if a == b)
+        kl = [
+            torch.sum(ref.exp() * (ref - _next_token_logprobs(model, tokenizer, p))).item()
+            for p, ref in zip(prompts, reference["logprobs"])
+        ]
+        seconds = sum(g["seconds"] for g in generations)
+        tokens = sum(len(g["tokens"]) for g in generations)
+        results[precision] = {
+            "mean_latency_ms": 1000 * seconds / len(prompts),
+            "tokens_per_second": tokens / seconds if seconds > 0 else 0.0,
+            "model_mb": model_nbytes(model) / 2**20,
+            "greedy_token_agreement": matched / total if total else 1.0,
+            "mean_next_token_kl": sum(kl) / len(kl),
+        }
+    return {"model_path": model_path, "max_new_tokens": max_new_tokens, "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare reduced-precision serving modes against fp32")
+    parser.add_argument("--model", default="./output", help="Checkpoint directory")
+    parser.add_argument("--precisions", nargs="+", default=list(PRECISIONS), choices=PRECISIONS)
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    torch.set_grad_enabled(False)
+    report = compare_precisions(args.model, precisions=args.precisions, max_new_tokens=args.max_new_tokens)
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,283 @@
+"""
+Registry of served models with lazy loading and memory-bounded eviction
+"""
+import asyncio
+import gc
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from server.batching import BatchScheduler
+
+DEFAULT_MODEL = "default"
+
+WEIGHT_SUFFIXES = (".safetensors", ".bin", ".pt", ".pth")
+
+
+class ModelNotFoundError(LookupError):
+    """Raised when a request names a model the registry cannot find."""
+
+
+class ModelInUseError(RuntimeError):
+    """Raised when unloading a model that requests are still using."""
+
+
+def checkpoint_nbytes(model_path: str) -> int:
+    """Size of the weight files in a checkpoint directory, used to budget a load."""
+    if not os.path.isdir(model_path):
+        return 0
+    return sum(
+        os.path.getsize(os.path.join(model_path, name))
+        for name in os.listdir(model_path)
+        if name.endswith(WEIGHT_SUFFIXES)
+    )
+
+
+def model_nbytes(model) -> int:
+    """
+    Memory held by a loaded model's weights. Walks the state dict rather than
+    ``parameters()`` so dynamically quantized layers, whose packed int8 weights
+    are not parameters, are counted too; tied weights are counted once.
+    """
+    seen = set()
+    total = 0
+    pending = list(model.state_dict().values())
+    while pending:
+        value = pending.pop()
+        if isinstance(value, (tuple, list)):
+            pending.extend(value)
+        elif hasattr(value, "element_size") and value.data_ptr() not in seen:
+            seen.add(value.data_ptr())
+            total += value.numel() * value.element_size()
+    return total
+
+
+@dataclass
+class LoadedModel:
+    """A model that is resident in memory together with its per-model state."""
+    name: str
+    path: str
+    model: Any
+    tokenizer: Any
+    model_id: str
+    nbytes: int
+    scheduler: Optional[BatchScheduler] = None
+    # InferenceEngine generating from the model; holds its prefix and session
+    # caches and draft model
+    engine: Any = None
+    # Tokenized conversation turns, reused across requests
+    token_cache: Any = None
+    # Processes generating batches with shared weights, if configured
+    worker_pool: Any = None
+    # Seconds spent in each phase of loading, in order (tokenizer, weights, ...)
+    load_timings: Dict[str, float] = field(default_factory=dict)
+    loaded_at: float = field(default_factory=time.time)
+    active: int = 0
+
+
+class ModelRegistry:
+    """
+    Maps model names to checkpoints and keeps the recently used ones loaded.
+
+    The default model is served from ``default_path``; any other name refers to a
+    checkpoint directory directly under ``models_dir`` (for example one output
+    directory per training experiment). Checkpoints load on first use. Loading
+    is single-flight: concurrent first requests for a model all wait on the same
+    load. When loading would exceed ``memory_budget`` bytes, the least recently
+    used models without requests in progress are unloaded first.
+
+    ``load`` turns a checkpoint path into a :class:`LoadedModel` (without a
+    scheduler); ``make_scheduler`` builds the batch scheduler for it.
+    """
+
+    def __init__(
+        self,
+        default_path: str,
+        load: Callable[[str, str], LoadedModel],
+        make_scheduler: Callable[[LoadedModel], BatchScheduler],
+        models_dir: str = "",
+        memory_budget: int = 0,
+    ):
+        self.default_path = default_path
+        self.models_dir = models_dir
+        self.memory_budget = memory_budget
+        self.load = load
+        self.make_scheduler = make_scheduler
+        self.loads = 0
+        self.evictions = 0
+        self.load_errors: Dict[str, str] = {}
+        self._models: "OrderedDict[str, LoadedModel]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Task] = {}
+
+    def resolve_path(self, name: Optional[str]) -> str:
+        """Map a model name to its checkpoint directory."""
+        if not name or name == DEFAULT_MODEL:
+            return self.default_path
+        # Names are single directory entries; never let them walk the filesystem
+        if not self.models_dir or os.path.basename(name) != name or name.startswith("."):
+            raise ModelNotFoundError(f"Unknown model: {name}")
+        path = os.path.join(self.models_dir, name)
+        if not os.path.isdir(path):
+            raise ModelNotFoundError(f"Unknown model: {name}")
+        return path
+
+    def available(self) -> List[str]:
+        """Names of every model that can be served."""
+        names = [DEFAULT_MODEL]
+        if self.models_dir and os.path.isdir(self.models_dir):
+            names += sorted(
+                name for name in os.listdir(self.models_dir)
+                if os.path.isfile(os.path.join(self.models_dir, name, "config.json"))
+            )
+        return names
+
+    def loaded_model(self, name: Optional[str] = None) -> Optional[LoadedModel]:
+        """Return a model only if it is already resident; never triggers a load."""
+        return self._models.get(name or DEFAULT_MODEL)
+
+    @property
+    def loaded(self) -> List[LoadedModel]:
+        return list(self._models.values())
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(m.nbytes for m in self._models.values())
+
+    async def get(self, name: Optional[str] = None) -> LoadedModel:
+        """Return a loaded model, loading it first if needed."""
+        name = name or DEFAULT_MODEL
+        loaded = self._models.get(name)
+        if loaded is not None:
+            self._models.move_to_end(name)
+            return loaded
+
+        task = self._loading.get(name)
+        if task is None:
+            # The load runs as a task of its own: a caller that is cancelled
+            # (say its client disconnected) neither aborts it nor leaves the
+            # other callers waiting forever
+            task = asyncio.ensure_future(self._load_once(name))
+            # Mark a failure as retrieved even when every caller was cancelled
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._loading[name] = task
+        return await asyncio.shield(task)
+
+    async def _load_once(self, name: str) -> LoadedModel:
+        try:
+            loaded = await self._load(name)
+        except Exception as e:
+            self.load_errors[name] = str(e)
+            raise
+        else:
+            self.load_errors.pop(name, None)
+            return loaded
+        finally:
+            del self._loading[name]
+
+    async def hold(self, name: Optional[str] = None) -> LoadedModel:
+        """Return a loaded model that will not be unloaded until :meth:`release`."""
+        loaded = await self.get(name)
+        loaded.active += 1
+        return loaded
+
+    def release(self, loaded: LoadedModel) -> None:
+        """Let go of a model taken with :meth:`hold`."""
+        loaded.active -= 1
+
+    @asynccontextmanager
+    async def acquire(self, name: Optional[str] = None):
+        """Use a model for the duration of a request; it will not be unloaded meanwhile."""
+        loaded = await self.hold(name)
+        try:
+            yield loaded
+        finally:
+            self.release(loaded)
+
+    async def _load(self, name: str) -> LoadedModel:
+        path = self.resolve_path(name)
+        await self._make_room(checkpoint_nbytes(path), keep=name)
+
+        loop = asyncio.get_running_loop()
+        loaded = await loop.run_in_executor(None, self.load, name, path)
+        loaded.scheduler = self.make_scheduler(loaded)
+        await loaded.scheduler.start()
+        self._models[name] = loaded
+        self.loads += 1
+        phases = ", ".join(f"{k} {v:.2f}s" for k, v in loaded.load_timings.items())
+        print(f"Loaded model {name} from {path} ({loaded.nbytes / 2**20:.0f} MB; {phases or 'no timings'})")
+        # The on-disk size is only an estimate; settle the budget with the real one
+        await self._make_room(0, keep=name)
+        return loaded
+
+    async def _make_room(self, nbytes: int, keep: str) -> None:
+        if self.memory_budget <= 0:
+            return
+        for name in list(self._models):
+            if self.resident_bytes + nbytes <= self.memory_budget:
+                return
+            if name != keep and self._models[name].active == 0:
+                await self.unload(name)
+        if self.resident_bytes + nbytes > self.memory_budget:
+            print(f"Warning: loading {keep} exceeds the memory budget; remaining models are in use")
+
+    async def unload(self, name: str, force: bool = False) -> bool:
+        """
+        Unload a model and release its memory. Returns False if it was not
+        loaded. A model that requests still hold (see :meth:`hold`) is only
+        unloaded with ``force``; otherwise :class:`ModelInUseError` is raised.
+        """
+        loaded = self._models.get(name)
+        if loaded is None:
+            return False
+        if loaded.active > 0 and not force:
+            raise ModelInUseError(f"Model {name} is in use by {loaded.active} request(s)")
+        del self._models[name]
+        if loaded.scheduler is not None:
+            await loaded.scheduler.stop()
+        if loaded.worker_pool is not None:
+            loaded.worker_pool.close()
+            loaded.worker_pool = None
+        loaded.model = None
+        loaded.engine = None
+        self.evictions += 1
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+        print(f"Unloaded model {name}")
+        return True
+
+    async def close(self) -> None:
+        loading = list(self._loading.values())
+        for task in loading:
+            task.cancel()
+        await asyncio.gather(*loading, return_exceptions=True)
+        for name in list(self._models):
+            await self.unload(name, force=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Loaded models, memory use and load/eviction counts."""
+        return {
+            "available": self.available(),
+            "loaded": {
+                m.name: {
+                    "path": m.path,
+                    "model_id": m.model_id,
+                    "bytes": m.nbytes,
+                    "active_requests": m.active,
+                    "loaded_at": m.loaded_at,
+                    "load_timings_ms": {k: 1000 * v for k, v in m.load_timings.items()},
+                }
+                for m in self._models.values()
+            },
+            "resident_bytes": self.resident_bytes,
+            "memory_budget": self.memory_budget,
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,93 @@
+"""
+Response cache for deterministic chat requests
+"""
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+def checkpoint_fingerprint(model_path: str) -> str:
+    """
+    Identify the files of a checkpoint directory by name, size and modification
+    time, so responses cached for one checkpoint are never served for another.
+    """
+    entries = []
+    if os.path.isdir(model_path):
+        for name in sorted(os.listdir(model_path)):
+            path = os.path.join(model_path, name)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                entries.append((name, stat.st_size, stat.st_mtime_ns))
+    digest = hashlib.sha256(json.dumps([model_path, entries]).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class ResponseCache:
+    """
+    LRU cache with a time-to-live for generated responses.
+
+    Only responses that are reproducible should be stored: greedy decoding
+    (temperature 0) or sampling with an explicit seed.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    @staticmethod
+    def make_key(payload: Dict[str, Any]) -> str:
+        """Hash a request payload into a cache key, independent of dict ordering."""
+        encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if self.clock() >= expires_at:
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self._entries.pop(key, None)
+        self._entries[key] = (self.clock() + self.ttl_seconds, value)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> int:
+        """Drop every entry, e.g. after the model checkpoint changed. Returns how many."""
+        cleared = len(self._entries)
+        self._entries.clear()
+        return cleared
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit rate and eviction counters, as a JSON-friendly dict."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -1,58 +1,506 @@
-from typing import List
+import asyncio
+import functools
+import json
+import os
+import sys
+import time
+import uuid
+from typing import List, Optional, Tuple, Union
 
-import torch
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
+
+# Add the project root to the path so we can import from server
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.batching import BatchScheduler
+from server.config import ServerConfig
+from server.context import ContextWindow, TokenCache, context_length
+from server.engine import InferenceEngine
+from server.executor import InferenceExecutor, OverloadedError
+from server.generation import AsyncTextStreamer, GenerationRequest, GenerationResult
+from server.metrics import CONTENT_TYPE, ServingMetrics
+from server.prefix_cache import PrefixCache
+from server.registry import DEFAULT_MODEL, LoadedModel, ModelInUseError, ModelNotFoundError, ModelRegistry
+from server.response_cache import ResponseCache, checkpoint_fingerprint
+from server.session_cache import SessionCache
+from server.worker_pool import WorkerPool
 
 app = FastAPI(title="LLM Chat API")
 
-# Model and tokenizer will be loaded at startup
-model = None
-tokenizer = None
+config = ServerConfig.from_env()
+
+# Each worker process can run a batch at the same time
+executor = InferenceExecutor(max_in_flight=max(config.max_in_flight, config.workers), max_queue=config.max_queue)
+response_cache = (
+    ResponseCache(max_entries=config.response_cache_size, ttl_seconds=config.response_cache_ttl)
+    if config.response_cache_size > 0 else None
+)
+metrics = ServingMetrics()
 
 class ChatRequest(BaseModel):
     messages: List[str]
     max_length: int = 100
     temperature: float = 0.7
+    seed: Optional[int] = None
+    model: Optional[str] = None
+    # Tokens to generate, however long the conversation; overrides max_length
+    max_new_tokens: Optional[int] = None
+    # Keep this conversation's key/values between turns so each turn only
+    # prefills the messages it adds
+    session_id: Optional[str] = None
+    # Strings that end the completion (left out of it), and a wall-clock cap
+    stop: Optional[List[str]] = None
+    max_time_ms: Optional[float] = Field(default=None, gt=0)
 
 class ChatResponse(BaseModel):
     response: str
+    # "stop", "length" or "time"
+    finish_reason: Optional[str] = None
+
+class ChatMessage(BaseModel):
+    role: str
+    content: str
+
+class ChatCompletionRequest(BaseModel):
+    """The subset of the OpenAI chat completions request the local model supports"""
+    messages: List[ChatMessage] = Field(min_length=1)
+    model: Optional[str] = None
+    max_tokens: Optional[int] = Field(default=None, ge=1)
+    max_completion_tokens: Optional[int] = Field(default=None, ge=1)
+    temperature: float = 1.0
+    n: int = Field(default=1, ge=1, le=16)
+    seed: Optional[int] = None
+    stream: bool = False
+    stop: Optional[Union[str, List[str]]] = None
+    # Not part of the OpenAI API: wall-clock cap on generation
+    max_time_ms: Optional[float] = Field(default=None, gt=0)
+
+def load_model(name: str, model_path: str) -> LoadedModel:
+    # With worker processes, each of them and this process get a share of the
+    # prefix cache budget
+    make_prefix_cache = (
+        functools.partial(
+            PrefixCache,
+            max_bytes=config.prefix_cache_mb * 1024 * 1024 // (config.workers + 1),
+            block_size=config.prefix_block_size,
+        )
+        if config.prefix_cache_mb > 0 else None
+    )
+    prefix_cache = make_prefix_cache() if make_prefix_cache is not None else None
+    session_cache = (
+        SessionCache(
+            max_bytes=config.session_cache_mb * 1024 * 1024,
+            max_session_bytes=config.session_max_mb * 1024 * 1024,
+            idle_seconds=config.session_idle_seconds,
+        )
+        if config.session_cache_mb > 0 else None
+    )
+    engine = InferenceEngine.load(
+        model_path,
+        name=name,
+        precision=config.precision,
+        draft_model_path=config.draft_model_path,
+        warmup_prompt=config.warmup_prompt,
+        warmup_tokens=config.warmup_tokens,
+        prefix_cache=prefix_cache,
+        session_cache=session_cache,
+    )
+    timings = engine.load_timings
+    worker_pool = None
+    if config.workers > 0:
+        started = time.perf_counter()
+        worker_pool = WorkerPool(
+            engine.model, engine.tokenizer, config.workers, num_threads=config.worker_threads,
+            draft_model=engine.draft_model, repetition_penalty=engine.repetition_penalty,
+            make_prefix_cache=make_prefix_cache,
+        )
+        timings["workers"] = time.perf_counter() - started
+    metrics.record_load(name, timings)
+
+    return LoadedModel(
+        name=name,
+        path=model_path,
+        model=engine.model,
+        tokenizer=engine.tokenizer,
+        model_id=f"{checkpoint_fingerprint(model_path)}-{config.precision}",
+        nbytes=engine.nbytes,
+        engine=engine,
+        token_cache=TokenCache(engine.tokenizer, max_entries=config.token_cache_size),
+        worker_pool=worker_pool,
+        load_timings=timings,
+    )
+
+def make_scheduler(loaded: LoadedModel) -> BatchScheduler:
+    def observe_first_token(requests: List[GenerationRequest], at: float) -> None:
+        for r in requests:
+            metrics.time_to_first_token.observe(at - r.submitted_at, endpoint="/chat")
+
+    def run_batch(requests: List[GenerationRequest]) -> List[GenerationResult]:
+        pool = loaded.worker_pool
+        # Session key/values live in this process's session cache, so requests
+        # with a session_id are generated here; the rest go to a worker
+        local = [i for i, r in enumerate(requests) if pool is None or r.session_id is not None]
+        remote = [i for i, r in enumerate(requests) if pool is not None and r.session_id is None]
+        results: List[Optional[GenerationResult]] = [None] * len(requests)
+        pending = None
+        if remote:
+            pooled = [requests[i] for i in remote]
+            pending = pool.submit(pooled, on_first_token=functools.partial(observe_first_token, pooled))
+        if local:
+            batch = [requests[i] for i in local]
+            generated = loaded.engine.generate(
+                batch, on_first_token=lambda: observe_first_token(batch, time.perf_counter())
+            )
+            for i, result in zip(local, generated):
+                results[i] = result
+        if pending is not None:
+            for i, result in zip(remote, pending.result()):
+                results[i] = result
+        return results
+
+    return BatchScheduler(
+        run_batch,
+        max_batch_size=config.max_batch_size,
+        max_wait_ms=config.max_wait_ms,
+        max_queue_size=config.max_queue,
+        executor=executor,
+    )
+
+registry = ModelRegistry(
+    default_path=config.model_path,
+    load=load_model,
+    make_scheduler=make_scheduler,
+    models_dir=config.models_dir,
+    memory_budget=config.memory_budget_mb * 1024 * 1024,
+)
+
+# Requests waiting for a batch or for an execution slot, read at scrape time
+metrics.queue_depth.set_function(
+    lambda: sum(loaded.scheduler.queue_depth for loaded in registry.loaded) + executor.waiting
+)
+
+startup_task = None
 
 @app.on_event("startup")
 async def startup_event():
-    global model, tokenizer
-    model_path = "./output"  # Path to your trained model
-    model = AutoModelForCausalLM.from_pretrained(model_path)
-    tokenizer = AutoTokenizer.from_pretrained(model_path)
-    if torch.cuda.is_available():
-        model = model.cuda()
+    global startup_task
+    # Load the default model in the background so /healthz answers right away;
+    # /readyz reports when it is loaded and warmed. Other models load on first use.
+    startup_task = asyncio.create_task(registry.get())
+    startup_task.add_done_callback(report_startup)
+
+def report_startup(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Error loading default model: {task.exception()}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if startup_task is not None and not startup_task.done():
+        startup_task.cancel()
+    await registry.close()
+    executor.shutdown()
+
+@app.exception_handler(OverloadedError)
+async def overloaded_handler(request, exc: OverloadedError):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(ModelNotFoundError)
+async def model_not_found_handler(request, exc: ModelNotFoundError):
+    return JSONResponse(status_code=404, content={"detail": str(exc)})
+
+@app.exception_handler(ModelInUseError)
+async def model_in_use_handler(request, exc: ModelInUseError):
+    return JSONResponse(status_code=409, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving HTTP"""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: the default model is loaded and warmed up"""
+    default = registry.loaded_model()
+    if default is not None:
+        return {
+            "status": "ready",
+            "model": default.path,
+            "load_timings_ms": {k: 1000 * v for k, v in default.load_timings.items()},
+        }
+    error = registry.load_errors.get(DEFAULT_MODEL)
+    return JSONResponse(
+        status_code=503,
+        content={"status": "failed" if error else "loading", "error": error},
+        headers={"Retry-After": "5"},
+    )
+
+def time_budget(max_time_ms: Optional[float]) -> Optional[float]:
+    """The request's generation time cap, no longer than SERVE_MAX_TIME_MS."""
+    limits = [t for t in (max_time_ms, config.max_time_ms) if t]
+    return min(limits) if limits else None
+
+def windowed_request(loaded: LoadedModel, request: ChatRequest) -> Tuple[GenerationRequest, ContextWindow]:
+    """
+    Fit the conversation into the prompt budget, dropping its oldest turns, and
+    build the generation request from the cached per-turn token ids.
+    """
+    budget = config.max_prompt_tokens or None
+    limit = context_length(loaded.model)
+    if limit is not None:
+        room = limit - (request.max_new_tokens or 1)
+        budget = room if budget is None else min(budget, room)
+    window = loaded.token_cache.window(request.messages, budget)
+    return GenerationRequest(
+        prompt=" ".join(request.messages),
+        max_length=request.max_length,
+        temperature=request.temperature,
+        seed=request.seed,
+        prompt_ids=window.input_ids,
+        max_new_tokens=request.max_new_tokens,
+        session_id=request.session_id,
+        stop=request.stop,
+        max_time_ms=time_budget(request.max_time_ms),
+    ), window
 
 @app.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
-    try:
-        # Prepare input
-        input_text = " ".join(request.messages)
-        inputs = tokenizer(input_text, return_tensors="pt")
-        
-        if torch.cuda.is_available():
-            inputs = {k: v.cuda() for k, v in inputs.items()}
-
-        # Generate response
-        outputs = model.generate(
-            **inputs,
-            max_length=request.max_length,
-            temperature=request.temperature,
-            do_sample=True,
+    with metrics.track_request("/chat"):
+        return await generate_chat(request)
+
+async def generate_chat(request: ChatRequest) -> ChatResponse:
+    prompt = " ".join(request.messages)
+    async with registry.acquire(request.model) as loaded:
+        cache_key = None
+        # Only greedy or explicitly seeded generations are reproducible, and
+        # only if they are not cut short by the clock
+        deterministic = request.temperature <= 0 or request.seed is not None
+        if response_cache is not None and deterministic and time_budget(request.max_time_ms) is None:
+            cache_key = ResponseCache.make_key({
+                "model": loaded.model_id,
+                "prompt": prompt,
+                "max_length": request.max_length,
+                "max_new_tokens": request.max_new_tokens,
+                "temperature": max(request.temperature, 0.0),
+                "seed": request.seed,
+                "stop": request.stop,
+            })
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                text, finish_reason = cached
+                return ChatResponse(response=text, finish_reason=finish_reason)
+        try:
+            generation_request, _ = windowed_request(loaded, request)
+            result = await loaded.scheduler.submit(generation_request)
+            metrics.record_generation(
+                loaded.name, result.prompt_tokens, result.generated_tokens, result.generation_seconds
+            )
+            metrics.record_draft(loaded.name, result.draft_tokens, result.accepted_draft_tokens)
+            if cache_key is not None:
+                response_cache.set(cache_key, (result.text, result.finish_reason))
+            return ChatResponse(response=result.text, finish_reason=result.finish_reason)
+
+        except OverloadedError:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: ChatCompletionRequest):
+    """
+    OpenAI-compatible chat completions. Messages are rendered with the model's
+    chat template; with n > 1 the prompt is prefilled once and all completions
+    are sampled together as one batch.
+    """
+    with metrics.track_request("/v1/chat/completions"):
+        if request.stream:
+            raise HTTPException(status_code=400, detail="stream is not supported; use /chat/stream")
+        max_new_tokens = next(
+            (t for t in (request.max_completion_tokens, request.max_tokens) if t is not None), 100
         )
+        stop = [request.stop] if isinstance(request.stop, str) else request.stop
+        async with registry.acquire(request.model) as loaded:
+            prompt = loaded.engine.chat_prompt([m.model_dump() for m in request.messages])
+            submitted_at = time.perf_counter()
+            results = await executor.run(
+                loaded.engine.complete, prompt,
+                n=request.n,
+                max_new_tokens=max_new_tokens,
+                temperature=request.temperature,
+                seed=request.seed,
+                on_first_token=lambda: metrics.time_to_first_token.observe(
+                    time.perf_counter() - submitted_at, endpoint="/v1/chat/completions"
+                ),
+                stop=stop,
+                max_time_ms=time_budget(request.max_time_ms),
+            )
+            prompt_tokens = results[0].prompt_tokens
+            completion_tokens = sum(r.generated_tokens for r in results)
+            metrics.record_generation(loaded.name, prompt_tokens, completion_tokens, results[0].generation_seconds)
+            metrics.record_draft(loaded.name, results[0].draft_tokens, results[0].accepted_draft_tokens)
+            return {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": loaded.name,
+                "choices": [
+                    {
+                        "index": i,
+                        "message": {"role": "assistant", "content": r.text},
+                        # OpenAI clients know no "time"; a cut-short completion is "length"
+                        "finish_reason": "length" if r.finish_reason == "time" else r.finish_reason,
+                    }
+                    for i, r in enumerate(results)
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            }
 
-        # Decode and return response
-        response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-        return ChatResponse(response=response)
+def sse_event(payload: dict) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Stream the completion as server-sent events: one {"token": ...} event per
+    decoded chunk, then a {"usage": ...} event and a final [DONE] marker.
+    """
+    # Hold the model and a place in the queue before the response starts;
+    # once streaming, the status code is fixed
+    try:
+        loaded = await registry.hold(request.model)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        metrics.record_error("/chat/stream", e)
+        raise
+    try:
+        executor.enqueue()
+    except Exception as e:
+        registry.release(loaded)
+        metrics.record_error("/chat/stream", e)
+        raise
+    queued, held = True, True
+
+    def release():
+        # Runs when the stream ends, and again as the response's background
+        # task in case the client left before the stream started
+        nonlocal queued, held
+        if queued:
+            queued = False
+            executor.dequeue()
+        if held:
+            held = False
+            registry.release(loaded)
+
+    try:
+        generation_request, window = windowed_request(loaded, request)
+    except Exception as e:
+        release()
+        metrics.record_error("/chat/stream", e)
+        raise
+
+    async def events():
+        nonlocal queued
+        # Latency covers the whole stream, until the last event is sent
+        with metrics.track_request("/chat/stream"):
+            try:
+                # The slot takes over the queue place
+                queued = False
+                async with executor.slot(enqueued=True):
+                    streamer = AsyncTextStreamer(
+                        loaded.tokenizer, asyncio.get_running_loop(), stop=generation_request.stop
+                    )
+                    task = asyncio.ensure_future(executor.call(loaded.engine.stream, generation_request, streamer))
+                    try:
+                        async for text in streamer:
+                            yield sse_event({"token": text})
+                        usage = await task
+                        if streamer.first_token_at is not None:
+                            metrics.time_to_first_token.observe(
+                                streamer.first_token_at - generation_request.submitted_at, endpoint="/chat/stream"
+                            )
+                        metrics.record_generation(
+                            loaded.name, usage["prompt_tokens"], usage["generated_tokens"],
+                            usage["total_time_ms"] / 1000,
+                        )
+                        metrics.record_draft(
+                            loaded.name, usage.get("draft_tokens", 0), usage.get("accepted_draft_tokens", 0)
+                        )
+                        usage["dropped_messages"] = window.dropped_messages
+                        yield sse_event({"usage": usage})
+                    except Exception as e:
+                        metrics.record_error("/chat/stream", e)
+                        yield sse_event({"error": str(e)})
+                    finally:
+                        # The client may have disconnected; stop generating and free the slot
+                        streamer.cancel()
+                        await asyncio.gather(task, return_exceptions=True)
+            finally:
+                release()
+            yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", background=BackgroundTask(release))
+
+@app.get("/stats")
+async def stats():
+    """Batch sizes and queue wait, for tuning SERVE_MAX_BATCH_SIZE / SERVE_MAX_WAIT_MS"""
+    return {
+        "models": {
+            loaded.name: {
+                "batching": loaded.scheduler.stats.to_dict(),
+                "queue_depth": loaded.scheduler.queue_depth,
+                "prefix_cache": loaded.engine.prefix_cache.stats() if loaded.engine.prefix_cache is not None else None,
+                "token_cache": loaded.token_cache.stats() if loaded.token_cache is not None else None,
+                "session_cache": (
+                    loaded.engine.session_cache.stats() if loaded.engine.session_cache is not None else None
+                ),
+                "workers": loaded.worker_pool.stats() if loaded.worker_pool is not None else None,
+            }
+            for loaded in registry.loaded
+        },
+        "in_flight": executor.in_flight,
+        "response_cache": response_cache.stats() if response_cache is not None else None,
+    }
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Latency, time-to-first-token, token throughput and queue depth in Prometheus text format"""
+    for loaded in registry.loaded:
+        if loaded.worker_pool is not None:
+            metrics.record_workers(loaded.name, loaded.worker_pool.stats())
+    return Response(content=metrics.render(), media_type=CONTENT_TYPE)
+
+@app.get("/models")
+async def models():
+    """Servable models, which of them are loaded, and memory use"""
+    return registry.stats()
+
+@app.post("/models/{name}/unload")
+async def unload_model(name: str):
+    """Unload a model; 409 while requests are still using it"""
+    if not await registry.unload(name):
+        raise HTTPException(status_code=404, detail=f"Model {name} is not loaded")
+    return {"unloaded": name}
+
+@app.post("/cache/clear")
+async def clear_cache():
+    """Drop cached responses and prefix/session key/values, e.g. after replacing the checkpoint"""
+    cleared = response_cache.clear() if response_cache is not None else 0
+    for loaded in registry.loaded:
+        if loaded.engine.prefix_cache is not None:
+            loaded.engine.prefix_cache.clear()
+        if loaded.engine.session_cache is not None:
+            loaded.engine.session_cache.clear()
+    return {"cleared_responses": cleared}
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,147 @@
+"""
+Per-session key/value cache for multi-turn conversations
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from server.prefix_cache import kv_nbytes
+
+
+def kv_length(past_key_values) -> int:
+    """Number of positions held in a model's past key/values."""
+    if hasattr(past_key_values, "get_seq_length"):
+        return past_key_values.get_seq_length()
+    return past_key_values[0][0].shape[-2]
+
+
+def crop_kv(past_key_values, length: int):
+    """Keep only the first ``length`` positions of past key/values."""
+    if hasattr(past_key_values, "crop"):
+        past_key_values.crop(length)
+        return past_key_values
+    return tuple(tuple(tensor[..., :length, :] for tensor in layer) for layer in past_key_values)
+
+
+def _common_prefix(a: List[int], b: List[int]) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+@dataclass
+class _Session:
+    token_ids: List[int]
+    past_key_values: Any
+    nbytes: int
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class SessionCache:
+    """
+    Keeps the key/values of each chat session's last turn so the next turn only
+    prefills the tokens it appends.
+
+    A session's entry is handed to the request that uses it (generation extends
+    it in place) and stored again, longer, once that request finishes. Entries
+    over ``max_session_bytes`` are not kept; beyond ``max_bytes`` in total the
+    least recently used sessions are evicted, and sessions idle for
+    ``idle_seconds`` are dropped.
+    """
+
+    def __init__(self, max_bytes: int = 1024 * 1024 * 1024, max_session_bytes: int = 128 * 1024 * 1024,
+                 idle_seconds: float = 600.0, clock: Callable[[], float] = time.monotonic):
+        self.max_bytes = max_bytes
+        self.max_session_bytes = max_session_bytes
+        self.idle_seconds = idle_seconds
+        self.clock = clock
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _pop(self, session_id: str) -> Optional[_Session]:
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self.nbytes -= session.nbytes
+        return session
+
+    def _expire(self) -> None:
+        now = self.clock()
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_used < self.idle_seconds:
+                break
+            self._pop(session_id)
+            self.expirations += 1
+
+    def take(self, session_id: str, token_ids: List[int]) -> Tuple[int, Optional[Any]]:
+        """
+        Remove and return the session's key/values, cut back to the part the
+        new prompt ``token_ids`` starts with.
+
+        Returns:
+            Tuple of the number of prompt tokens covered and the key/values, or
+            ``(0, None)`` if nothing can be reused.
+        """
+        with self._lock:
+            self._expire()
+            session = self._pop(session_id)
+        # Leave at least one token uncached: generate needs something to prefill
+        covered = min(_common_prefix(session.token_ids, token_ids), len(token_ids) - 1) if session else 0
+        if covered <= 0:
+            self.misses += 1
+            return 0, None
+        self.hits += 1
+        self.reused_tokens += covered
+        past_key_values = session.past_key_values
+        if covered < kv_length(past_key_values):
+            past_key_values = crop_kv(past_key_values, covered)
+        return covered, past_key_values
+
+    def store(self, session_id: str, token_ids: List[int], past_key_values) -> None:
+        """Keep the key/values computed for ``token_ids`` for the session's next turn."""
+        length = kv_length(past_key_values)
+        nbytes = kv_nbytes(past_key_values)
+        if nbytes > self.max_session_bytes or nbytes > self.max_bytes:
+            return
+        with self._lock:
+            self._pop(session_id)
+            self._sessions[session_id] = _Session(list(token_ids[:length]), past_key_values, nbytes, self.clock())
+            self.nbytes += nbytes
+            self._expire()
+            while self.nbytes > self.max_bytes:
+                evicted_id = next(iter(self._sessions))
+                self._pop(evicted_id)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+            self.nbytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit rate and memory use, as a JSON-friendly dict."""
+        with self._lock:
+            self._expire()
+        lookups = self.hits + self.misses
+        return {
+            "sessions": len(self._sessions),
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "reused_tokens": self.reused_tokens,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,81 @@
+"""
+Assisted (speculative) decoding with a small draft model
+"""
+import threading
+from typing import Any, Dict
+
+
+def draft_compatible(model, draft_model) -> bool:
+    """A draft model can only propose tokens for a model with the same vocabulary."""
+    return model.config.vocab_size == draft_model.config.vocab_size
+
+
+class ForwardCounter:
+    """
+    Counts forward passes of a module made from the current thread while active.
+
+    The served model may run generations for other requests on other threads at
+    the same time; counting per thread keeps each request's numbers its own.
+    """
+
+    def __init__(self, module):
+        self.module = module
+        self.count = 0
+        self._thread = threading.get_ident()
+        self._handle = None
+
+    def _hook(self, module, inputs, output):
+        if threading.get_ident() == self._thread:
+            self.count += 1
+
+    def __enter__(self) -> "ForwardCounter":
+        self._thread = threading.get_ident()
+        self._handle = self.module.register_forward_hook(self._hook)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._handle.remove()
+
+
+class AcceptanceTracker:
+    """
+    Measures how many draft tokens the served model accepted during one
+    ``model.generate(assistant_model=...)`` call.
+
+    Every assisted step runs the draft model once per proposed token and the
+    served model once to verify them; the served model then keeps the accepted
+    tokens plus one of its own. So over a generation
+    ``accepted = generated - verification passes`` and
+    ``proposed = draft passes``.
+    """
+
+    def __init__(self, model, draft_model):
+        self._verify = ForwardCounter(model)
+        self._draft = ForwardCounter(draft_model)
+        self.generated_tokens = 0
+
+    def __enter__(self) -> "AcceptanceTracker":
+        self._verify.__enter__()
+        self._draft.__enter__()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._draft.__exit__(*exc_info)
+        self._verify.__exit__(*exc_info)
+
+    @property
+    def draft_tokens(self) -> int:
+        return self._draft.count
+
+    @property
+    def accepted_tokens(self) -> int:
+        return max(0, min(self.generated_tokens - self._verify.count, self._draft.count))
+
+    def stats(self) -> Dict[str, Any]:
+        """Draft tokens proposed and accepted, and the acceptance rate."""
+        return {
+            "draft_tokens": self.draft_tokens,
+            "accepted_draft_tokens": self.accepted_tokens,
+            "acceptance_rate": self.accepted_tokens / self.draft_tokens if self.draft_tokens else 0.0,
+        }
+
@@ -0,0 +1,73 @@
+"""
+Stop sequences and wall-clock budgets enforced inside the decode loop
+"""
+import time
+from typing import List, Optional, Sequence
+
+import torch
+from transformers import StoppingCriteria
+
+
+def stop_index(text: str, stops: Optional[Sequence[str]]) -> Optional[int]:
+    """Position of the earliest stop string in ``text``, or None if there is none."""
+    found = [text.find(stop) for stop in stops or () if stop and stop in text]
+    return min(found) if found else None
+
+
+def deadline(started: float, max_time_ms: Optional[float]) -> Optional[float]:
+    """``time.perf_counter()`` value by which generation must stop, if limited."""
+    return started + max_time_ms / 1000 if max_time_ms else None
+
+
+class RowStopCriteria(StoppingCriteria):
+    """
+    Ends each row of a batch on its own stop strings or deadline.
+
+    Returns one flag per row (transformers 4.39+), so a finished row is padded
+    while the others keep generating. For every row it ended, ``reasons`` holds
+    ``"stop"`` or ``"time"`` and ``stopped_at`` the number of tokens the row had
+    generated by then. Only the tokens added since the last check, plus enough
+    before them to hold the longest stop string, are decoded each step.
+    """
+
+    def __init__(self, tokenizer, prompt_width: int, stops: List[Optional[Sequence[str]]],
+                 deadlines: List[Optional[float]]):
+        self.tokenizer = tokenizer
+        self.prompt_width = prompt_width
+        self.stops = [[s for s in row or () if s] for row in stops]
+        self.deadlines = deadlines
+        self.longest_stop = max((len(s) for row in self.stops for s in row), default=0)
+        self.reasons: List[Optional[str]] = [None] * len(stops)
+        self.stopped_at: List[Optional[int]] = [None] * len(stops)
+        self._checked_length = prompt_width
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        now = time.perf_counter()
+        length = input_ids.shape[1]
+        # Every token decodes to at least one character, so a stop string
+        # completed by the new tokens starts within this many tokens of the end
+        window = length - self._checked_length + self.longest_stop + 1
+        self._checked_length = length
+        done = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+        for row in range(input_ids.shape[0]):
+            if self.reasons[row] is None:
+                row_deadline = self.deadlines[row]
+                if row_deadline is not None and now >= row_deadline:
+                    self.reasons[row] = "time"
+                elif self.stops[row]:
+                    start = max(self.prompt_width, length - window)
+                    tail = self.tokenizer.decode(input_ids[row, start:], skip_special_tokens=True)
+                    if stop_index(tail, self.stops[row]) is not None:
+                        self.reasons[row] = "stop"
+                if self.reasons[row] is not None:
+                    self.stopped_at[row] = length - self.prompt_width
+            done[row] = self.reasons[row] is not None
+        return done
+
+
+def row_stop_criteria(tokenizer, prompt_width: int, stops: List[Optional[Sequence[str]]],
+                      deadlines: List[Optional[float]]) -> Optional[RowStopCriteria]:
+    """A :class:`RowStopCriteria`, or None when no row has a stop string or deadline."""
+    if not any(stops) and all(d is None for d in deadlines):
+        return None
+    return RowStopCriteria(tokenizer, prompt_width, stops, deadlines)
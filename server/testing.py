@@ -0,0 +1,53 @@
+"""
+A tiny randomly initialised model for tests, benchmarks and local runs
+
+Nothing is downloaded: ``build_tiny_model`` saves a small GPT-2 and a word-level
+tokenizer whose words ``w0``, ``w1``, ... are one token each, so prompts built
+with ``make_prompt`` have a known length.
+"""
+import random
+from typing import List
+
+EOS_TOKEN = "<|endoftext|>"
+UNK_TOKEN = "[UNK]"
+
+
+def percentile(values: List[float], q: float) -> float:
+    """The ``q``-th percentile (0-100) of ``values``, interpolating between ranks."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def vocabulary(size: int) -> List[str]:
+    return [f"w{i}" for i in range(size)]
+
+
+def build_tiny_model(path: str, vocab_size: int = 1000, layers: int = 2, hidden: int = 64,
+                     heads: int = 2, max_positions: int = 1024) -> None:
+    """Save a randomly initialised GPT-2 and a matching word-level tokenizer to ``path``."""
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+
+    vocab = {EOS_TOKEN: 0, UNK_TOKEN: 1}
+    for word in vocabulary(vocab_size - len(vocab)):
+        vocab[word] = len(vocab)
+    backend = Tokenizer(models.WordLevel(vocab, unk_token=UNK_TOKEN))
+    backend.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=backend, eos_token=EOS_TOKEN, unk_token=UNK_TOKEN)
+    tokenizer.save_pretrained(path)
+
+    config = GPT2Config(
+        vocab_size=len(vocab), n_positions=max_positions, n_embd=hidden, n_layer=layers, n_head=heads,
+        bos_token_id=0, eos_token_id=0,
+    )
+    GPT2LMHeadModel(config).save_pretrained(path)
+
+
+def make_prompt(rng: random.Random, words: List[str], prompt_tokens: int) -> str:
+    # Every word is a single token of the tiny tokenizer
+    return " ".join(rng.choice(words) for _ in range(prompt_tokens))
@@ -0,0 +1,258 @@
+"""
+Multi-process inference workers sharing one copy of the model weights
+"""
+import itertools
+import os
+import pickle
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import torch
+import torch.multiprocessing as mp
+
+from server.generation import GenerationRequest, GenerationResult, generate_batch
+
+_READY = "ready"
+
+
+def process_memory(pid: int) -> Dict[str, Optional[int]]:
+    """
+    Resident (RSS) and proportional (PSS) memory of a process, in bytes.
+
+    PSS divides shared pages between the processes mapping them, so summing it
+    over the workers shows what the weights really cost. Only Linux reports
+    these; elsewhere both are None.
+    """
+    def read_kb(path: str, key: str) -> Optional[int]:
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.startswith(key + ":"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return None
+
+    return {
+        "rss_bytes": read_kb(f"/proc/{pid}/status", "VmRSS"),
+        "pss_bytes": read_kb(f"/proc/{pid}/smaps_rollup", "Pss"),
+    }
+
+
+def _worker_main(index: int, model, tokenizer, num_threads: int, tasks, results, draft_model=None,
+                 repetition_penalty: float = 1.0, make_prefix_cache: Optional[Callable[[], Any]] = None) -> None:
+    """
+    Worker loop: generate each batch from ``tasks`` and report it on
+    ``results``, with the wall-clock time of its first token.
+    """
+    torch.set_num_threads(num_threads)
+    torch.set_grad_enabled(False)
+    # Each worker matches prefixes against its own cache
+    prefix_cache = make_prefix_cache() if make_prefix_cache is not None else None
+    results.put((_READY, index, None, 0.0, None))
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        task_id, requests = task
+        started = time.perf_counter()
+        first_token: List[float] = []
+
+        def on_first_token():
+            if not first_token:
+                first_token.append(time.time())
+
+        try:
+            outcome = generate_batch(
+                model, tokenizer, requests,
+                prefix_cache=prefix_cache,
+                on_first_token=on_first_token,
+                draft_model=draft_model,
+                repetition_penalty=repetition_penalty,
+            )
+        except Exception as e:
+            outcome = e
+            try:
+                pickle.dumps(e)
+            except Exception:
+                outcome = RuntimeError(f"{type(e).__name__}: {e}")
+        results.put((task_id, index, outcome, time.perf_counter() - started, first_token[0] if first_token else None))
+
+
+@dataclass
+class _Worker:
+    index: int
+    process: Any
+    tasks: Any
+    started_at: float = field(default_factory=time.monotonic)
+    outstanding: int = 0
+    completed: int = 0
+    failed: int = 0
+    busy_seconds: float = 0.0
+
+
+class WorkerPool:
+    """
+    Runs ``generate_batch`` in ``num_workers`` processes that share the model.
+
+    The weights are moved into shared memory once in the parent
+    (``model.share_memory()``) and handed to spawned workers, which map the same
+    pages instead of loading their own copy. Each batch goes to the worker with
+    the fewest batches outstanding. Workers run ``num_threads`` intra-op threads
+    each, by default an even share of the machine's cores.
+
+    Dynamically quantized (int8) layers keep their packed weights outside
+    ordinary tensors, so each worker receives a private copy of those.
+
+    A ``draft_model`` is shared the same way and used for assisted decoding as
+    in :func:`generate_batch`. Prefix caches cannot be shared between
+    processes, so with ``make_prefix_cache`` each worker builds its own.
+    Session caches are not supported: a session's turns may land on different
+    workers, so the caller should generate those requests itself.
+    """
+
+    def __init__(self, model, tokenizer, num_workers: int, num_threads: int = 0, start_timeout: float = 300.0,
+                 draft_model=None, repetition_penalty: float = 1.0,
+                 make_prefix_cache: Optional[Callable[[], Any]] = None):
+        self.num_workers = max(1, num_workers)
+        self.num_threads = num_threads or max(1, (os.cpu_count() or 1) // self.num_workers)
+        model.share_memory()
+        if draft_model is not None:
+            draft_model.share_memory()
+        context = mp.get_context("spawn")
+        self._results = context.Queue()
+        self._pending: Dict[int, Tuple[Future, Optional[Callable[[float], None]]]] = {}
+        self._task_worker: Dict[int, int] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.workers: List[_Worker] = []
+        for index in range(self.num_workers):
+            tasks = context.Queue()
+            process = context.Process(
+                target=_worker_main,
+                args=(index, model, tokenizer, self.num_threads, tasks, self._results,
+                      draft_model, repetition_penalty, make_prefix_cache),
+                name=f"inference-worker-{index}",
+                daemon=True,
+            )
+            process.start()
+            self.workers.append(_Worker(index, process, tasks))
+        self._wait_until_ready(start_timeout)
+        self._collector = threading.Thread(target=self._collect, name="worker-results", daemon=True)
+        self._collector.start()
+
+    def _wait_until_ready(self, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        ready = set()
+        while len(ready) < self.num_workers:
+            try:
+                kind, index, _, _, _ = self._results.get(timeout=max(0.1, deadline - time.monotonic()))
+            except queue.Empty:
+                self.close()
+                raise TimeoutError(f"Only {len(ready)} of {self.num_workers} inference workers started")
+            if kind == _READY:
+                ready.add(index)
+                self.workers[index].started_at = time.monotonic()
+
+    def _collect(self) -> None:
+        while not self._closed:
+            try:
+                task_id, index, outcome, seconds, first_token_at = self._results.get(timeout=1.0)
+            except queue.Empty:
+                self._fail_dead_workers()
+                continue
+            worker = self.workers[index]
+            with self._lock:
+                future, on_first_token = self._pending.pop(task_id, (None, None))
+                self._task_worker.pop(task_id, None)
+                worker.outstanding -= 1
+                worker.busy_seconds += seconds
+                if isinstance(outcome, Exception):
+                    worker.failed += 1
+                else:
+                    worker.completed += 1
+            if future is None:
+                continue
+            if on_first_token is not None and first_token_at is not None:
+                # The worker's wall-clock time, moved onto this process's perf_counter
+                on_first_token(time.perf_counter() - (time.time() - first_token_at))
+            if isinstance(outcome, Exception):
+                future.set_exception(outcome)
+            else:
+                future.set_result(outcome)
+
+    def _fail_dead_workers(self) -> None:
+        with self._lock:
+            dead = {w.index for w in self.workers if not w.process.is_alive()}
+            lost = [task_id for task_id, index in self._task_worker.items() if index in dead]
+            futures = [self._pending.pop(task_id)[0] for task_id in lost]
+            for task_id in lost:
+                self.workers[self._task_worker.pop(task_id)].outstanding -= 1
+        for future in futures:
+            future.set_exception(RuntimeError("Inference worker exited while generating"))
+
+    def submit(self, requests: List[GenerationRequest],
+               on_first_token: Optional[Callable[[float], None]] = None) -> "Future[List[GenerationResult]]":
+        """
+        Queue a batch on the least loaded live worker. ``on_first_token`` is
+        called with the ``time.perf_counter()`` at which the worker produced the
+        batch's first token, once the batch is done.
+        """
+        future: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Worker pool is closed")
+            live = [w for w in self.workers if w.process.is_alive()]
+            if not live:
+                raise RuntimeError("No inference workers are running")
+            worker = min(live, key=lambda w: (w.outstanding, w.index))
+            task_id = next(self._ids)
+            self._pending[task_id] = (future, on_first_token)
+            self._task_worker[task_id] = worker.index
+            worker.outstanding += 1
+        worker.tasks.put((task_id, requests))
+        return future
+
+    def generate(self, requests: List[GenerationRequest],
+                 on_first_token: Optional[Callable[[float], None]] = None) -> List[GenerationResult]:
+        """Run a batch on a worker and wait for its results."""
+        return self.submit(requests, on_first_token).result()
+
+    def close(self) -> None:
+        self._closed = True
+        for worker in self.workers:
+            if worker.process.is_alive():
+                worker.tasks.put(None)
+        for worker in self.workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        with self._lock:
+            futures = [future for future, _ in self._pending.values()]
+            self._pending.clear()
+            self._task_worker.clear()
+        for future in futures:
+            future.set_exception(RuntimeError("Worker pool is closed"))
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-worker load, utilisation and memory, as a JSON-friendly dict."""
+        now = time.monotonic()
+        workers = []
+        for w in self.workers:
+            uptime = now - w.started_at
+            workers.append({
+                "pid": w.process.pid,
+                "alive": w.process.is_alive(),
+                "outstanding": w.outstanding,
+                "completed": w.completed,
+                "failed": w.failed,
+                "busy_seconds": w.busy_seconds,
+                "utilisation": w.busy_seconds / uptime if uptime > 0 else 0.0,
+                **process_memory(w.process.pid),
+            })
+        return {"num_workers": self.num_workers, "threads_per_worker": self.num_threads, "workers": workers}
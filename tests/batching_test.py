@@ -0,0 +1,118 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from server.batching import BatchScheduler
+from server.executor import InferenceExecutor, OverloadedError
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_concurrent_requests_share_a_batch():
+    calls = []
+
+    def run_batch(items):
+        calls.append(list(items))
+        return [item * 2 for item in items]
+
+    async def main():
+        scheduler = BatchScheduler(run_batch, max_batch_size=4, max_wait_ms=50)
+        await scheduler.start()
+        results = await asyncio.gather(*(scheduler.submit(i) for i in range(4)))
+        await scheduler.stop()
+        return results, scheduler.stats.to_dict()
+
+    results, stats = run(main())
+    assert results == [0, 2, 4, 6]
+    assert calls == [[0, 1, 2, 3]]
+    assert stats["batch_size_histogram"] == {4: 1}
+
+
+def test_batches_are_capped_at_max_batch_size():
+    sizes = []
+
+    def run_batch(items):
+        sizes.append(len(items))
+        return items
+
+    async def main():
+        scheduler = BatchScheduler(run_batch, max_batch_size=2, max_wait_ms=50)
+        await scheduler.start()
+        results = await asyncio.gather(*(scheduler.submit(i) for i in range(5)))
+        await scheduler.stop()
+        return results
+
+    assert run(main()) == [0, 1, 2, 3, 4]
+    assert max(sizes) == 2
+    assert sum(sizes) == 5
+
+
+def test_per_item_exception_only_fails_that_caller():
+    def run_batch(items):
+        return [ValueError("bad") if item < 0 else item for item in items]
+
+    async def main():
+        scheduler = BatchScheduler(run_batch, max_batch_size=4, max_wait_ms=20)
+        await scheduler.start()
+        results = await asyncio.gather(
+            scheduler.submit(1), scheduler.submit(-1), return_exceptions=True
+        )
+        await scheduler.stop()
+        return results
+
+    ok, failed = run(main())
+    assert ok == 1
+    assert isinstance(failed, ValueError)
+
+
+def test_full_queue_rejects_with_retry_after():
+    release = threading.Event()
+
+    def run_batch(items):
+        release.wait(timeout=5)
+        return items
+
+    async def main():
+        executor = InferenceExecutor(max_in_flight=1)
+        scheduler = BatchScheduler(run_batch, max_batch_size=1, max_wait_ms=0, max_queue_size=2, executor=executor)
+        await scheduler.start()
+        accepted = []
+        for i in range(4):
+            # One running, one held for the next batch, two queued
+            accepted.append(asyncio.create_task(scheduler.submit(i)))
+            await asyncio.sleep(0.02)
+        with pytest.raises(OverloadedError) as rejected:
+            await scheduler.submit(99)
+        release.set()
+        results = await asyncio.gather(*accepted)
+        await scheduler.stop()
+        executor.shutdown()
+        return results, rejected.value.retry_after
+
+    results, retry_after = run(main())
+    assert results == [0, 1, 2, 3]
+    assert retry_after >= 1
+
+
+def test_executor_runs_blocking_calls_off_the_event_loop():
+    async def main():
+        executor = InferenceExecutor(max_in_flight=1)
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.create_task(ticker())
+        await executor.run(time.sleep, 0.2)
+        task.cancel()
+        executor.shutdown()
+        return ticks
+
+    assert run(main()) > 5
@@ -0,0 +1,30 @@
+import pytest
+
+from server.benchmark import counter_total, parse_env, percentile
+
+
+def test_percentile_interpolates_between_ranks():
+    values = [4.0, 1.0, 3.0, 2.0]
+    assert percentile(values, 0) == 1.0
+    assert percentile(values, 50) == 2.5
+    assert percentile(values, 100) == 4.0
+    assert percentile([], 99) == 0.0
+
+
+def test_counter_total_sums_label_sets():
+    text = "\n".join([
+        "# TYPE llm_generated_tokens_total counter",
+        'llm_generated_tokens_total{model="default"} 120',
+        'llm_generated_tokens_total{model="small"} 30',
+        'llm_prompt_tokens_total{model="default"} 999',
+    ])
+    assert counter_total(text, "llm_generated_tokens_total") == 150
+    assert counter_total(text, "llm_missing_total") == 0
+
+
+def test_parse_env_requires_name_and_value():
+    assert parse_env(["SERVE_MAX_BATCH_SIZE=1", "SERVE_MAX_WAIT_MS="]) == {
+        "SERVE_MAX_BATCH_SIZE": "1", "SERVE_MAX_WAIT_MS": "",
+    }
+    with pytest.raises(ValueError):
+        parse_env(["SERVE_MAX_BATCH_SIZE"])
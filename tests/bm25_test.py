@@ -0,0 +1,49 @@
+import os
+
+from retrieval.bm25 import BM25Index, index_directory, tokenize
+
+
+def test_tokens_are_whole_words():
+    assert tokenize("Start the ART-class, don't stop!") == ["start", "the", "art", "class", "don", "t", "stop"]
+    index = BM25Index.from_documents([{"content": "start here"}])
+    assert index.search("art") == []
+
+
+def test_rare_terms_outrank_common_ones():
+    index = BM25Index.from_documents([
+        {"filename": "a", "content": "customer service customer calls"},
+        {"filename": "b", "content": "customer empathy and listening"},
+        {"filename": "c", "content": "customer billing"},
+    ])
+    results = index.search("customer empathy", k=2)
+    assert [doc["filename"] for _, doc in results] == ["b", "a"]
+    assert results[0][0] > results[1][0]
+
+
+def test_shorter_document_wins_on_equal_counts():
+    index = BM25Index.from_documents([
+        {"filename": "long", "content": "crisis " + "filler " * 50},
+        {"filename": "short", "content": "crisis line"},
+        {"filename": "other", "content": "billing"},
+    ])
+    assert index.search("crisis", k=1)[0][1]["filename"] == "short"
+
+
+def test_directory_index_is_reused_until_files_change(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "a.txt").write_text("grounding techniques for panic")
+    (docs / "skip.pdf").write_text("binary")
+    path = str(tmp_path / "index.json")
+
+    built = index_directory(str(docs), index_path=path)
+    assert [d["filename"] for d in built] == ["a.txt"]
+    assert os.path.exists(path)
+
+    reused = index_directory(str(docs), index_path=path)
+    assert reused.search("panic")[0][1]["filename"] == "a.txt"
+
+    (docs / "b.md").write_text("escalation policy for panic attacks")
+    rebuilt = index_directory(str(docs), index_path=path)
+    assert len(rebuilt) == 2
+    assert BM25Index.load(path).manifest == rebuilt.manifest
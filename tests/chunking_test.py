@@ -0,0 +1,52 @@
+import pytest
+
+from retrieval.bm25 import BM25Index
+from retrieval.chunking import chunk_documents, chunk_text, estimate_tokens, pack_passages
+
+MANUAL = """OVERVIEW
+This manual covers support calls. It is short.
+
+1. ACTIVE LISTENING
+Give full attention to the caller. Reflect back what you hear. Avoid interruptions.
+- Ask clarifying questions
+
+## Escalation
+Call the crisis line when someone is at risk.
+"""
+
+
+def test_passages_follow_headings():
+    passages = chunk_text(MANUAL, target_tokens=200, overlap_tokens=20)
+    assert [p["heading"] for p in passages] == ["OVERVIEW", "1. ACTIVE LISTENING", "Escalation"]
+    assert passages[1]["content"].startswith("1. ACTIVE LISTENING\n")
+    assert "Ask clarifying questions" in passages[1]["content"]
+    assert "crisis line" not in passages[1]["content"]
+
+
+def test_long_sections_split_at_sentences_with_overlap():
+    sentences = [f"Sentence number {i} talks about topic {i}." for i in range(30)]
+    passages = chunk_text(" ".join(sentences), target_tokens=60, overlap_tokens=15)
+    assert len(passages) > 1
+    for passage in passages:
+        assert passage["tokens"] <= 60
+        assert passage["content"].endswith(".")
+    # Each passage after the first starts with the last sentence of the one before
+    for before, after in zip(passages, passages[1:]):
+        assert after["content"].split(". ")[0] + "." in before["content"]
+
+
+def test_overlap_must_be_smaller_than_target():
+    with pytest.raises(ValueError):
+        chunk_text("text", target_tokens=10, overlap_tokens=10)
+
+
+def test_packing_keeps_best_passages_within_budget():
+    documents = [
+        {"filename": "calls.txt", "content": "GREETING\nSay hello.\n\nCRISIS\nCall the crisis line now.\n"},
+        {"filename": "billing.txt", "content": "BILLING\n" + "Invoices are sent monthly. " * 40},
+    ]
+    index = BM25Index.from_documents(chunk_documents(documents, target_tokens=80, overlap_tokens=10))
+    packed = pack_passages(index.search("crisis line invoices", k=10), budget_tokens=100)
+    assert packed[0]["heading"] == "CRISIS"
+    assert sum(p["tokens"] for p in packed) <= 100
+    assert all(p["tokens"] == estimate_tokens(p["content"]) for p in packed)
@@ -0,0 +1,20 @@
+import pytest
+
+from server.testing import build_tiny_model
+
+
+@pytest.fixture(scope="session")
+def tiny_model_path(tmp_path_factory):
+    """A tiny random GPT-2 and tokenizer, saved once per test run and never modified."""
+    pytest.importorskip("transformers")
+    path = str(tmp_path_factory.mktemp("tiny"))
+    build_tiny_model(path)
+    return path
+
+
+@pytest.fixture(scope="session")
+def tiny_engine(tiny_model_path):
+    """An fp32 engine over ``tiny_model_path`` without warm-up, for tests that only generate."""
+    from server.engine import InferenceEngine
+
+    return InferenceEngine.load(tiny_model_path, warmup_tokens=0)
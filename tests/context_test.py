@@ -0,0 +1,72 @@
+from server.context import TokenCache
+
+
+class WordTokenizer:
+    """One token per whitespace-separated word; counts how often it is called."""
+
+    def __init__(self, bos=None):
+        self.bos = bos
+        self.calls = 0
+
+    def __call__(self, text, add_special_tokens=True):
+        self.calls += 1
+        ids = [len(word) for word in text.split()]
+        if add_special_tokens and self.bos is not None:
+            ids = [self.bos] + ids
+        return {"input_ids": ids}
+
+
+def test_only_new_turns_are_tokenized():
+    tokenizer = WordTokenizer()
+    cache = TokenCache(tokenizer)
+    # Probing for special tokens is a one-off; count only the turns
+    cache.special_tokens()
+    tokenizer.calls = 0
+    cache.window(["hello there", "how are you"], None)
+    assert tokenizer.calls == 2
+    window = cache.window(["hello there", "how are you", "fine thanks"], None)
+    assert tokenizer.calls == 3
+    assert window.input_ids == [5, 5, 3, 3, 3, 4, 6]
+    assert window.dropped_messages == 0
+
+
+def test_oldest_turns_are_dropped_to_fit_budget():
+    cache = TokenCache(WordTokenizer())
+    window = cache.window(["a b c", "d e", "f g h"], max_prompt_tokens=5)
+    assert window.dropped_messages == 1
+    assert len(window.input_ids) == 5
+    assert window.truncated_tokens == 0
+
+
+def test_newest_turn_alone_over_budget_keeps_its_end():
+    cache = TokenCache(WordTokenizer())
+    window = cache.window(["old", "a bb ccc dddd"], max_prompt_tokens=2)
+    assert window.input_ids == [3, 4]
+    assert window.dropped_messages == 1
+    assert window.truncated_tokens == 2
+
+
+def test_least_recently_used_turns_are_trimmed():
+    tokenizer = WordTokenizer()
+    cache = TokenCache(tokenizer, max_entries=2)
+    cache.special_tokens()
+    tokenizer.calls = 0
+    cache.window(["a", "b"], None)
+    cache.encode("a", False)
+    cache.encode("c", True)
+    assert cache.stats() == {"entries": 2, "hits": 1, "misses": 3, "hit_rate": 0.25}
+    # "b" was the least recently used, so only it is tokenized again
+    cache.window(["a", "b"], None)
+    assert tokenizer.calls == 4
+
+
+def test_special_tokens_are_added_once_per_window():
+    tokenizer = WordTokenizer(bos=0)
+    messages = ["abc defg", "hello", "abc"]
+    cache = TokenCache(tokenizer)
+    assert cache.window(messages, None).input_ids == tokenizer(" ".join(messages))["input_ids"] == [0, 3, 4, 5, 3]
+    assert cache.window(messages, max_prompt_tokens=5).input_ids == [0, 3, 4, 5, 3]
+    # The BOS counts against the budget and stays in front
+    window = cache.window(messages, max_prompt_tokens=3)
+    assert window.input_ids == [0, 5, 3]
+    assert window.dropped_messages == 1
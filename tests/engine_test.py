@@ -0,0 +1,47 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from server.engine import InferenceEngine
+from server.generation import GenerationRequest
+
+
+@pytest.fixture(scope="module")
+def engine(tiny_model_path):
+    return InferenceEngine.load(tiny_model_path, warmup_tokens=2)
+
+
+def test_load_times_each_phase(engine):
+    assert list(engine.load_timings) == ["tokenizer", "weights", "precision", "device", "warmup"]
+
+
+def test_completion_is_sliced_by_tokens(engine):
+    prompt = "w1 w2 w3"
+    echoed, = engine.generate([GenerationRequest(prompt=prompt, max_new_tokens=3, temperature=0.0)])
+    alone, = engine.generate([GenerationRequest(prompt=prompt, max_new_tokens=3, temperature=0.0, echo_prompt=False)])
+    assert echoed.text.startswith(prompt)
+    assert not alone.text.startswith(prompt)
+    assert echoed.text.endswith(alone.text)
+
+
+def test_batch_returns_input_order(engine):
+    requests = [
+        GenerationRequest(prompt=" ".join(["w5"] * n), max_new_tokens=1, temperature=0.0)
+        for n in (5, 1, 3)
+    ]
+    results = engine.batch(requests, max_batch_size=2)
+    assert [r.prompt_tokens for r in results] == [5, 1, 3]
+
+
+def test_seeded_sampling_ignores_the_global_generator(engine):
+    request = GenerationRequest(prompt="w1 w2", max_new_tokens=6, temperature=1.0, seed=7)
+    first, = engine.generate([request])
+    torch.manual_seed(123)
+    torch.rand(1000)
+    second, = engine.generate([request])
+    assert first.text == second.text
+
+
+def test_warmup_is_skipped_without_tokens(tiny_engine):
+    assert "warmup" not in tiny_engine.load_timings
+    assert tiny_engine.model.training is False
@@ -0,0 +1,69 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("requests")
+
+from client.llm_client import ClientConfig, LLMClient, LLMClientError
+
+
+def serve(responses):
+    """Answer POSTs with successive (status, delay) pairs; the last one repeats."""
+    calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            index = len(calls)
+            calls.append(index)
+            status, delay = responses[min(index, len(responses) - 1)]
+            time.sleep(delay)
+            body = json.dumps({"response": f"answer {index}"}).encode()
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/", calls
+
+
+def test_retries_retryable_statuses_then_succeeds():
+    server, url, calls = serve([(503, 0), (502, 0), (200, 0)])
+    client = LLMClient(ClientConfig(max_retries=3, backoff_base=0.01))
+    try:
+        assert client.post_json(url, {"prompt": "hi"}) == {"response": "answer 2"}
+        assert client.retries == 2
+    finally:
+        server.shutdown()
+
+
+def test_client_errors_are_not_retried():
+    server, url, calls = serve([(404, 0)])
+    client = LLMClient(ClientConfig(max_retries=3, backoff_base=0.01))
+    try:
+        with pytest.raises(LLMClientError) as excinfo:
+            client.post_json(url, {"prompt": "hi"})
+        assert excinfo.value.status == 404
+        assert len(calls) == 1
+    finally:
+        server.shutdown()
+
+
+def test_slow_request_is_hedged():
+    server, url, calls = serve([(200, 2.0), (200, 0)])
+    client = LLMClient(ClientConfig(hedge=True, hedge_after=0.1))
+    try:
+        started = time.perf_counter()
+        assert client.post_json(url, {"prompt": "hi"}) == {"response": "answer 1"}
+        assert time.perf_counter() - started < 1.5
+        assert client.hedges == 1
+    finally:
+        server.shutdown()
@@ -0,0 +1,52 @@
+import pytest
+
+from server.metrics import Counter, Gauge, Histogram, ServingMetrics
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency_seconds", "Latency.", ["endpoint"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value, endpoint="/chat")
+    lines = histogram.render()
+    assert 'latency_seconds_bucket{endpoint="/chat",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{endpoint="/chat",le="1"} 3' in lines
+    assert 'latency_seconds_bucket{endpoint="/chat",le="+Inf"} 4' in lines
+    assert 'latency_seconds_count{endpoint="/chat"} 4' in lines
+    assert 'latency_seconds_sum{endpoint="/chat"} 4.25' in lines
+
+
+def test_counter_and_gauge_render_with_labels():
+    counter = Counter("tokens_total", "Tokens.", ["model"])
+    counter.inc(3, model="default")
+    counter.inc(2, model="default")
+    assert 'tokens_total{model="default"} 5' in counter.render()
+
+    gauge = Gauge("queue_depth", "Queue depth.")
+    depth = [7]
+    gauge.set_function(lambda: depth[0])
+    assert "queue_depth 7" in gauge.render()
+    depth[0] = 2
+    assert "queue_depth 2" in gauge.render()
+
+
+def test_track_request_records_latency_and_errors():
+    metrics = ServingMetrics()
+    with metrics.track_request("/chat"):
+        assert metrics.in_flight.value(endpoint="/chat") == 1
+    with pytest.raises(ValueError):
+        with metrics.track_request("/chat"):
+            raise ValueError("boom")
+
+    assert metrics.in_flight.value(endpoint="/chat") == 0
+    assert metrics.request_latency.count(endpoint="/chat") == 2
+    assert metrics.errors.value(endpoint="/chat", type="ValueError") == 1
+
+
+def test_render_is_prometheus_text():
+    metrics = ServingMetrics()
+    metrics.record_generation("default", prompt_tokens=10, generated_tokens=20, seconds=2.0)
+    text = metrics.render()
+    assert "# TYPE llm_request_duration_seconds histogram" in text
+    assert 'llm_generated_tokens_total{model="default"} 20' in text
+    assert 'llm_generation_tokens_per_second_bucket{model="default",le="10"} 1' in text
+    assert text.endswith("\n")
@@ -0,0 +1,56 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from server.generation import GenerationRequest, generate_batch
+from server.prefix_cache import PrefixCache, kv_nbytes, prefill
+
+
+def greedy(tiny_engine, prompt, prefix_cache=None):
+    result, = generate_batch(
+        tiny_engine.model, tiny_engine.tokenizer,
+        [GenerationRequest(prompt=prompt, max_new_tokens=5, temperature=0.0)],
+        prefix_cache=prefix_cache,
+    )
+    return result.text
+
+
+def test_cached_prefix_does_not_change_greedy_output(tiny_engine):
+    cache = PrefixCache(block_size=4, min_hits=1)
+    # The shared six tokens end between block boundaries
+    shared = "w1 w2 w3 w4 w5 w6"
+    for prompt in (f"{shared} w7 w8", f"{shared} w9", f"{shared} w9 w10 w11"):
+        assert greedy(tiny_engine, prompt, cache) == greedy(tiny_engine, prompt)
+    stats = cache.stats()
+    assert stats["hits"] == 3 and stats["misses"] == 0
+    assert stats["reused_tokens"] == 4 + 4 + 8
+
+
+def test_prefix_needs_min_hits_before_it_is_cached(tiny_engine):
+    cache = PrefixCache(block_size=2, min_hits=2)
+    greedy(tiny_engine, "w1 w2 w3", cache)
+    assert cache.stats()["misses"] == 1 and cache.stats()["entries"] == 0
+    greedy(tiny_engine, "w1 w2 w4", cache)
+    assert cache.stats()["hits"] == 1 and cache.stats()["entries"] == 1
+
+
+def test_least_recently_used_prefix_is_evicted_under_the_byte_cap(tiny_engine):
+    ids = tiny_engine.tokenizer("w1 w2 w3 w4 w5")["input_ids"]
+    entry_bytes = kv_nbytes(prefill(tiny_engine.model, ids[:2]))
+    cache = PrefixCache(max_bytes=entry_bytes * 2, block_size=2, min_hits=1)
+    for prompt in ("w1 w2 w3", "w4 w5 w6", "w1 w2 w7", "w8 w9 w10"):
+        greedy(tiny_engine, prompt, cache)
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["evictions"] == 1
+    assert stats["bytes"] <= stats["max_bytes"]
+    # "w1 w2" was used again after "w4 w5", so "w4 w5" went first
+    hits = stats["hits"]
+    greedy(tiny_engine, "w1 w2 w11", cache)
+    assert cache.stats()["hits"] == hits + 1
+
+
+def test_clear_drops_every_prefix(tiny_engine):
+    cache = PrefixCache(block_size=2, min_hits=1)
+    greedy(tiny_engine, "w1 w2 w3", cache)
+    cache.clear()
+    assert cache.stats()["entries"] == 0 and cache.stats()["bytes"] == 0
@@ -0,0 +1,107 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("requests")
+
+from client.llm_client import ClientConfig, LLMClient
+from client.prober import HealthProber
+from config.endpoints import Endpoint
+
+
+def serve(routes, delay=0.0):
+    """Answer GETs from a {path: (status, body)} table."""
+    calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            calls.append(self.path)
+            time.sleep(delay)
+            status, payload = routes.get(self.path, (404, {}))
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}", calls
+
+
+def test_reports_each_backend_status():
+    server, url, calls = serve({
+        "/health": (200, {"status": "ready"}),
+        "/readyz": (503, {"status": "loading"}),
+    })
+    endpoints = [
+        Endpoint("modal", url),
+        Endpoint("local", url, kind="server"),
+        Endpoint("gone", "http://127.0.0.1:9"),
+    ]
+    prober = HealthProber(endpoints, LLMClient(ClientConfig(connect_timeout=1)), timeout=5)
+    try:
+        status = {b["name"]: b for b in prober.probe_all()}
+        assert status["modal"]["status"] == "ready"
+        assert status["modal"]["latency_ms"] is not None
+        assert status["local"]["status"] == "loading"
+        assert status["gone"]["status"] == "down"
+        assert status["gone"]["error"]
+    finally:
+        prober.stop()
+        server.shutdown()
+
+
+def test_warm_does_not_block_or_pile_up():
+    server, url, calls = serve({"/health": (200, {"status": "healthy"})}, delay=0.5)
+    prober = HealthProber([Endpoint("modal", url)], LLMClient(), timeout=5)
+    try:
+        started = time.perf_counter()
+        prober.warm()
+        prober.warm()
+        assert time.perf_counter() - started < 0.2
+        assert prober.status()[0]["checking"]
+        assert prober.probe_all()[0]["status"] == "ready"
+        assert len(calls) == 1
+    finally:
+        prober.stop()
+        server.shutdown()
+
+
+def test_polling_stops_after_the_last_session_goes_quiet():
+    server, url, calls = serve({"/health": (200, {"status": "ready"})})
+    now = [1000.0]
+    prober = HealthProber([Endpoint("modal", url)], LLMClient(), interval=0.02, timeout=5,
+                          idle_after=300, clock=lambda: now[0])
+    try:
+        prober.start()
+        time.sleep(0.2)
+        assert calls == []
+
+        prober.touch("a")
+        prober.touch("b")
+        deadline = time.monotonic() + 5
+        while not calls and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert calls
+
+        now[0] += 200
+        prober.touch("b")
+        now[0] += 150
+        assert prober.active_sessions() == 1
+        now[0] += 150
+        assert prober.active_sessions() == 0
+        # Let a probe already in flight finish
+        time.sleep(0.2)
+        polled = len(calls)
+        time.sleep(0.3)
+        assert len(calls) == polled
+    finally:
+        prober.stop()
+        server.shutdown()
@@ -0,0 +1,37 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from server.engine import InferenceEngine
+from server.generation import GenerationRequest
+from server.quantize import apply_precision
+
+
+@pytest.fixture
+def model_path(tiny_model_path):
+    return tiny_model_path
+
+
+def generates(engine):
+    result, = engine.generate([GenerationRequest(prompt="w1 w2", max_new_tokens=3, temperature=0.0)])
+    return result.generated_tokens == 3
+
+
+def test_bf16_loads_bfloat16_weights(model_path):
+    engine = InferenceEngine.load(model_path, precision="bf16", warmup_tokens=0)
+    assert {p.dtype for p in engine.model.parameters()} == {torch.bfloat16}
+    assert generates(engine)
+
+
+def test_int8_quantizes_linear_layers(model_path):
+    fp32 = InferenceEngine.load(model_path, warmup_tokens=0)
+    int8 = InferenceEngine.load(model_path, precision="int8", warmup_tokens=0)
+    quantized = [m for m in int8.model.modules() if isinstance(m, torch.ao.nn.quantized.dynamic.Linear)]
+    assert quantized
+    assert int8.nbytes < fp32.nbytes
+    assert generates(int8)
+
+
+def test_unknown_precision_is_rejected(model_path):
+    with pytest.raises(ValueError):
+        apply_precision(torch.nn.Linear(2, 2), "int4")
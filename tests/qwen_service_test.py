@@ -0,0 +1,97 @@
+import threading
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pydantic = pytest.importorskip("pydantic")
+
+from serve.qwen_service import BatchRequest, PromptRequest, QwenService
+
+
+@pytest.fixture
+def service(tiny_model_path) -> QwenService:
+    return QwenService(model_id=tiny_model_path, fallback_model_id=None, precision="fp32")
+
+
+def test_concurrent_loads_load_once(service, monkeypatch):
+    loads = []
+    real_load = service._load
+    monkeypatch.setattr(service, "_load", lambda: loads.append(1) or real_load())
+
+    threads = [threading.Thread(target=service.load) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert loads == [1]
+    assert service.health()["status"] == "ready"
+    assert {"tokenizer", "weights", "warmup", "total"} <= set(service.load_timings)
+
+
+def test_generate_reports_finish_reason(service):
+    service.load()
+    result = service.generate({"prompt": "w1 w2 w3", "max_tokens": 4})
+    assert result["finish_reason"] in ("stop", "length")
+    assert service.generate({"prompt": ""}) == {"error": "No prompt provided"}
+
+
+def test_batch_keeps_input_order_and_isolates_errors(service):
+    service.max_batch_size = 2
+    service.load()
+    items = ["w1 w2 w3 w4 w5 w6", "", {"prompt": "w1", "max_tokens": 2}, {"prompt": "w7 w8", "temperature": "hot"}]
+    results = service.generate_many(items, {"max_tokens": 3})
+    assert len(results) == 4
+    assert results[0]["prompt_tokens"] > results[2]["prompt_tokens"]
+    assert results[0]["completion_tokens"] <= 3
+    assert results[1] == {"error": "No prompt provided"}
+    assert results[2]["completion_tokens"] <= 2
+    assert "error" in results[3]
+
+
+def test_queue_depth_counts_prompts_until_answered(service):
+    service.max_batch_size = 2
+    service.load()
+    depths = []
+    generate = service.engine.generate
+
+    def observed(requests, **kwargs):
+        depths.append(service.metrics.queue_depth.value())
+        return generate(requests, **kwargs)
+
+    service.engine.generate = observed
+    service.generate({"prompt": "w1 w2", "max_tokens": 2})
+    service.generate_many(["w1", "w2 w3", "w4"], {"max_tokens": 2})
+    assert depths == [1, 3, 3]
+    assert service.metrics.queue_depth.value() == 0
+
+
+@pytest.mark.parametrize("request_body", [
+    {"prompt": 3},
+    {"prompt": ""},
+    {"prompt": "w1", "max_tokens": -1},
+    {"prompt": "w1", "max_tokens": 0},
+    {"prompt": "w1", "temperature": "hot"},
+    {"prompt": "w1", "max_time_ms": 0},
+])
+def test_malformed_requests_are_rejected_while_parsing(request_body):
+    with pytest.raises(pydantic.ValidationError):
+        PromptRequest.model_validate(request_body)
+    with pytest.raises(pydantic.ValidationError):
+        BatchRequest.model_validate({"prompts": ["w1", request_body]})
+
+
+def test_batch_request_keeps_only_the_settings_it_was_given():
+    batch = BatchRequest.model_validate({"prompts": ["w1", {"prompt": "w2", "seed": 3}], "max_tokens": 4})
+    assert batch.prompts[0] == "w1"
+    assert batch.prompts[1].model_dump(exclude_unset=True) == {"prompt": "w2", "seed": 3}
+    assert batch.model_dump(exclude={"prompts"}, exclude_unset=True) == {"max_tokens": 4}
+    with pytest.raises(pydantic.ValidationError):
+        BatchRequest.model_validate({"prompts": []})
+
+
+def test_negative_max_tokens_fails_only_its_own_item(service):
+    service.load()
+    results = service.generate_many([{"prompt": "w1", "max_tokens": -1}, "w2"], {"max_tokens": 2})
+    assert "max_tokens" in results[0]["error"]
+    assert results[1]["completion_tokens"] <= 2
@@ -0,0 +1,121 @@
+import asyncio
+import threading
+
+import pytest
+
+from server.batching import BatchScheduler
+from server.registry import LoadedModel, ModelInUseError, ModelNotFoundError, ModelRegistry
+
+
+def make_registry(tmp_path, memory_budget=0):
+    for name in ("exp-a", "exp-b"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "config.json").write_text("{}")
+    loads = []
+    lock = threading.Lock()
+
+    def load(name, path):
+        with lock:
+            loads.append(name)
+        return LoadedModel(name=name, path=path, model=object(), tokenizer=None, model_id=name, nbytes=100)
+
+    registry = ModelRegistry(
+        default_path=str(tmp_path / "exp-a"),
+        load=load,
+        make_scheduler=lambda loaded: BatchScheduler(lambda items: items),
+        models_dir=str(tmp_path),
+        memory_budget=memory_budget,
+    )
+    return registry, loads
+
+
+def test_concurrent_first_requests_share_one_load(tmp_path):
+    registry, loads = make_registry(tmp_path)
+
+    async def main():
+        models = await asyncio.gather(*(registry.get("exp-b") for _ in range(5)))
+        await registry.close()
+        return models
+
+    models = asyncio.run(main())
+    assert loads == ["exp-b"]
+    assert all(m is models[0] for m in models)
+
+
+def test_least_recently_used_idle_model_is_unloaded(tmp_path):
+    registry, loads = make_registry(tmp_path, memory_budget=150)
+
+    async def main():
+        await registry.get()
+        await registry.get("exp-b")
+        loaded = [m.name for m in registry.loaded]
+        await registry.close()
+        return loaded
+
+    assert asyncio.run(main()) == ["exp-b"]
+    assert registry.evictions >= 1
+
+
+def test_models_in_use_are_not_unloaded(tmp_path):
+    registry, loads = make_registry(tmp_path, memory_budget=150)
+
+    async def main():
+        async with registry.acquire():
+            await registry.get("exp-b")
+            loaded = sorted(m.name for m in registry.loaded)
+        await registry.close()
+        return loaded
+
+    assert asyncio.run(main()) == ["default", "exp-b"]
+
+
+def test_unknown_or_unsafe_names_are_rejected(tmp_path):
+    registry, _ = make_registry(tmp_path)
+    with pytest.raises(ModelNotFoundError):
+        registry.resolve_path("missing")
+    with pytest.raises(ModelNotFoundError):
+        registry.resolve_path("../exp-a")
+    assert registry.available() == ["default", "exp-a", "exp-b"]
+
+
+def test_cancelled_first_caller_does_not_strand_other_waiters(tmp_path):
+    registry, loads = make_registry(tmp_path)
+    release = threading.Event()
+    load = registry.load
+
+    def slow_load(name, path):
+        release.wait(5)
+        return load(name, path)
+
+    registry.load = slow_load
+
+    async def main():
+        first = asyncio.ensure_future(registry.get("exp-b"))
+        second = asyncio.ensure_future(registry.get("exp-b"))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        loaded = await asyncio.wait_for(second, timeout=5)
+        assert first.cancelled()
+        assert [m.name for m in registry.loaded] == ["exp-b"]
+        await registry.close()
+        return loaded
+
+    assert asyncio.run(main()).name == "exp-b"
+    assert loads == ["exp-b"]
+
+
+def test_models_held_by_requests_are_not_unloaded_on_request(tmp_path):
+    registry, _ = make_registry(tmp_path)
+
+    async def main():
+        async with registry.acquire("exp-b"):
+            with pytest.raises(ModelInUseError):
+                await registry.unload("exp-b")
+            assert [m.name for m in registry.loaded] == ["exp-b"]
+        unloaded = await registry.unload("exp-b")
+        await registry.close()
+        return unloaded
+
+    assert asyncio.run(main()) is True
@@ -0,0 +1,50 @@
+from server.response_cache import ResponseCache, checkpoint_fingerprint
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_key_ignores_field_order():
+    a = ResponseCache.make_key({"prompt": "hi", "max_length": 10})
+    b = ResponseCache.make_key({"max_length": 10, "prompt": "hi"})
+    assert a == b
+    assert a != ResponseCache.make_key({"prompt": "hi", "max_length": 11})
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = ResponseCache(ttl_seconds=10, clock=clock)
+    cache.set("a", "response")
+    clock.now = 9.9
+    assert cache.get("a") == "response"
+    clock.now = 10.0
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_clear_and_checkpoint_fingerprint(tmp_path):
+    cache = ResponseCache()
+    cache.set("a", 1)
+    assert cache.clear() == 1
+    assert cache.get("a") is None
+
+    (tmp_path / "config.json").write_text("{}")
+    before = checkpoint_fingerprint(str(tmp_path))
+    (tmp_path / "model.safetensors").write_bytes(b"weights")
+    assert checkpoint_fingerprint(str(tmp_path)) != before
@@ -0,0 +1,102 @@
+import pytest
+
+pytest.importorskip("requests")
+
+from client.llm_client import ClientConfig, LLMClient, LLMClientError
+from client.router import EndpointRouter
+from config.endpoints import Endpoint, load_endpoints
+
+
+class FakeClient(LLMClient):
+    """Answers from a per-URL script instead of the network."""
+
+    def __init__(self, outcomes):
+        super().__init__(ClientConfig(max_retries=0, backoff_base=0.0))
+        self.outcomes = outcomes
+        self.calls = []
+
+    def post_json(self, url, payload):
+        self.calls.append(url)
+        outcome = self.outcomes[url]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def endpoints():
+    return [Endpoint("a", "http://a"), Endpoint("b", "http://b/")]
+
+
+def test_prefers_lower_latency_backend():
+    router = EndpointRouter(endpoints() + [Endpoint("c", "http://c")], FakeClient({}))
+    router.record_success("a", 2.0)
+    router.record_success("b", 0.5)
+    # Unmeasured backends are tried before measured ones
+    assert router.choose().name == "c"
+    router.record_success("c", 1.0)
+    assert router.choose().name == "b"
+
+
+def test_fails_over_to_next_backend():
+    client = FakeClient({"http://a": LLMClientError("down", 503), "http://b": {"response": "hi"}})
+    router = EndpointRouter(endpoints(), client)
+    assert router.generate("hello") == "hi"
+    assert client.calls == ["http://a", "http://b"]
+    assert [s["failures"] for s in router.stats()] == [1, 0]
+
+
+def test_error_in_200_response_fails_over():
+    client = FakeClient({"http://a": {"error": "CUDA out of memory"}, "http://b": {"response": "hi"}})
+    router = EndpointRouter(endpoints(), client)
+    assert router.generate("hello") == "hi"
+
+
+def test_circuit_opens_then_lets_one_trial_through():
+    clock = Clock()
+    router = EndpointRouter(endpoints(), FakeClient({}), failure_threshold=2, cooldown=10, clock=clock)
+    router.record_success("b", 5.0)
+    router.record_failure("a")
+    router.record_failure("a")
+    assert router.choose().name == "b"
+    assert router.stats()[0]["circuit"] == "open"
+
+    clock.now = 10
+    assert router.stats()[0]["circuit"] == "half-open"
+    assert router.choose().name == "a"
+    # The trial is in flight, so nothing else goes to "a" until it finishes
+    assert router.choose().name == "b"
+    router.record_failure("a")
+    assert router.stats()[0]["circuit"] == "open"
+
+    clock.now = 20
+    assert router.choose().name == "a"
+    router.record_success("a", 1.0)
+    assert router.stats()[0]["circuit"] == "closed"
+
+
+def test_gives_up_after_max_attempts():
+    client = FakeClient({"http://a": LLMClientError("down", 503), "http://b": LLMClientError("down", 502)})
+    router = EndpointRouter(endpoints(), client, max_attempts=3)
+    with pytest.raises(LLMClientError):
+        router.generate("hello")
+    assert len(client.calls) == 3
+
+
+def test_server_endpoints_use_chat_completions():
+    client = FakeClient({"http://local/v1/chat/completions": {"choices": [{"message": {"content": "hi"}}]}})
+    router = EndpointRouter([Endpoint("local", "http://local", kind="server")], client)
+    assert router.generate("hello") == "hi"
+
+
+def test_load_endpoints_from_json():
+    loaded = load_endpoints('[{"name": "gpu", "url": "http://gpu/", "kind": "server", "weight": 2}]')
+    assert loaded == [Endpoint("gpu", "http://gpu", kind="server", weight=2)]
+    assert loaded[0].health_url == "http://gpu/readyz"
@@ -0,0 +1,178 @@
+import asyncio
+import importlib
+import json
+import os
+import time
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("fastapi")
+
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture(scope="module")
+def serve(tiny_model_path):
+    env = {"MODEL_PATH": tiny_model_path, "SERVE_WARMUP_TOKENS": "2", "SERVE_RESPONSE_CACHE_SIZE": "8"}
+    saved = {name: os.environ.get(name) for name in env}
+    os.environ.update(env)
+    # The server reads its config at import
+    import server.serve
+    module = importlib.reload(server.serve)
+    yield module
+    for name, value in saved.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+
+
+@pytest.fixture(scope="module")
+def client(serve):
+    with TestClient(serve.app) as client:
+        yield client
+
+
+def wait_until_ready(client, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = client.get("/readyz")
+        if response.status_code == 200:
+            return response
+        time.sleep(0.05)
+    raise AssertionError("model did not load")
+
+
+def test_not_ready_before_the_model_loads(serve):
+    # Without the context manager the startup load never runs
+    client = TestClient(serve.app)
+    assert client.get("/healthz").json() == {"status": "alive"}
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.json() == {"status": "loading", "error": None}
+
+
+def test_ready_after_load_reports_phase_timings(client):
+    assert client.get("/healthz").status_code == 200
+    ready = wait_until_ready(client).json()
+    assert ready["status"] == "ready"
+    assert list(ready["load_timings_ms"]) == ["tokenizer", "weights", "precision", "device", "warmup"]
+
+
+def test_cache_clear_drops_cached_responses(client):
+    request = {"messages": ["w1 w2"], "max_new_tokens": 2, "temperature": 0.0}
+    first = client.post("/chat", json=request).json()
+    assert client.post("/chat", json=request).json() == first
+    assert client.get("/stats").json()["response_cache"]["hits"] == 1
+
+    assert client.post("/cache/clear").json() == {"cleared_responses": 1}
+    assert client.post("/cache/clear").json() == {"cleared_responses": 0}
+
+
+def stream_events(client, request):
+    with client.stream("POST", "/chat/stream", json=request) as response:
+        lines = [line for line in response.iter_lines() if line.startswith("data: ")]
+    assert lines[-1] == "data: [DONE]"
+    return [json.loads(line[len("data: "):]) for line in lines[:-1]]
+
+
+def test_conversations_longer_than_the_context_drop_old_turns(client):
+    # Five 300-token turns do not fit in the tiny model's 1024 positions
+    messages = [" ".join([f"w{i}"] * 300) for i in range(1, 6)]
+    usage = stream_events(client, {"messages": messages, "max_new_tokens": 4, "temperature": 0.0})[-1]["usage"]
+    assert usage["dropped_messages"] == 2
+    assert usage["prompt_tokens"] <= 1024 - 4
+
+
+def test_streamed_text_with_a_multi_token_stop_matches_chat(client):
+    prompt = "w1 w2"
+    request = {"messages": [prompt], "max_new_tokens": 8, "temperature": 0.0}
+    unstopped = client.post("/chat", json=request).json()["response"][len(prompt):]
+    # Two generated words, so the stop string spans tokens and starts after the first
+    words = unstopped.split()
+    stop = f"{words[1]} {words[2]}"
+    expected = unstopped[:unstopped.index(stop)]
+
+    request["stop"] = [stop]
+    chat = client.post("/chat", json=request).json()
+    assert chat["finish_reason"] == "stop"
+    assert chat["response"] == prompt + expected
+    streamed = "".join(e["token"] for e in stream_events(client, request) if "token" in e)
+    assert streamed.strip() == expected.strip()
+
+
+def test_stream_sends_tokens_usage_and_done(serve, client):
+    events = stream_events(client, {"messages": ["w1 w2"], "max_new_tokens": 4, "temperature": 0.0})
+    tokens = [e["token"] for e in events if "token" in e]
+    assert tokens and all(tokens)
+    usage = events[-1]["usage"]
+    assert usage["generated_tokens"] == 4 and usage["dropped_messages"] == 0
+    # The model and the queue place are let go once the stream ends
+    assert serve.registry.loaded_model().active == 0
+    assert serve.executor.waiting == 0
+
+
+def test_stream_is_rejected_before_it_starts_when_the_queue_is_full(serve, client, monkeypatch):
+    # Every slot busy and no room to wait
+    monkeypatch.setattr(serve.executor, "max_queue", 0)
+    monkeypatch.setattr(serve.executor, "_semaphore", lambda: asyncio.Semaphore(0))
+    response = client.post("/chat/stream", json={"messages": ["w1"], "max_new_tokens": 2})
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+    assert serve.registry.loaded_model().active == 0
+
+
+def test_prefix_cache_counters_in_stats_and_cleared(serve, client):
+    wait_until_ready(client)
+    # More than two 32-token blocks shared, with a different question after them
+    shared = " ".join(f"w{i}" for i in range(100, 180))
+    for question in ("w1", "w2", "w3"):
+        client.post("/chat", json={"messages": [shared, question], "max_new_tokens": 2, "temperature": 0.0})
+    prefix = client.get("/stats").json()["models"]["default"]["prefix_cache"]
+    assert prefix["misses"] >= 1 and prefix["hits"] >= 2
+    assert prefix["entries"] >= 1 and prefix["reused_tokens"] >= 64
+
+    client.post("/cache/clear")
+    assert client.get("/stats").json()["models"]["default"]["prefix_cache"]["entries"] == 0
+
+
+def test_prefix_cache_mb_zero_disables_it(serve, monkeypatch, tiny_model_path):
+    monkeypatch.setattr(serve.config, "prefix_cache_mb", 0)
+    monkeypatch.setattr(serve.config, "warmup_tokens", 0)
+    loaded = serve.load_model("no-prefix", tiny_model_path)
+    assert loaded.engine.prefix_cache is None
+
+
+def completion(client, **request):
+    return client.post("/v1/chat/completions", json={"messages": [{"role": "user", "content": "w1 w2"}], **request})
+
+
+def test_completions_return_n_choices_with_usage(client):
+    body = completion(client, n=3, max_tokens=4, temperature=1.0, seed=3).json()
+    assert [c["index"] for c in body["choices"]] == [0, 1, 2]
+    assert all(c["message"]["role"] == "assistant" for c in body["choices"])
+    usage = body["usage"]
+    assert 0 < usage["completion_tokens"] <= 3 * 4
+    assert usage["total_tokens"] == usage["prompt_tokens"] + usage["completion_tokens"]
+
+
+def test_completions_cut_at_stop_strings(client):
+    unstopped = completion(client, max_tokens=8, temperature=0.0).json()["choices"][0]["message"]["content"]
+    stop = unstopped.split()[1]
+    choice = completion(client, max_tokens=8, temperature=0.0, stop=stop).json()["choices"][0]
+    assert choice["finish_reason"] == "stop"
+    assert choice["message"]["content"] == unstopped[:unstopped.index(stop)]
+
+
+def test_completions_cut_short_by_time_finish_with_length(client):
+    choice = completion(client, max_tokens=50, temperature=0.0, max_time_ms=0.001).json()["choices"][0]
+    assert choice["finish_reason"] == "length"
+
+
+def test_completions_reject_bad_requests(client):
+    assert completion(client, model="missing").status_code == 404
+    assert completion(client, max_tokens=0).status_code == 422
+    assert completion(client, max_completion_tokens=-1).status_code == 422
+    assert completion(client, n=0).status_code == 422
+    assert client.post("/v1/chat/completions", json={"messages": []}).status_code == 422
@@ -0,0 +1,57 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from server.session_cache import SessionCache, kv_length
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_past(length: int, layers: int = 2):
+    """Legacy-format key/values: per layer a (key, value) pair of [1, heads, length, dim]."""
+    return tuple((torch.zeros(1, 2, length, 4), torch.zeros(1, 2, length, 4)) for _ in range(layers))
+
+
+def test_next_turn_reuses_the_common_prefix():
+    cache = SessionCache()
+    cache.store("s", [1, 2, 3, 4, 5], make_past(4))
+    covered, past = cache.take("s", [1, 2, 3, 4, 9, 9])
+    assert covered == 4
+    assert kv_length(past) == 4
+    assert cache.take("s", [1, 2, 3, 4, 9, 9]) == (0, None)
+
+
+def test_diverging_prompt_is_cropped_and_one_token_left_to_prefill():
+    cache = SessionCache()
+    cache.store("s", [1, 2, 3, 4, 5], make_past(4))
+    covered, past = cache.take("s", [1, 2, 7])
+    assert covered == 2
+    assert kv_length(past) == 2
+
+    cache.store("s", [1, 2, 3, 4, 5], make_past(4))
+    covered, past = cache.take("s", [1, 2, 3])
+    assert covered == 2
+
+
+def test_memory_caps_and_idle_expiry():
+    clock = FakeClock()
+    one_session = 2 * 2 * 1 * 2 * 4 * 4 * 4  # layers * (k, v) * [1, 2, 4, 4] float32
+    cache = SessionCache(max_bytes=2 * one_session, max_session_bytes=one_session, idle_seconds=60, clock=clock)
+    cache.store("big", [0] * 9, make_past(8))
+    assert cache.stats()["sessions"] == 0
+
+    cache.store("a", [0] * 5, make_past(4))
+    cache.store("b", [0] * 5, make_past(4))
+    cache.store("c", [0] * 5, make_past(4))
+    assert cache.stats()["evictions"] == 1
+    assert cache.take("a", [0] * 6) == (0, None)
+
+    clock.now = 61
+    assert cache.stats()["sessions"] == 0
+    assert cache.stats()["expirations"] == 2
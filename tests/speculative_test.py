@@ -0,0 +1,49 @@
+import threading
+
+from server.speculative import AcceptanceTracker, ForwardCounter
+
+
+class FakeModule:
+    """Calls registered forward hooks the way ``nn.Module.__call__`` does."""
+
+    def __init__(self):
+        self.hooks = []
+
+    def register_forward_hook(self, hook):
+        self.hooks.append(hook)
+        module = self
+
+        class Handle:
+            def remove(self):
+                module.hooks.remove(hook)
+
+        return Handle()
+
+    def __call__(self):
+        for hook in list(self.hooks):
+            hook(self, (), None)
+
+
+def test_forward_counter_ignores_other_threads():
+    module = FakeModule()
+    with ForwardCounter(module) as counter:
+        module()
+        other = threading.Thread(target=module)
+        other.start()
+        other.join()
+        module()
+    module()
+    assert counter.count == 2
+    assert module.hooks == []
+
+
+def test_acceptance_is_generated_minus_verification_passes():
+    model, draft = FakeModule(), FakeModule()
+    with AcceptanceTracker(model, draft) as tracker:
+        # Two assisted steps: 4 drafted/3 accepted, then 4 drafted/1 accepted
+        for _ in range(8):
+            draft()
+        model()
+        model()
+    tracker.generated_tokens = (3 + 1) + (1 + 1)
+    assert tracker.stats() == {"draft_tokens": 8, "accepted_draft_tokens": 4, "acceptance_rate": 0.5}
@@ -0,0 +1,46 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from server.stopping import RowStopCriteria, stop_index
+
+
+class CharTokenizer:
+    """Token id i decodes to chr(i)."""
+
+    def decode(self, ids, skip_special_tokens=True):
+        return "".join(chr(int(i)) for i in ids if int(i))
+
+
+def ids(*texts):
+    """Rows of character ids, left-padded with 0 (which decodes to nothing) as in a batch."""
+    width = max(len(text) for text in texts)
+    return torch.tensor([[0] * (width - len(text)) + [ord(c) for c in text] for text in texts])
+
+
+def test_stop_index_finds_the_earliest_stop():
+    assert stop_index("abc\n\nUser: hi", ["User:", "\n\n"]) == 3
+    assert stop_index("abc", ["x", ""]) is None
+    assert stop_index("abc", None) is None
+
+
+def test_rows_stop_independently_on_their_own_strings():
+    # Prompts "p>" and ">", left-padded to a width of 2
+    criteria = RowStopCriteria(CharTokenizer(), 2, [["END"], None], [None, None])
+    done = criteria(ids("p>abE", ">xyz"), None)
+    assert done.tolist() == [False, False]
+    done = criteria(ids("p>abEND", ">xyzEN"), None)
+    assert done.tolist() == [True, False]
+    assert criteria.reasons == ["stop", None]
+    assert criteria.stopped_at == [5, None]
+
+
+def test_stop_string_in_the_prompt_does_not_stop():
+    criteria = RowStopCriteria(CharTokenizer(), 3, [["END"]], [None])
+    assert criteria(ids("ENDa"), None).tolist() == [False]
+
+
+def test_deadline_ends_generation_with_time_reason():
+    criteria = RowStopCriteria(CharTokenizer(), 1, [None], [0.0])
+    assert criteria(ids("pa"), None).tolist() == [True]
+    assert criteria.reasons == ["time"]
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+
+from chromadb import Documents, EmbeddingFunction, Embeddings
+
+from retrieval.vector_store import PersistentVectorIndex
+
+
+class BagOfWords(EmbeddingFunction):
+    """Deterministic offline embeddings that count calls."""
+
+    def __init__(self):
+        self.embedded = []
+
+    def __call__(self, input: Documents) -> Embeddings:
+        self.embedded.extend(input)
+        vectors = []
+        for text in input:
+            vector = [0.0] * 32
+            for word in text.lower().split():
+                vector[sum(map(ord, word)) % 32] += 1.0
+            vectors.append(vector)
+        return vectors
+
+    @staticmethod
+    def name() -> str:
+        return "bag-of-words"
+
+
+def open_index(path, embedder):
+    return PersistentVectorIndex(str(path), embedding_model="bag-of-words", embedding_function=embedder)
+
+
+def test_only_new_or_changed_files_are_embedded(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "a.txt").write_text("stocks represent ownership in a company")
+    (docs / "b.txt").write_text("bonds are debt securities")
+    store = tmp_path / "store"
+
+    embedder = BagOfWords()
+    report = open_index(store, embedder).sync(str(docs))
+    assert report.added == ["a.txt", "b.txt"]
+
+    # Reopened with nothing changed: no embedding at all
+    embedder = BagOfWords()
+    index = open_index(store, embedder)
+    report = index.sync(str(docs))
+    assert report.unchanged == ["a.txt", "b.txt"] and not report.embedded
+    assert embedder.embedded == []
+
+    (docs / "b.txt").write_text("bonds pay fixed interest")
+    (docs / "c.md").write_text("index funds track a market")
+    os.remove(docs / "a.txt")
+    report = index.sync(str(docs))
+    assert (report.added, report.changed, report.removed) == (["c.md"], ["b.txt"], ["a.txt"])
+    # Embedded in filename order, whether added or changed
+    assert report.embedded == ["b.txt", "c.md"]
+    assert embedder.embedded == ["bonds pay fixed interest", "index funds track a market"]
+    assert len(index) == 2
+    assert {p["filename"] for _, p in index.search("stocks company", k=5)} == {"b.txt", "c.md"}
+
+
+def test_changed_settings_rebuild(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "a.txt").write_text("budgeting basics")
+    open_index(tmp_path / "store", BagOfWords()).sync(str(docs))
+
+    index = PersistentVectorIndex(
+        str(tmp_path / "store"), embedding_model="bag-of-words", embedding_function=BagOfWords(), target_tokens=100
+    )
+    assert index.sync(str(docs)).added == ["a.txt"]
+    assert index.collection.count() == 1
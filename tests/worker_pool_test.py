@@ -0,0 +1,56 @@
+import functools
+import os
+import sys
+import time
+
+import pytest
+
+pytest.importorskip("torch")
+
+from server.engine import InferenceEngine
+from server.generation import GenerationRequest
+from server.prefix_cache import PrefixCache
+from server.worker_pool import WorkerPool, process_memory
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="reads /proc")
+def test_process_memory_reports_rss_and_pss():
+    memory = process_memory(os.getpid())
+    assert memory["rss_bytes"] > 0
+    assert memory["pss_bytes"] is None or 0 < memory["pss_bytes"] <= memory["rss_bytes"]
+
+
+def test_process_memory_of_missing_process_is_unknown():
+    assert process_memory(2**22 + 12345) == {"rss_bytes": None, "pss_bytes": None}
+
+
+@pytest.fixture(scope="module")
+def engine(tiny_model_path):
+    return InferenceEngine.load(tiny_model_path, warmup_tokens=0, repetition_penalty=1.2)
+
+
+def test_pool_output_matches_in_process_generation(engine):
+    requests = [
+        GenerationRequest(prompt="w1 w2 w3", max_new_tokens=4, temperature=0.0),
+        GenerationRequest(prompt="w4", max_new_tokens=3, temperature=0.0, echo_prompt=False),
+    ]
+    expected = engine.generate(requests)
+    first_tokens = []
+    pool = WorkerPool(
+        engine.model, engine.tokenizer, 1, num_threads=1,
+        draft_model=engine.model, repetition_penalty=engine.repetition_penalty,
+        make_prefix_cache=functools.partial(PrefixCache, max_bytes=1024 * 1024, block_size=1),
+    )
+    try:
+        started = time.perf_counter()
+        results = pool.generate(requests, on_first_token=first_tokens.append)
+        again = pool.generate(requests)
+        # Lone requests use the draft model
+        assisted, = pool.generate(requests[:1])
+    finally:
+        pool.close()
+    assert [r.text for r in results] == [r.text for r in expected]
+    assert [r.text for r in again] == [r.text for r in expected]
+    assert [r.generated_tokens for r in results] == [r.generated_tokens for r in expected]
+    assert assisted.text == expected[0].text and assisted.draft_tokens > 0
+    assert len(first_tokens) == 1 and started <= first_tokens[0] <= time.perf_counter()
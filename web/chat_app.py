@@ -2,15 +2,25 @@
 import streamlit as st
 import openai
 import os
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from retrieval.chunking import pack_passages
+from retrieval.vector_store import PersistentVectorIndex
 
 # Set your OpenAI API key
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-# Build or load the FAISS index
+@st.cache_resource
+def get_index():
+    """The persisted vector index, opened once per app process"""
+    return PersistentVectorIndex(os.getenv("VECTOR_INDEX_DIR", ".vector_index"), collection_name="financial_docs")
+
+# Load the persisted index; only new or changed documents are embedded
 if "index" not in st.session_state:
-    documents = SimpleDirectoryReader('docs').load_data()
-    st.session_state.index = VectorStoreIndex.from_documents(documents)
+    st.session_state.index = get_index()
+    st.session_state.index.sync('docs')
 
 st.title("Financial Advisor Chatbot with RAG")
 
@@ -25,10 +35,9 @@ for message in st.session_state.messages:
 
 # Accept user input
 if prompt := st.chat_input("Ask your financial question here..."):
-    # RAG: Retrieve context using FAISS
-    query_engine = st.session_state.index.as_query_engine()
-    rag_response = query_engine.query(prompt)
-    context = str(rag_response)
+    # RAG: Retrieve the best matching passages
+    passages = pack_passages(st.session_state.index.search(prompt, k=10), budget_tokens=800)
+    context = "\n\n".join(p["content"] for p in passages)
 
     # Add system prompt and context
     if not any(msg["role"] == "system" for msg in st.session_state.messages):
@@ -1,8 +1,6 @@
 # To run this app, use the command: streamlit run web/chat_app_qwen.py
 import streamlit as st
-import requests
 import os
-import json
 import sys
 
 # Add the project root to the path so we can import from config
@@ -17,6 +15,16 @@ except ImportError as e:
     st.warning(f"LlamaIndex components not fully available: {e}")
     LLAMAINDEX_AVAILABLE = False
 
+from client.llm_client import LLMClientError
+from web.chat_support import (
+    get_prober,
+    get_router,
+    load_documents_simple,
+    show_backend_status,
+    simple_context_search,
+    warm_up_once,
+)
+
 # Import modal config
 try:
     from modal_config import MODAL_CONFIG, is_mock_enabled, get_mock_response
@@ -45,26 +53,10 @@ def call_modal_llm(prompt, max_tokens=512, temperature=0.7):
         }
     
     try:
-        response = requests.post(
-            f"{MODAL_CONFIG['app_url']}/generate",
-            json={
-                "prompt": prompt,
-                "max_tokens": max_tokens,
-                "temperature": temperature
-            },
-            timeout=MODAL_CONFIG.get('timeout', 30)
-        )
-        response.raise_for_status()
-        result = response.json()
-        if "response" in result:
-            return result["response"]
-        elif "error" in result:
-            return f"Error from LLM: {result['error']}"
-        else:
-            return "Unexpected response format from LLM"
-    except requests.exceptions.RequestException as e:
+        return get_router().generate(prompt, max_tokens=max_tokens, temperature=temperature)
+    except LLMClientError as e:
         # If Modal request fails, provide helpful error message
-        if "405" in str(e) or "Method Not Allowed" in str(e):
+        if e.status == 405:
             return f"""❌ **Modal Deployment Error**: The URL `{MODAL_CONFIG['app_url']}` is not valid.
 
 **To fix this:**
@@ -76,56 +68,9 @@ def call_modal_llm(prompt, max_tokens=512, temperature=0.7):
 **For now, you can enable mock mode in `modal_config.py` to test the interface.**"""
         else:
             return f"Connection error: {str(e)}"
-    except json.JSONDecodeError as e:
-        return f"JSON decode error: {str(e)}"
     except Exception as e:
         return f"Unexpected error: {str(e)}"
 
-def load_documents_simple(directory_path):
-    """Simple document loading without LlamaIndex"""
-    if not os.path.exists(directory_path):
-        return None
-    
-    documents = []
-    try:
-        for filename in os.listdir(directory_path):
-            if filename.endswith(('.txt', '.md')):
-                filepath = os.path.join(directory_path, filename)
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    documents.append({
-                        'filename': filename,
-                        'content': content
-                    })
-        return documents
-    except Exception as e:
-        st.error(f"Error loading documents: {e}")
-        return None
-
-def simple_context_search(documents, query):
-    """Simple keyword-based context search"""
-    if not documents:
-        return ""
-    
-    query_words = query.lower().split()
-    relevant_docs = []
-    
-    for doc in documents:
-        content_lower = doc['content'].lower()
-        score = sum(1 for word in query_words if word in content_lower)
-        if score > 0:
-            relevant_docs.append((doc, score))
-    
-    # Sort by relevance score
-    relevant_docs.sort(key=lambda x: x[1], reverse=True)
-    
-    # Take top 2 most relevant documents
-    context_parts = []
-    for doc, score in relevant_docs[:2]:
-        context_parts.append(f"From {doc['filename']}:\n{doc['content'][:500]}...")
-    
-    return "\n\n".join(context_parts)
-
 # Initialize session state
 if "index" not in st.session_state:
     st.session_state.index = None
@@ -133,6 +78,7 @@ if "simple_documents" not in st.session_state:
     st.session_state.simple_documents = None
 if "messages" not in st.session_state:
     st.session_state.messages = []
+warm_up_once()
 
 st.title("Financial Advisor Chatbot with Qwen LLM (Modal)")
 
@@ -163,23 +109,25 @@ with st.sidebar:
                     st.warning(f"Vector indexing failed: {e}. Using simple search.")
                     st.session_state.simple_documents = load_documents_simple(doc_directory)
                     if st.session_state.simple_documents:
-                        st.success(f"Loaded {len(st.session_state.simple_documents)} documents with simple search!")
+                        st.success(f"Loaded {len(st.session_state.simple_documents.manifest)} documents ({len(st.session_state.simple_documents)} passages) with simple search!")
             else:
                 st.session_state.simple_documents = load_documents_simple(doc_directory)
                 if st.session_state.simple_documents:
-                    st.success(f"Loaded {len(st.session_state.simple_documents)} documents with simple search!")
+                    st.success(f"Loaded {len(st.session_state.simple_documents.manifest)} documents ({len(st.session_state.simple_documents)} passages) with simple search!")
                 else:
                     st.error("Failed to load documents")
     
     # Test connection button
     if st.button("Test Connection"):
         with st.spinner("Testing connection to Modal LLM..."):
-            test_response = call_modal_llm("Hello, this is a test.", max_tokens=10)
-            if "Error" in test_response or "error" in test_response.lower():
-                st.error(f"Connection failed: {test_response}")
-            else:
+            statuses = [b["status"] for b in get_prober().probe_all()]
+            if "ready" in statuses:
                 st.success("Connection successful!")
-                st.write(f"Response: {test_response[:100]}...")
+            elif "loading" in statuses:
+                st.warning("Modal LLM is starting up")
+            else:
+                st.error("Connection failed")
+    show_backend_status()
 
 # Display chat messages from history
 for message in st.session_state.messages:
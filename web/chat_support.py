@@ -0,0 +1,97 @@
+"""
+Backend routing, health display and keyword context shared by the Streamlit chat apps
+"""
+import os
+import uuid
+
+import streamlit as st
+
+from client.llm_client import ClientConfig, LLMClient
+from client.prober import HealthProber
+from client.router import EndpointRouter
+from config.endpoints import load_endpoints
+from retrieval.bm25 import BM25Index, index_directory
+from retrieval.chunking import chunk_documents, pack_passages
+
+try:
+    from modal_config import MODAL_CONFIG
+except ImportError:
+    # Fallback config if modal_config.py doesn't exist
+    MODAL_CONFIG = {
+        "app_url": "https://your-modal-app-url.modal.run",
+        "timeout": 30,
+        "max_retries": 3,
+        "endpoints": load_endpoints()
+    }
+
+# Prompt tokens to spend on retrieved passages
+CONTEXT_TOKEN_BUDGET = 400
+
+STATUS_ICONS = {"ready": "🟢", "loading": "🟡", "failed": "🔴", "down": "🔴", "unknown": "⚪"}
+
+@st.cache_resource
+def get_router():
+    """One router per app process, shared by every session and rerun"""
+    # Retries happen in the router, on another backend where there is one
+    client = LLMClient(ClientConfig.from_dict({**MODAL_CONFIG, "max_retries": 0}))
+    return EndpointRouter(MODAL_CONFIG["endpoints"], client, max_attempts=MODAL_CONFIG["max_retries"] + 1)
+
+@st.cache_resource
+def get_prober():
+    """Health checks of every backend, polled once per app process while any session is in use"""
+    prober = HealthProber(
+        MODAL_CONFIG["endpoints"],
+        get_router().client,
+        interval=MODAL_CONFIG.get("health_interval", 60),
+        timeout=MODAL_CONFIG.get("health_timeout", 300),
+        idle_after=MODAL_CONFIG.get("health_idle_after", 300),
+    )
+    prober.start()
+    return prober
+
+def warm_up_once():
+    """Start the model's cold start when a session opens rather than on its first question"""
+    prober = get_prober()
+    # Every rerun marks the session as in use; polling stops once all sessions go quiet
+    prober.touch(st.session_state.setdefault("session_id", uuid.uuid4().hex))
+    if "warmed_up" not in st.session_state:
+        prober.warm()
+        st.session_state.warmed_up = True
+
+def show_backend_status():
+    """One line per backend: health, probe latency and any error"""
+    for backend in get_prober().status():
+        line = f"{STATUS_ICONS[backend['status']]} **{backend['name']}**: {backend['status']}"
+        if backend["checking"]:
+            line += " (checking…)"
+        elif backend["latency_ms"] is not None:
+            line += f" ({backend['latency_ms']:.0f} ms)"
+        st.write(line)
+        if backend["error"]:
+            st.caption(backend["error"])
+
+def format_passages(passages):
+    """Retrieved passages as prompt context, each under its source file"""
+    return "\n\n".join(f"From {p['filename']}:\n{p['content']}" for p in passages)
+
+def load_documents_simple(directory_path):
+    """Load documents without a vector store into a BM25 keyword index"""
+    if not os.path.exists(directory_path):
+        return None
+
+    try:
+        # Set KEYWORD_INDEX_PATH to reuse the index across restarts
+        return index_directory(directory_path, index_path=os.getenv("KEYWORD_INDEX_PATH"))
+    except Exception as e:
+        st.error(f"Error loading documents: {e}")
+        return None
+
+def simple_context_search(documents, query, budget_tokens=CONTEXT_TOKEN_BUDGET):
+    """Keyword context search: the best BM25-ranked passages that fit in budget_tokens"""
+    if not documents:
+        return ""
+
+    if not isinstance(documents, BM25Index):
+        documents = BM25Index.from_documents(chunk_documents(documents))
+
+    return format_passages(pack_passages(documents.search(query, k=20), budget_tokens))